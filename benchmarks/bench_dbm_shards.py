@@ -0,0 +1,122 @@
+"""Benchmark the legacy one-dbm-file-per-user layout against the shard and log stores.
+
+Both layouts store ``--users`` records shaped like a SusDB box and then read
+``--reads`` random ones back. The legacy layout is reproduced as dbm_engine
+used to do it: an empty placeholder file plus a dbm file per user, opened and
+closed on every operation. ``sharded`` is dbm_engine's ShardStore and ``log``
+the append-only LogStore used by log_engine. Reported per layout: store ops/s, read ops/s,
+number of files and bytes on disk.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_dbm_shards.py --users 1000000
+
+At 1M users the legacy layout needs millions of inodes and takes a long
+time; start with ``--users 100000`` to get a feel for the numbers.
+"""
+import argparse
+import datetime
+import dbm
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault('LOG_PATH', os.path.join(tempfile.gettempdir(), 'susdb-bench.log'))
+
+from dbm_engine import ShardStore  # noqa: E402
+from log_store import LogStore  # noqa: E402
+
+
+def make_record(uid: str) -> Dict[str, str]:
+    """A box with realistic field sizes"""
+    return {
+        '_id': uid,
+        'hash_string': '$argon2id$v=19$m=65536,t=3,p=4$' + 'a' * 22 + '$' + 'b' * 43,
+        'secured_user_string': 'c' * 22,
+        'created_on': datetime.datetime.now().isoformat(),
+    }
+
+
+def legacy_store(root: str, uid: str) -> None:
+    """Old initialize_db + store_user_string"""
+    path = os.path.join(root, f"user_db_{uid}")
+    with open(path, 'w', encoding='utf-8'):
+        pass
+    with dbm.open(path, 'n') as store:
+        for key, value in make_record(uid).items():
+            store[key] = value
+
+
+def legacy_read(root: str, uid: str) -> None:
+    """Old display_user_db"""
+    path = os.path.join(root, f"user_db_{uid}")
+    if os.path.exists(path):
+        with dbm.open(path, 'r') as store:
+            {key: store[key] for key in store.keys()}
+
+
+def disk_usage(root: str) -> Tuple[int, int]:
+    """Files and allocated bytes below root"""
+    files = 0
+    used = 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            stat = os.stat(os.path.join(dirpath, name))
+            files += 1
+            used += stat.st_blocks * 512
+    return files, used
+
+
+def timed(op: Callable[[str], None], uids: List[str]) -> float:
+    """Run op over uids and return ops/s"""
+    start = time.perf_counter()
+    for uid in uids:
+        op(uid)
+    return len(uids) / (time.perf_counter() - start)
+
+
+def run_layout(name: str, users: int, reads: int, shards: int, workdir: str) -> Dict[str, float]:
+    """Store and read back with one layout"""
+    root = tempfile.mkdtemp(prefix=f"susdb-{name}-", dir=workdir)
+    uids = [str(uuid.uuid4()) for _ in range(users)]
+    sample = random.choices(uids, k=reads)
+    try:
+        if name == 'legacy':
+            store_rate = timed(lambda uid: legacy_store(root, uid), uids)
+            read_rate = timed(lambda uid: legacy_read(root, uid), sample)
+        else:
+            if name == 'log':
+                store = LogStore(root, compact_interval=0)
+            else:
+                store = ShardStore(root, shards, sync_writes=False)
+            store_rate = timed(lambda uid: store.put(uid, make_record(uid)), uids)
+            read_rate = timed(store.get, sample)
+            store.close()
+        files, used = disk_usage(root)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {'store_ops': store_rate, 'read_ops': read_rate, 'files': files, 'bytes': used}
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--reads', type=int, default=10_000)
+    parser.add_argument('--shards', type=int, default=256)
+    parser.add_argument('--layouts', default='legacy,sharded,log')
+    parser.add_argument('--workdir', default=None, help='Directory for the temporary stores')
+    args = parser.parse_args(argv)
+
+    print(f"{args.users} users, {args.reads} reads, {args.shards} shards")
+    for name in args.layouts.split(','):
+        result = run_layout(name, args.users, args.reads, args.shards, args.workdir)
+        print(f"{name:>8}: store {result['store_ops']:10.0f} ops/s  read {result['read_ops']:10.0f} ops/s  "
+              f"{result['files']:>9} files  {result['bytes'] / 2**20:10.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
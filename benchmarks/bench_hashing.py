@@ -0,0 +1,59 @@
+"""Benchmark Argon2 throughput of the hashing executor as workers scale.
+
+For every worker count from 1 up to the number of cores, a pool is started
+and ``--hashes`` hashes are submitted from request-like threads. Throughput
+should grow roughly linearly with the worker count until the cores are used
+up; the ``inline`` row is the old behaviour of hashing on the calling thread.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_hashing.py --hashes 200
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from hashing import HashingExecutor, default_worker_count
+
+
+def run(executor: HashingExecutor, hashes: int, threads: int) -> float:
+    """Hash ``hashes`` strings from ``threads`` caller threads, return hashes/s"""
+    executor.hash('warm-up')
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as callers:
+        list(callers.map(executor.hash, (f"user-string-{i}" for i in range(hashes))))
+    return hashes / (time.perf_counter() - start)
+
+
+def worker_counts(cores: int) -> List[int]:
+    """1, 2, 4, ... up to and including the core count"""
+    counts = []
+    n = 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    counts.append(cores)
+    return counts
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hashes', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=None, help='Caller threads, defaults to 4x workers')
+    args = parser.parse_args(argv)
+
+    cores = default_worker_count()
+    baseline = run(HashingExecutor(mode='inline'), args.hashes, args.threads or 4)
+    print(f"{'inline':>8}: {baseline:8.1f} hashes/s")
+    for workers in worker_counts(cores):
+        executor = HashingExecutor(workers=workers, mode='process')
+        try:
+            rate = run(executor, args.hashes, args.threads or workers * 4)
+        finally:
+            executor.shutdown()
+        print(f"{workers:>3} proc: {rate:8.1f} hashes/s ({rate / baseline:.2f}x inline)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Benchmark the stored record formats: legacy JSON against binary version 1.
+
+Reports bytes per record and encode/decode time per record.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_record_format.py --records 100000
+"""
+import argparse
+import datetime
+import json
+import time
+import uuid
+from typing import Optional
+
+from argon2 import PasswordHasher
+
+from record_format import decode_record, encode_record
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    hash_string = PasswordHasher().hash(json.dumps('benchmark'))
+    records = [{
+        '_id': str(uuid.uuid4()),
+        'hash_string': hash_string,
+        'secured_user_string': 'Ba7tqBHq8y7Ne3LuAuTzH2',
+        'created_on': datetime.datetime.now().isoformat(),
+    } for _ in range(args.records)]
+
+    for fmt in ('json', 'binary'):
+        start = time.perf_counter()
+        encoded = [encode_record(record, fmt) for record in records]
+        encode_us = (time.perf_counter() - start) / len(records) * 1e6
+        start = time.perf_counter()
+        for data in encoded:
+            decode_record(data)
+        decode_us = (time.perf_counter() - start) / len(records) * 1e6
+        size = sum(len(data) for data in encoded) / len(encoded)
+        print(f"{fmt:>6}: {size:6.1f} bytes  encode {encode_us:6.2f} us  decode {decode_us:6.2f} us")
+
+
+if __name__ == '__main__':
+    main()
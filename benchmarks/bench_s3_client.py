@@ -0,0 +1,88 @@
+"""Benchmark requests/s with a fresh S3 client per request vs the shared pool.
+
+Each "request" builds a UserDBManager for an existing uid and reads the box,
+the way main.py does for /view. The "fresh" mode reproduces the cost of the
+old ``boto3.client('s3')`` per construction, building each client from its
+own ``boto3.session.Session()`` since the default session is not thread
+safe; "shared" uses s3_client.get_s3_client.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_s3_client.py --requests 2000 --threads 16
+
+Pass ``--endpoint-url`` to point at a real S3-compatible service, otherwise an
+in-memory stand-in (benchmarks/s3_server.py) is started on localhost.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(mode: str, requests: int, threads: int, uid: str) -> float:
+    """Run one mode and return requests per second"""
+    import boto3
+    import s3_client
+    import user_db_manager
+
+    if mode == 'fresh':
+        def client_factory() -> object:
+            session = boto3.session.Session()
+            return session.client('s3', endpoint_url=s3_client.s3_endpoint_url,
+                                  region_name=os.getenv('AWS_REGION'))
+    else:
+        s3_client.reset_s3_clients()
+        client_factory = s3_client.get_s3_client
+
+    original = user_db_manager.get_s3_client
+    user_db_manager.get_s3_client = client_factory
+    try:
+        def one_request(_: int) -> None:
+            manager = user_db_manager.UserDBManager(uid=uid, accept_init=False)
+            manager.display_user_db(uid)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one_request, range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        user_db_manager.get_s3_client = original
+    return requests / elapsed
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--endpoint-url', default=None)
+    parser.add_argument('--bucket', default='susdb-bench')
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.endpoint_url is None:
+        from s3_server import S3StandInServer
+        server = S3StandInServer().start()
+        args.endpoint_url = server.endpoint_url
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    os.environ['S3_ENDPOINT_URL'] = args.endpoint_url
+    os.environ['S3_BUCKET_NAME'] = args.bucket
+
+    import user_db_manager
+    uid = user_db_manager.UserDBManager().pk
+
+    for mode in ('fresh', 'shared'):
+        rps = run(mode, args.requests, args.threads, uid)
+        print(f"{mode:>6}: {rps:10.1f} requests/s ({args.requests} requests, {args.threads} threads)")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark ``/verify`` throughput of the gunicorn server as workers scale.
+
+For every worker count from 1 up to the number of cores, ``main:app`` is
+started under gunicorn with ``src/gunicorn.conf.py`` and driven with
+verify-only load over HTTP for ``--duration`` seconds. Every run talks to
+the same in-memory S3 stand-in started in this process, or
+``--endpoint-url``. Verify is Argon2-bound; the last column is the speed-up
+over one worker divided by the worker count, which shows how much of each
+added core the server puts to use.
+
+The load generator runs on the same host and takes some CPU from the
+server; use ``--cores`` to leave it a core on small machines.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_web_workers.py --duration 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from bench_hashing import worker_counts
+from hashing import default_worker_count
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def start_server(env: Dict[str, str], port: int, workers: int, threads: int) -> subprocess.Popen:
+    """Start gunicorn with ``workers`` workers and wait until it answers"""
+    env = dict(env, WEB_BIND=f'127.0.0.1:{port}', WEB_WORKERS=str(workers), WEB_THREADS=str(threads))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'main:app'], cwd=SRC, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/metrics', timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start within 60s")
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.terminate()
+    server.wait(timeout=60)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', type=int, default=None, help='Largest worker count, defaults to the cores')
+    parser.add_argument('--threads', type=int, default=4, help='WEB_THREADS of every worker')
+    parser.add_argument('--concurrency', type=int, default=None, help='Client threads, defaults to 2x server threads')
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--hash-profile', default=None, help='Argon2 profile, defaults to HASH_PROFILE')
+    parser.add_argument('--endpoint-url', default=None, help='S3 endpoint, defaults to the in-process stand-in')
+    parser.add_argument('--bucket', default='susdb-bench')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='susdb-web-')
+    env = dict(os.environ, GET_PATH=workdir, S3_BUCKET_NAME=args.bucket)
+    env.setdefault('LOG_PATH', os.path.join(workdir, 'susdb.log'))
+    env.setdefault('AWS_REGION', 'us-east-1')
+    # Measure capacity: with admission control the extra clients would be shed
+    env.setdefault('ADMISSION_CONTROL', 'false')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SRC, env.get('PYTHONPATH')]))
+    if args.hash_profile:
+        env['HASH_PROFILE'] = args.hash_profile
+    stand_in = None
+    if args.endpoint_url is None:
+        from s3_server import S3StandInServer
+        stand_in = S3StandInServer().start()
+        args.endpoint_url = stand_in.endpoint_url
+        env.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+        env.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    env['S3_ENDPOINT_URL'] = args.endpoint_url
+
+    import loadgen
+    target = loadgen.HttpTarget(f'http://127.0.0.1:{args.port}')
+    accounts: List[loadgen.Account] = []
+    baseline = None
+    print(f"{'workers':>7} {'threads':>7} {'clients':>7} {'verify/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'speed-up':>8} {'per worker':>10}")
+    try:
+        for workers in worker_counts(args.cores or default_worker_count()):
+            server = start_server(env, args.port, workers, args.threads)
+            try:
+                if not accounts:
+                    accounts = loadgen.create_accounts(target, args.accounts, 8)
+                concurrency = args.concurrency or workers * args.threads * 2
+                report = loadgen.run(target, {'verify': 1.0}, accounts, concurrency=concurrency,
+                                     duration=args.duration, warmup=args.warmup)
+            finally:
+                stop_server(server)
+            row = report.summary()[0]
+            baseline = baseline or row['ops_per_s']
+            speedup = row['ops_per_s'] / baseline if baseline else 0.0
+            print(f"{workers:>7} {args.threads:>7} {concurrency:>7} {row['ops_per_s']:>9.1f} {row['p50_ms']:>8.1f} "
+                  f"{row['p99_ms']:>8.1f} {row['errors']:>6} {speedup:>7.2f}x {speedup / workers:>10.2f}")
+    finally:
+        if stand_in is not None:
+            stand_in.shutdown()
+
+
+if __name__ == '__main__':
+    main()
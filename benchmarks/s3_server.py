@@ -0,0 +1,149 @@
+"""Minimal S3-compatible HTTP server used by the benchmarks.
+
+Supports path-style GET, PUT, HEAD and DELETE on ``/<bucket>/<key>`` with
+ETags, ``If-None-Match`` on reads (304) and ``If-None-Match: *`` on writes
+(412), plus paginated ListObjectsV2 on ``/<bucket>?list-type=2``. Objects
+live in memory, so it is only meant for local measurements.
+
+Run standalone with::
+
+    python benchmarks/s3_server.py --port 9000
+"""
+import argparse
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    """Request handler backed by the server's in-memory object map"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+    def _key(self) -> str:
+        return unquote(urlsplit(self.path).path.lstrip('/'))
+
+    def _reply(self, status: int, body: bytes = b'', headers: Dict[str, str] = {}) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _not_found(self) -> None:
+        body = (b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>NoSuchKey</Code>'
+                b'<Message>The specified key does not exist.</Message></Error>')
+        self._reply(404, body, {'Content-Type': 'application/xml'})
+
+    def _list_objects(self, bucket: str, query: Dict[str, list]) -> None:
+        prefix = query.get('prefix', [''])[0]
+        max_keys = int(query.get('max-keys', ['1000'])[0])
+        after = query.get('continuation-token', query.get('start-after', ['']))[0]
+        url_encoded = query.get('encoding-type', [''])[0] == 'url'
+        with self.server.lock:  # type: ignore[attr-defined]
+            keys = sorted(
+                key for key in self.server.objects  # type: ignore[attr-defined]
+                if key.startswith(f"{bucket}/{prefix}") and key > f"{bucket}/{after}"
+            )
+            page = [(key, self.server.objects[key]) for key in keys[:max_keys]]  # type: ignore[attr-defined]
+        truncated = len(keys) > max_keys
+        parts = [f'<?xml version="1.0" encoding="UTF-8"?>'
+                 f'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                 f'<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>'
+                 f'<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>'
+                 f'<IsTruncated>{"true" if truncated else "false"}</IsTruncated>']
+        if url_encoded:
+            parts.append('<EncodingType>url</EncodingType>')
+        if truncated:
+            parts.append(f'<NextContinuationToken>{escape(page[-1][0][len(bucket) + 1:])}</NextContinuationToken>')
+        for key, (body, etag) in page:
+            name = key[len(bucket) + 1:]
+            name = quote(name) if url_encoded else name
+            parts.append(f'<Contents><Key>{escape(name)}</Key><Size>{len(body)}</Size>'
+                         f'<ETag>{escape(etag)}</ETag></Contents>')
+        parts.append('</ListBucketResult>')
+        self._reply(200, ''.join(parts).encode(), {'Content-Type': 'application/xml'})
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if query.get('list-type') == ['2']:
+            self._list_objects(unquote(url.path.strip('/')), query)
+            return
+        obj = self.server.objects.get(self._key())  # type: ignore[attr-defined]
+        if obj is None:
+            self._not_found()
+            return
+        body, etag = obj
+        if self.headers.get('If-None-Match') == etag:
+            self._reply(304, headers={'ETag': etag})
+            return
+        self._reply(200, body, {'ETag': etag, 'Content-Type': 'application/octet-stream'})
+
+    def do_HEAD(self) -> None:
+        obj = self.server.objects.get(self._key())  # type: ignore[attr-defined]
+        if obj is None:
+            self._reply(404)
+            return
+        self.send_response(200)
+        self.send_header('ETag', obj[1])
+        self.send_header('Content-Length', str(len(obj[0])))
+        self.end_headers()
+
+    def do_PUT(self) -> None:
+        length = int(self.headers.get('Content-Length', '0'))
+        body = self.rfile.read(length)
+        key = self._key()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        with self.server.lock:  # type: ignore[attr-defined]
+            if self.headers.get('If-None-Match') == '*' and key in self.server.objects:  # type: ignore[attr-defined]
+                body = (b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>PreconditionFailed</Code>'
+                        b'<Message>At least one of the pre-conditions you specified did not hold</Message></Error>')
+                self._reply(412, body, {'Content-Type': 'application/xml'})
+                return
+            self.server.objects[key] = (body, etag)  # type: ignore[attr-defined]
+        self._reply(200, headers={'ETag': etag})
+
+    def do_DELETE(self) -> None:
+        self.server.objects.pop(self._key(), None)  # type: ignore[attr-defined]
+        self._reply(204)
+
+
+class S3StandInServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding objects in a dict"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int] = ('127.0.0.1', 0)) -> None:
+        super().__init__(address, _S3Handler)
+        self.objects: Dict[str, Tuple[bytes, str]] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint_url(self) -> str:
+        """Endpoint to hand to boto3"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'S3StandInServer':
+        """Serve from a daemon thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='In-memory S3 stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    args = parser.parse_args()
+    server = S3StandInServer((args.host, args.port))
+    print(f"S3 stand-in listening on {server.endpoint_url}")
+    server.serve_forever()
@@ -0,0 +1,247 @@
+"""Benchmark suite for every SusDB operation on every backend.
+
+Runs store, verify, view, retrieve, recover and close against:
+
+* ``dbm``: dbm_engine.UserDBManager (hash-partitioned shards)
+* ``log``: log_engine.UserDBManager (append-only log store)
+* ``s3``:  user_db_manager.UserDBManager against the in-memory S3 stand-in
+  (benchmarks/s3_server.py) running in this process, or ``--endpoint-url``
+
+Each operation runs ``--ops`` times at every ``--threads`` level. For every
+scenario it reports ops/s, p50/p95/p99 latency and the peak RSS of this
+process; hashing workers are separate processes and not included. Results
+can be written as JSON with ``--output`` and compared with an earlier run
+with ``--compare``.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/suite.py --output results.json
+    PYTHONPATH=src python benchmarks/suite.py --compare results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ('dbm', 'log', 's3')
+OPERATIONS = ('store', 'verify', 'view', 'retrieve', 'recover', 'close')
+
+Account = Tuple[str, str, str]
+
+
+def create_accounts(manager: Callable[..., Any], count: int, threads: int) -> List[Account]:
+    """Store boxes to run the other operations against, untimed"""
+    def create(i: int) -> Account:
+        user_string = f"bench-{uuid.uuid4()}"
+        uid = manager().store_user_string({'request_string': user_string})['id']
+        sus = manager(uid).display_user_db(uid)['secured_user_string']
+        return uid, user_string, sus
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(create, range(count)))
+
+
+def operation(name: str, manager: Callable[..., Any], accounts: List[Account]) -> Callable[[int], bool]:
+    """Build the timed call for one operation; it returns whether the result was the expected one"""
+    def pick(i: int) -> Account:
+        return accounts[i % len(accounts)]
+
+    def store(i: int) -> bool:
+        return manager().store_user_string({'request_string': f"bench-{i}"}) is not None
+
+    def verify(i: int) -> bool:
+        uid, user_string, _ = pick(i)
+        return manager(uid).verify_user({'uid': uid, 'request_string': user_string}) == 'Successful'
+
+    def view(i: int) -> bool:
+        uid = pick(i)[0]
+        return isinstance(manager(uid).display_user_db(uid), dict)
+
+    def retrieve(i: int) -> bool:
+        uid = pick(i)[0]
+        return manager(uid).deserialize_data(uid, 'created_on') not in (
+            None, 'Associated key not found', 'System Error while fetching')
+
+    def recover(i: int) -> bool:
+        # The same string is used again, so verify keeps working on later runs
+        uid, user_string, _ = pick(i)
+        return manager(uid).recover_account({'_id': uid, 'user_string': user_string}) is not None
+
+    def close(i: int) -> bool:
+        uid, _, sus = accounts[i]
+        return manager(uid).close_account({'uid': uid, 'sus': sus}) == 'Success'
+
+    return locals()[name]
+
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS counter for this process (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kib() -> int:
+    """Peak resident set size of this process in KiB"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_scenario(call: Callable[[int], bool], ops: int, threads: int) -> Dict[str, Any]:
+    """Run ops calls on threads workers and summarise them"""
+    from hashing import percentile
+
+    def timed(i: int) -> Tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            ok = call(i)
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    reset_peak_rss()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = list(pool.map(timed, range(ops)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    return {
+        'ops': ops,
+        'errors': sum(1 for _, ok in samples if not ok),
+        'ops_per_s': round(ops / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'peak_rss_kib': peak_rss_kib(),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    """Print ops/s and p99 changes against an earlier JSON report"""
+    with open(baseline_path) as baseline_file:
+        baseline = {
+            (row['backend'], row['operation'], row['threads']): row
+            for row in json.load(baseline_file)['results']
+        }
+    print(f"\nChange against {baseline_path}:")
+    for row in results:
+        old = baseline.get((row['backend'], row['operation'], row['threads']))
+        if old is None:
+            continue
+        ops_change = (row['ops_per_s'] / old['ops_per_s'] - 1) * 100 if old['ops_per_s'] else 0.0
+        p99_change = (row['p99_ms'] / old['p99_ms'] - 1) * 100 if old['p99_ms'] else 0.0
+        print(f"{row['backend']:>4} {row['operation']:>8} x{row['threads']:<3} "
+              f"ops/s {ops_change:+7.1f}%  p99 {p99_change:+7.1f}%")
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--operations', default=','.join(OPERATIONS))
+    parser.add_argument('--threads', default='1,8', help='Comma separated concurrency levels')
+    parser.add_argument('--ops', type=int, default=200, help='Calls per operation and concurrency level')
+    parser.add_argument('--accounts', type=int, default=100, help='Boxes shared by verify/view/retrieve/recover')
+    parser.add_argument('--hash-profile', default=None, help='Argon2 profile, defaults to HASH_PROFILE')
+    parser.add_argument('--endpoint-url', default=None, help='S3 endpoint, defaults to the in-process stand-in')
+    parser.add_argument('--bucket', default='susdb-bench')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+    parser.add_argument('--compare', default=None, help='JSON report of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='susdb-suite-')
+    os.environ['GET_PATH'] = workdir
+    os.environ.setdefault('LOG_PATH', os.path.join(workdir, 'susdb.log'))
+    if args.hash_profile:
+        os.environ['HASH_PROFILE'] = args.hash_profile
+
+    server = None
+    if 's3' in args.backends.split(','):
+        if args.endpoint_url is None:
+            from s3_server import S3StandInServer
+            server = S3StandInServer().start()
+            args.endpoint_url = server.endpoint_url
+            os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+            os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+        os.environ.setdefault('AWS_REGION', 'us-east-1')
+        os.environ['S3_ENDPOINT_URL'] = args.endpoint_url
+        os.environ['S3_BUCKET_NAME'] = args.bucket
+
+    import settings
+    thread_levels = [int(level) for level in args.threads.split(',')]
+    results = []
+    print(f"{'backend':>7} {'operation':>9} {'threads':>7} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>6} {'peak RSS MiB':>12}")
+    from loadgen import manager_factory
+    for backend in args.backends.split(','):
+        manager = manager_factory(backend)
+        accounts = create_accounts(manager, args.accounts, max(thread_levels))
+        for name in args.operations.split(','):
+            for threads in thread_levels:
+                targets = create_accounts(manager, args.ops, max(thread_levels)) if name == 'close' else accounts
+                row = {'backend': backend, 'operation': name, 'threads': threads}
+                row.update(run_scenario(operation(name, manager, targets), args.ops, threads))
+                results.append(row)
+                print(f"{backend:>7} {name:>9} {threads:>7} {row['ops_per_s']:>10.1f} {row['p50_ms']:>9.2f} "
+                      f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['errors']:>6} "
+                      f"{row['peak_rss_kib'] / 1024:>12.1f}")
+
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'hash_profile': settings.hash_profile,
+            'hash_executor': settings.hash_executor_mode,
+            'record_format': settings.record_format,
+            'record_cache_ttl': settings.record_cache_ttl,
+            's3_endpoint': 'in-process stand-in' if server is not None else args.endpoint_url,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
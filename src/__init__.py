@@ -1,14 +1,21 @@
 import os
+from typing import Any
 
 from dotenv import load_dotenv
-from redis_om import get_redis_connection
 
 load_dotenv()
 # REDIS CLOUD CONN
 
-redis = get_redis_connection(
-    host=os.getenv('HOST'),
-    port=os.getenv('PORT'),
-    password=os.getenv('PASSWORD'),
-    decode_responses=True,
-)
\ No newline at end of file
+
+def __getattr__(name: str) -> Any:
+    """Create the Redis connection on first use of ``redis``"""
+    if name == 'redis':
+        from redis_om import get_redis_connection
+        globals()['redis'] = get_redis_connection(
+            host=os.getenv('HOST'),
+            port=os.getenv('PORT'),
+            password=os.getenv('PASSWORD'),
+            decode_responses=True,
+        )
+        return globals()['redis']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,280 @@
+"""Module for admission control in front of the Argon2-heavy routes.
+
+Each limited route lets ``limit`` requests run at once and up to
+``queue_size`` more wait for a slot. A request finding the queue full is
+rejected at once with 429; one that waits ``queue_timeout`` seconds without
+a slot is rejected with 503. Both carry a Retry-After estimated from the
+queue length and the route's recent service time. Shedding early keeps the
+latency of admitted requests bounded, instead of queueing every request
+until clients time out and retry on top of the backlog.
+
+With ``ADMISSION_LATENCY_TARGET`` set, limits adapt (AIMD): a route's limit
+drops by a tenth while its average service time is above the target, and
+grows by one while it is saturated and below the target, never beyond the
+configured limit.
+
+A batch request takes one slot per item, up to the whole limit, so the
+batch routes share their single-item route's capacity instead of getting
+around it with up to ``BATCH_MAX_ITEMS`` hashes per request.
+
+Limits are enforced per process: under gunicorn every worker applies them on
+its own. When Argon2 runs on the request threads, as it does under gunicorn,
+the default limit is ``ADMISSION_HOST_LIMIT`` (two per core) divided
+between the ``WEB_WORKERS`` workers, so the host as a whole runs about that
+many hashes per route whatever the worker count.
+"""
+
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from metrics import ADMISSION_REJECTIONS, REGISTRY, observe_stage
+from settings import (
+    admission_control,
+    admission_host_limit,
+    admission_latency_target,
+    admission_limit,
+    admission_limits,
+    admission_queue_size,
+    admission_queue_timeout,
+    web_workers,
+)
+
+ROUTES = ('store', 'verify', 'recover')
+# Concurrent Argon2 calls per route and core when they run on the request threads
+INLINE_LIMIT_PER_CORE = 2
+# Weight of the newest sample in the service time average
+LATENCY_ALPHA = 0.2
+MAX_RETRY_AFTER = 60
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request is shed instead of admitted.
+
+    Args:
+        route (str): Limited route that rejected the request
+        status (int): 429 if the queue was full, 503 if the wait timed out
+        retry_after (int): Seconds the client should wait before retrying
+    """
+
+    def __init__(self, route: str, status: int, retry_after: int) -> None:
+        reason = 'queue is full' if status == 429 else 'no slot freed up in time'
+        super().__init__(f"Server busy: {route} {reason}, retry in {retry_after}s")
+        self.route = route
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """Concurrency limit and bounded wait queue of one route.
+
+    Args:
+        route (str): Route name, used in errors and metrics
+        limit (int): Requests allowed to run at once; the ceiling of an adaptive limit
+        queue_size (int): Requests allowed to wait for a slot
+        queue_timeout (float): Seconds a request waits for a slot before it is rejected
+        latency_target (Optional[float]): Service time in seconds that adaptive
+            limits aim for; None keeps the limit fixed
+    """
+
+    def __init__(
+            self,
+            route: str,
+            limit: int,
+            queue_size: int,
+            queue_timeout: float,
+            latency_target: Optional[float] = None) \
+            -> None:
+        if limit < 1:
+            raise ValueError(f"Admission limit of {route} must be at least 1")
+        self.route = route
+        self.max_limit = limit
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.waiting = 0
+        self.latency: Optional[float] = None
+        self._completions = 0
+        self._saturated = False
+        self._cond = threading.Condition()
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained"""
+        latency = self.latency or 1.0
+        return min(MAX_RETRY_AFTER, max(1, math.ceil((self.waiting + 1) * latency / self.limit)))
+
+    def acquire(self, slots: int = 1) -> int:
+        """Take ``slots`` slots, at most the whole limit, waiting in the queue if there is room.
+
+        Raises:
+            Overloaded: If the queue is full (429) or no slot freed up in time (503)
+
+        Returns:
+            int: Slots taken, to hand back to release
+        """
+        with self._cond:
+            slots = max(1, min(slots, self.limit))
+            if self.in_flight + slots <= self.limit and not self.waiting:
+                self.in_flight += slots
+                return slots
+            if self.waiting >= self.queue_size:
+                ADMISSION_REJECTIONS.labels(self.route, '429').inc()
+                raise Overloaded(self.route, 429, self.retry_after())
+            started = time.monotonic()
+            deadline = started + self.queue_timeout
+            self.waiting += 1
+            try:
+                while self.in_flight + min(slots, self.limit) > self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        ADMISSION_REJECTIONS.labels(self.route, '503').inc()
+                        raise Overloaded(self.route, 503, self.retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            slots = min(slots, self.limit)
+            self.in_flight += slots
+        observe_stage('admission_wait', time.monotonic() - started)
+        return slots
+
+    def release(self, seconds: float, slots: int = 1) -> None:
+        """Give ``slots`` slots back after a request that held them for ``seconds``"""
+        with self._cond:
+            self._saturated = self._saturated or self.in_flight >= self.limit
+            self.in_flight -= slots
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += LATENCY_ALPHA * (seconds - self.latency)
+            if self.latency_target is not None:
+                self._adapt()
+            self._cond.notify(max(1, self.limit - self.in_flight))
+
+    def _adapt(self) -> None:
+        """Move the limit at most once per ``limit`` completed requests"""
+        self._completions += 1
+        if self._completions < self.limit:
+            return
+        if self.latency > self.latency_target:
+            self.limit = max(1, int(self.limit * 0.9))
+        elif self._saturated:
+            self.limit = min(self.max_limit, self.limit + 1)
+        self._completions = 0
+        self._saturated = False
+
+    @contextmanager
+    def admit(self, items: int = 1) -> Iterator[None]:
+        """Hold a slot per item, up to the whole limit, for the duration of the block"""
+        slots = self.acquire(items)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            # Service time of one item: the items ran ``slots`` at a time
+            self.release((time.monotonic() - started) / math.ceil(max(1, items) / slots), slots)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {'limit': self.limit, 'in_flight': self.in_flight, 'waiting': self.waiting}
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parse ``route=limit,...`` into a limit per route.
+
+    Raises:
+        ValueError: For unknown routes or limits that are not positive integers
+    """
+    limits: Dict[str, int] = {}
+    for part in filter(None, (part.strip() for part in spec.split(','))):
+        route, _, limit = part.partition('=')
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route '{route}', expected one of {', '.join(ROUTES)}")
+        limits[route] = int(limit)
+        if limits[route] < 1:
+            raise ValueError(f"Limit of '{route}' must be at least 1")
+    return limits
+
+
+def _default_limit() -> int:
+    """Argon2 calls the process can run at once: the hashing pool, or its share of the host limit.
+
+    On request threads every gunicorn worker hashes on its own, so the
+    host limit is split between ``WEB_WORKERS`` (one per core by default,
+    as in gunicorn.conf.py).
+    """
+    from hashing import default_worker_count, get_hash_executor
+    executor = get_hash_executor()
+    if executor.mode == 'process':
+        return executor.workers
+    host_limit = admission_host_limit or INLINE_LIMIT_PER_CORE * default_worker_count()
+    return max(1, math.ceil(host_limit / (web_workers or default_worker_count())))
+
+
+def _build_limiters() -> Dict[str, AdmissionLimiter]:
+    limits = parse_limits(admission_limits)
+    default = admission_limit or _default_limit()
+    limiters = {}
+    for route in ROUTES:
+        limit = limits.get(route, default)
+        queue_size = limit * 2 if admission_queue_size is None else admission_queue_size
+        limiters[route] = AdmissionLimiter(route, limit, queue_size, admission_queue_timeout,
+                                           admission_latency_target)
+    return limiters
+
+
+limiters: Dict[str, AdmissionLimiter] = _build_limiters() if admission_control else {}
+
+
+def admitted(route: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator running a view only once ``route``'s limiter admits it.
+
+    The view raises Overloaded instead of running when the request is shed.
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        limiter = limiters.get(route)
+        if limiter is None:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with limiter.admit():
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def admission(route: str, items: int = 1) -> Iterator[None]:
+    """Run the block once ``route``'s limiter admits ``items`` items, e.g. a batch.
+
+    Raises:
+        Overloaded: If the request is shed instead of admitted
+    """
+    limiter = limiters.get(route)
+    if limiter is None:
+        yield
+        return
+    with limiter.admit(items):
+        yield
+
+
+def _collect_metrics():
+    """Expose the limit, running and waiting requests of each route at scrape time"""
+    stats = {route: limiter.stats() for route, limiter in limiters.items()}
+    return [
+        (f'susdb_admission_{key}', 'gauge', documentation,
+         [(f'susdb_admission_{key}', {'route': route}, values[key]) for route, values in stats.items()])
+        for key, documentation in (
+            ('limit', 'Requests a route may run at once'),
+            ('in_flight', 'Requests running on a limited route'),
+            ('waiting', 'Requests queued for a slot on a limited route'),
+        )
+    ]
+
+
+REGISTRY.register_collector(_collect_metrics)
@@ -0,0 +1,176 @@
+"""Asyncio server exposing the SusDB routes on top of AsyncUserDBManager.
+
+Serve it with an ASGI server so one process keeps many requests in flight::
+
+    hypercorn async_main:app --bind 0.0.0.0:8000
+"""
+import logging
+import time
+from typing import Any, Dict
+
+import argon2
+from quart import Quart, Response, g, jsonify, request
+
+import metrics
+from async_user_db_manager import AsyncUserDBManager
+from log_pipeline import queued
+from s3_client import close_async_s3_clients
+from settings import metrics_enabled
+from urls import *
+
+app = Quart(__name__)
+
+logging.basicConfig(level=logging.DEBUG, handlers=[queued(logging.StreamHandler())])
+logger = logging.getLogger(__name__)
+
+
+async def get_request_data() -> Dict[str, Any]:
+    """Combine JSON, form, and query string data from the request."""
+    data: Dict[str, Any] = {}
+    if request.is_json:
+        data.update(await request.get_json())
+    data.update((await request.form).to_dict())
+    data.update(request.args.to_dict())
+    return data
+
+
+def parse_accept_init(data: Dict[str, Any]) -> bool:
+    """Parse the accept_init parameter from request data."""
+    return str(data.get('accept_init', '')).lower() == 'true'
+
+
+@app.after_serving
+async def close_s3_clients() -> None:
+    """Release the pooled S3 connections of this event loop"""
+    await close_async_s3_clients()
+
+
+@app.before_request
+async def start_request_timer() -> None:
+    """Remember when the request started, for the request latency histogram"""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def observe_request(response: Response) -> Response:
+    """Record the request latency by route, method and status"""
+    started = g.get('request_started')
+    if metrics_enabled and started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started)
+    return response
+
+
+@app.route(METRICS, methods=['GET'])
+async def scrape_metrics():
+    """
+    Expose the metrics of this process in the Prometheus text format.
+
+    Returns:
+        The current counters and histograms, formatted only when scraped.
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route(STORE, methods=['POST'])
+async def store_user_string():
+    """
+    Store a user string in the database.
+
+    Returns:
+        A JSON object containing the 'uid' of the stored user string.
+    """
+    data = await get_request_data()
+    req = {'request_string': data.get('req')}
+    stored = await AsyncUserDBManager(accept_init=parse_accept_init(data)).store_user_string(req)
+    return jsonify({'uid': stored.get('id') if stored else None})
+
+
+@app.route(VERIFY, methods=['POST'])
+async def verify_user():
+    """
+    Verify a user's string in the database.
+
+    Returns:
+        A JSON object containing the 'status' of the verification process.
+    """
+    data = await get_request_data()
+    req = {
+        'request_string': data.get('string'),
+        'uid': data.get('uid'),
+    }
+    try:
+        msg = await AsyncUserDBManager(accept_init=parse_accept_init(data), uid=data.get('uid')).verify_user(req)
+        return jsonify({'status': msg})
+    except argon2.exceptions.InvalidHashError:
+        return jsonify({'error': 'Invalid parameters passed, Check uid or string'}), 400
+
+
+@app.route(VIEW, methods=['POST'])
+async def display_user_db():
+    """
+    Display the user database.
+
+    Returns:
+        A JSON object containing the 'db_view' of the user database.
+    """
+    data = await get_request_data()
+    uid = data.get('uid')
+    user_db_view = await AsyncUserDBManager(accept_init=parse_accept_init(data), uid=uid).display_user_db(uid)
+    if isinstance(user_db_view, dict):
+        user_db_view = {str(k): v for k, v in user_db_view.items()}
+    return jsonify({'db_view': user_db_view})
+
+
+@app.route(RETRIEVE, methods=['POST'])
+async def deserialize_data():
+    """
+    Deserialize user data from the database.
+
+    Returns:
+        A JSON object containing the 'user_data' of the user database.
+    """
+    data = await get_request_data()
+    uid = data.get('uid')
+    user_key = data.get('key')
+    user_data = await AsyncUserDBManager(accept_init=parse_accept_init(data), uid=uid).deserialize_data(uid, user_key)
+    return jsonify({'user_data': user_data})
+
+
+@app.route(CLOSE, methods=['POST'])
+async def remove_user_account():
+    """
+    Remove a user's account from the database.
+
+    Returns:
+        A JSON object containing the 'response' of the account removal process.
+    """
+    data = await get_request_data()
+    uid = data.get('uid')
+    req = {'uid': uid, 'sus': data.get('sus')}
+    response = await AsyncUserDBManager(accept_init=parse_accept_init(data), uid=uid).close_account(req)
+    return jsonify({'response': response})
+
+
+@app.route(RECOVER, methods=['POST'])
+async def recover_account():
+    """
+    Recover a user's account from the database.
+
+    Returns:
+        A JSON object containing the 'response' of the account recovery process.
+    """
+    data = await get_request_data()
+    uid = data.get('uid')
+    req = {'_id': uid, 'user_string': data.get('user_string')}
+    response = await AsyncUserDBManager(accept_init=parse_accept_init(data), uid=uid).recover_account(req)
+    return jsonify({'response': response})
+
+
+if __name__ == '__main__':
+    app.run(
+        debug=False,
+        port=8000,
+        host='0.0.0.0',
+    )
@@ -0,0 +1,517 @@
+"""Module to store hashed user strings in S3 without blocking the event loop"""
+
+import asyncio
+import datetime
+import json
+import logging
+import uuid
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Union,
+    Optional
+)
+
+import argon2
+import shortuuid
+from botocore.exceptions import ClientError
+
+from hashing import get_hash_executor
+from metrics import stage, timed_operation
+from record_cache import record_cache
+from record_format import decode_record, encode_record
+from redis_cache import SharedCacheError, shared_cache
+from s3_client import (
+    CONFLICT_CODES,
+    MISSING_CODES,
+    NOT_MODIFIED_CODES,
+    get_async_s3_client,
+    s3_error_code,
+)
+from settings import s3_bucket_name
+from sus_index import KEY_PREFIX as SUS_INDEX_PREFIX, sus_digest
+from user_db_manager import UserDBManager, _submit_verify, uid_filter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class AsyncUserDBManager:
+    """Asyncio counterpart of user_db_manager.UserDBManager.
+
+    Storage calls go through a non-blocking aiobotocore client and Argon2
+    work is awaited on the hashing executor, so one event loop can keep
+    many requests in flight. Construction never does I/O: like the lazy
+    mode of UserDBManager, the first read doubles as the existence check.
+    Records, the record cache and the status strings are shared with the
+    synchronous manager.
+    """
+
+    metrics_backend = 's3_async'
+
+    def __init__(self, uid: Optional[str] = None, accept_init: bool = True) -> None:
+        """Initialize the user storage instance
+        with a unique identifier attached to file name."""
+        self.__unique_identifier = uid if uid else str(uuid.uuid4()) #Except for storing strings, always pass in the uid
+        self.__file_name = f"user_db_{self.__unique_identifier}"
+        self.__is_new = uid is None
+        self.__accept_init = accept_init
+        self.bucket_name = s3_bucket_name
+
+    @property
+    def get_file_name(self) -> str:
+        """Retrieve store file name"""
+        return self.__file_name
+
+    @property
+    def pk(self) -> str:
+        """Retrieve store id"""
+        return self.__unique_identifier
+
+    async def _get_record(self, file_name: str, revalidate: bool = False) -> Optional[Dict[str, str]]:
+        """Fetch and decode a box with a single GET, through the record cache
+        and the Redis tier.
+
+        Args:
+            file_name (str): Object key of the box
+            revalidate (bool): Skip the caches and confirm any cached entry with
+                a conditional GET, as UserDBManager._get_record does
+
+        Raises:
+            ClientError: For any S3 failure other than a missing object
+
+        Returns:
+            Optional[Dict[str, str]]: The record, or None if the box does not exist
+        """
+        cached = record_cache.get(file_name)
+        if cached is not None and cached.fresh and not revalidate:
+            return cached.record
+        if cached is None and not uid_filter.might_contain(file_name):
+            return await self._on_missing_record(file_name)
+        epoch = record_cache.epoch_of(file_name)
+        shared = None if revalidate else await self._shared_cache(shared_cache.get, file_name)
+        if shared is not None:
+            record_cache.put(file_name, *shared, epoch)
+            return shared[0]
+
+        client = await get_async_s3_client()
+        params = {'Bucket': self.bucket_name, 'Key': file_name}
+        if cached is not None and cached.etag:
+            params['IfNoneMatch'] = cached.etag
+        try:
+            response = await client.get_object(**params)
+            async with response['Body'] as stream:
+                content = await stream.read()
+        except ClientError as e:
+            code = s3_error_code(e)
+            if cached is not None and code in NOT_MODIFIED_CODES:
+                record_cache.revalidated(file_name)
+                await self._shared_cache(shared_cache.put, file_name, cached.record, cached.etag, True)
+                return cached.record
+            if code in MISSING_CODES:
+                record_cache.invalidate(file_name)
+                return await self._on_missing_record(file_name)
+            raise
+        with stage('record_decode'):
+            data = decode_record(content)
+        record_cache.put(file_name, data, response.get('ETag'), epoch)
+        await self._shared_cache(shared_cache.put, file_name, data, response.get('ETag'), True)
+        return data
+
+    async def _on_missing_record(self, file_name: str) -> Optional[Dict[str, str]]:
+        """Handle a read miss by initialising the box when that is accepted"""
+        if self.__accept_init and file_name == self.__file_name:
+            data = UserDBManager._initial_data()
+            await self._put(file_name, data, create_only=True)
+            return data
+        return None
+
+    async def _put(self, file_name: str, data: Dict[str, str], create_only: bool = False) -> bool:
+        """Write a box, optionally only if it does not exist yet (If-None-Match: *).
+
+        As in UserDBManager._write_to_s3, a replaced box fails to write when
+        its Redis entry cannot be dropped and updated.
+
+        Returns:
+            bool: True if the object was written
+        """
+        client = await get_async_s3_client()
+        params = {
+            'Bucket': self.bucket_name,
+            'Key': file_name,
+            'Body': encode_record(data),
+        }
+        if create_only:
+            params['IfNoneMatch'] = '*'
+        record_cache.invalidate(file_name)
+        uid_filter.add(file_name)
+        if not create_only:
+            try:
+                await self._shared_cache(shared_cache.delete, file_name)
+            except SharedCacheError as e:
+                logger.error("Error writing to S3, %s not written: %s", file_name, e)
+                return False
+        try:
+            response = await client.put_object(**params)
+            await self._shared_cache(shared_cache.put, file_name, data, response.get('ETag'))
+            return True
+        except ClientError as e:
+            if create_only and s3_error_code(e) in CONFLICT_CODES:
+                logger.info("[INIT] %s already exists, skipping creation.", file_name)
+            else:
+                logger.error("Error writing to S3: %s", e)
+            return False
+        except SharedCacheError as e:
+            # A box that did not exist has no older record in Redis to serve
+            if create_only:
+                logger.warning("[INIT] %s not written through to Redis: %s", file_name, e)
+                return True
+            logger.error("Error writing to S3, %s written but not updated in Redis: %s", file_name, e)
+            return False
+        finally:
+            # Again once written: a read between the first invalidation and the PUT may have cached the old box
+            record_cache.invalidate(file_name)
+
+    async def _index(self, secured_user_string: str, uid: str) -> bool:
+        """Add a ``sus_index`` entry, before the box holding the string is written.
+
+        Returns:
+            bool: True if the entry was written
+        """
+        client = await get_async_s3_client()
+        try:
+            await client.put_object(Bucket=self.bucket_name, Key=SUS_INDEX_PREFIX + sus_digest(secured_user_string),
+                                    Body=uid.encode('utf-8'))
+            return True
+        except ClientError as e:
+            logger.error("[STORAGE] Unable to index user_db_%s. Error: %s", uid, e)
+            return False
+
+    async def _unindex(self, secured_user_string: str) -> None:
+        """Drop a replaced or closed string from ``sus_index``; if that fails,
+        the entry is left for find_uid to ignore"""
+        client = await get_async_s3_client()
+        try:
+            await client.delete_object(Bucket=self.bucket_name, Key=SUS_INDEX_PREFIX + sus_digest(secured_user_string))
+        except ClientError as e:
+            logger.warning("[STORAGE] Unable to unindex a secured user string. Error: %s", e)
+
+    @staticmethod
+    async def _shared_cache(call: Callable[..., Any], *args: Any) -> Any:
+        """Run a Redis tier call on a thread, skipped entirely when the tier is off"""
+        if not shared_cache.enabled:
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, call, *args)
+
+    @staticmethod
+    async def _await_hashing(submit: Callable[..., Future], *args: Any) -> Any:
+        """Run an executor submission without blocking the loop.
+
+        Submitting may wait for a queue slot, so that happens on a thread;
+        the Argon2 work itself is awaited as a wrapped future.
+        """
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, submit, *args)
+        return await asyncio.wrap_future(future)
+
+    def serialize_data(
+            self,
+            req: Dict[str, str]) \
+            -> str:
+        """Serialize incoming data to a JSON string.
+
+        Raises:
+            KeyError: Raises an error if `request_string` key not found
+
+        Returns:
+            str: A JSON string representing the serialized data
+        """
+        if 'request_string' in req:
+            return json.dumps(req['request_string'])
+        raise KeyError("Error parsing key")
+
+    async def hash_user_string(
+            self,
+            user_string: str) \
+            -> str:
+        """Hash the user string using argon2
+
+        Returns:
+            str: The hashed user string.
+        """
+        return await self._await_hashing(get_hash_executor().submit_hash, user_string)
+
+    def generate_secured_string(self) -> str:
+        """Method to generate secured user string
+        using the global uuid and shortuuid module
+        """
+        return shortuuid.encode(uuid.uuid4())
+
+    @timed_operation('store')
+    async def store_user_string(self, req: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """
+        Store user string after encryption and generate secure user string.
+
+        Args:
+            req (Dict[str, str]): The request containing the user string.
+
+        Returns:
+            Optional[Dict[str, str]]: A dictionary containing the user ID if successful, None otherwise.
+        """
+        if not all(req.values()):
+            logger.error("[STORAGE] Empty request received")
+            return None
+
+        user_hash = await self.hash_user_string(self.serialize_data(req))
+
+        data: Dict[str, str] = {}
+        if not self.__is_new:
+            try:
+                data = await self._get_record(self.__file_name, revalidate=True) or {}
+            except ClientError as e:
+                logger.error("Error reading from S3: %s", e)
+        replaced = data.get('secured_user_string')
+        secured_user_string = self.generate_secured_string()
+        if not await self._index(secured_user_string, self.__unique_identifier):
+            return None
+        data.update({
+            'hash_string': user_hash,
+            'secured_user_string': secured_user_string,
+            '_id': self.__unique_identifier,
+            'created_on': datetime.datetime.now().isoformat()
+        })
+        if not await self._put(self.__file_name, data, create_only=self.__is_new):
+            logger.error("[STORAGE] Unable to store %s", self.get_file_name)
+            return None
+        if replaced:
+            await self._unindex(replaced)
+
+        logger.info("[STORAGE] UserID successfully assigned")
+        return {"id": self.__unique_identifier}
+
+    @timed_operation('verify')
+    async def verify_user(
+            self,
+            req: Dict[str, str]) \
+            -> Optional[str]:
+        """ Locate the DB file by UID and verify user credentials.
+
+        Returns:
+            Optional[str]: A success message or None if verification fails.
+        """
+        user_id = req.get('uid')
+
+        if not user_id:
+            return "UID not provided in the request."
+
+        user_string = self.serialize_data(req)
+        user_data = await self.display_user_db(user_id, revalidate=True)
+
+        if not isinstance(user_data, dict):
+            logger.error("[VERIF] %s", user_data)
+            return user_data
+
+        user_hash = user_data.get("hash_string")
+        if user_hash is None:
+            return "User hash not found in the database."
+
+        try:
+            try:
+                check_validity = await self._await_hashing(_submit_verify, user_id, user_hash, user_string)
+            except argon2.exceptions.VerifyMismatchError:
+                logger.error("[VERIF] User string does not match the stored hash for UID: %s.", user_id)
+                return "User string does not match the stored hash."
+
+            if check_validity:
+                logger.info("[VERIF] User verification successful for UID: %s.", user_id)
+                if get_hash_executor().needs_rehash(user_hash):
+                    # The upgrade runs on a background thread, so the sync manager writes it
+                    upgrader = UserDBManager(user_id, accept_init=False, lazy=True)
+                    get_hash_executor().schedule_rehash(
+                        user_string, lambda new_hash: upgrader._upgrade_hash(user_hash, new_hash))
+                return "Successful"
+
+            logger.warning("[VERIF] User verification failed for UID: %s.", user_id)
+            return None
+        except Exception as e:
+            logger.error("[VERIF] Error during verification for UID: %s. Error: %s", user_id, e)
+            return f"Error during verification: {str(e)}"
+
+    @timed_operation('view')
+    async def display_user_db(self, user_id: str, revalidate: bool = False) -> Union[str, Dict[str, str]]:
+        """Display the contents of the user-specific database
+
+        Args:
+            user_id (str): The user ID to look up the database for.
+            revalidate (bool): Confirm a cached record with S3 first, see _get_record
+
+        Returns:
+            Union[str, Dict[str, str]]: A dictionary containing the database contents,
+            or an error message if the database is not found.
+        """
+        try:
+            data = await self._get_record(f"user_db_{user_id}", revalidate)
+        except ClientError:
+            data = None
+        if data is None:
+            logger.error("[DISPLAY] No database found for UID: %s", user_id)
+            return f"No database found for UID: {user_id}"
+        logger.info("[DISPLAY] Database contents retrieved for UID: %s", user_id)
+        return data
+
+    @timed_operation('retrieve')
+    async def deserialize_data(self, uid: str, key: str) -> Optional[Union[str, bytes]]:
+        """Fetch a single field of the user's box.
+
+        Args:
+            uid: user id
+            key (str): The field to fetch
+
+        Returns:
+            Optional[Union[str, bytes]]: The value stored under the key, or an error message
+        """
+        user_data = await self.display_user_db(uid)
+        if not isinstance(user_data, dict):
+            logger.error("[FETCH] System Error while key lookup")
+            return 'System Error while fetching'
+        if key not in user_data:
+            logger.warning('[FETCH] Associated key not found in file: user_db_%s', uid)
+            return "Associated key not found"
+        logger.info("[FETCH] Data fetched from file: user_db_%s ", uid)
+        return user_data[key]
+
+    @timed_operation('check_integrity')
+    async def check_sus_integrity(self, req: Dict[str, str]) -> str:
+        """Check secured user strings integrity before restoring dbm
+
+        Args:
+            req (Dict[str, str]): Request data passed as a dict
+
+        Raises:
+            TypeError: If values in dict is None
+
+        Returns:
+            str: `Success` if integrity check passes
+        """
+        get_user_id, get_secured_user_string = req.get('uid'), req.get('secured_user_string')
+        if not get_user_id and not get_secured_user_string:
+            raise TypeError("Invalid key passed")
+
+        try:
+            data = await self._get_record(f"user_db_{get_user_id}", revalidate=True)
+            if not data:
+                logger.error('[RESTORE] File for user: %s does not exist.', get_user_id)
+                return "DBM not found"
+
+            stored_secured_user_string = data.get("secured_user_string")
+            if stored_secured_user_string is None:
+                logger.warning("[RESTORE] Secured user string not found for user:%s", get_user_id)
+                return "User string not found in the database."
+
+            if stored_secured_user_string == get_secured_user_string:
+                logger.info("[RESTORE] Integrity check passed for user:%s", get_user_id)
+                return "Success"
+            logger.warning("[RESTORE] Integrity check failed for user:%s", get_user_id)
+            return "Error, Integrity check failed"
+        except Exception as e:
+            logger.error("[RESTORE] Error during integrity check for user: %s. Error: %s", get_user_id, e)
+            return f"Error during integrity check: {str(e)}"
+
+    @timed_operation('recover')
+    async def recover_account(self, req: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """
+        Recover an account with id and user string.
+
+        Args:
+            req (Dict[str, str]): Request data containing '_id' and 'user_string'.
+
+        Returns:
+            Optional[Dict[str, str]]: A dictionary containing the user ID and secured user string if successful, None otherwise.
+        """
+        get_uid = req.get('_id')
+        user_string = req.get('user_string')
+
+        if not get_uid or not user_string:
+            logger.error("[RECOVER] Missing '_id' or 'user_string' in request")
+            return None
+
+        file_name = f"user_db_{get_uid}"
+        try:
+            data = await self._get_record(file_name, revalidate=True)
+            if not data:
+                logger.error("[RECOVER] DBM not found for user: %s", get_uid)
+                return None
+
+            user_hash = await self.hash_user_string(self.serialize_data({'request_string': user_string}))
+            secured_user_string = self.generate_secured_string()
+            replaced = data.get('secured_user_string')
+            if not await self._index(secured_user_string, get_uid):
+                return None
+            data.update({
+                'hash_string': user_hash,
+                'secured_user_string': secured_user_string,
+                '_id': get_uid,
+                'created_on': datetime.datetime.now().isoformat()
+            })
+            if not await self._put(file_name, data):
+                return None
+            if replaced:
+                await self._unindex(replaced)
+
+            logger.info("[RECOVER] Account recovered successfully for user: %s", get_uid)
+            return {
+                "id": get_uid,
+                "sus": secured_user_string
+            }
+        except Exception as e:
+            logger.error("[RECOVER] Error recovering account for user: %s. Error: %s", get_uid, e)
+            return None
+
+    @timed_operation('close')
+    async def close_account(self, req: Dict[str, str]) -> str:
+        """Method to support permanent account deletion
+
+        Args:
+            req (Dict): request param (uid, secured user string)
+
+        Raises:
+            KeyError: KeyError when empty queries are passed in
+
+        Returns:
+            str: Success if successful
+        """
+        user_id = req.get('uid')
+        secured_user_string = req.get('sus')
+        if not user_id or not secured_user_string:
+            raise KeyError('Error parsing user input')
+
+        file_name = f"user_db_{user_id}"
+        try:
+            data = await self._get_record(file_name, revalidate=True)
+            if not data:
+                logger.error("[CLOSE ACCOUNT] DBM not found for user: %s", user_id)
+                return 'DBM not found'
+
+            db_secured = data.get('secured_user_string')
+            if db_secured is None:
+                logger.error("[CLOSE ACCOUNT] Account does not exist for UID: %s", user_id)
+                return 'User not found'
+            if db_secured != secured_user_string:
+                logger.warning("[CLOSE ACCOUNT] Provided Secured User String does not match for UID: %s", user_id)
+                return 'Provided Secured User String does not match for UID'
+
+            # Marked closed first: if Redis cannot be reached, the box is left as it is
+            await self._shared_cache(shared_cache.close, file_name)
+            client = await get_async_s3_client()
+            await client.delete_object(Bucket=self.bucket_name, Key=file_name)
+            record_cache.invalidate(file_name)
+            await self._unindex(secured_user_string)
+
+            logger.info("[CLOSE ACCOUNT] Account deleted successfully for UID: %s", user_id)
+            return 'Success'
+        except (ClientError, SharedCacheError) as e:
+            logger.error("[CLOSE ACCOUNT] Error deleting account for UID: %s. Error: %s", user_id, e, exc_info=True)
+            return 'Error deleting account'
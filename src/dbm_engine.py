@@ -3,79 +3,325 @@
 import base64
 import datetime
 import dbm
+import hashlib
 import json
 import logging
 import os
+import threading
 import uuid
 from typing import (
+    Any,
+    Callable,
     Dict,
+    Iterator,
+    List,
+    Tuple,
     Union,
     Optional
 )
-from logging.handlers import RotatingFileHandler
 import argon2
 import shortuuid
 from argon2 import PasswordHasher
 from dotenv import load_dotenv
 
-from settings import get_log_path, get_path
+from hashing import get_hash_executor
+from log_pipeline import file_handler
+from metrics import timed_operation
+from record_format import decode_record, encode_record
+from store_lock import StoreLock, StoreLocked
+from settings import dbm_shard_count, dbm_sync_writes, get_log_path, get_path
+from sus_index import LocalSusIndex
+from uid_filter import get_uid_filter
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-log_path = get_log_path 
-if log_path is not None:
-    handler = RotatingFileHandler(
-        log_path,
-        maxBytes=10240,
-        backupCount=5
-    )
-else:
+log_path = get_log_path
+if log_path is None:
     raise TypeError('Bad log path expression given')
-handler.setLevel(logging.DEBUG)
+logger.addHandler(file_handler(log_path))
 
-formatter = logging.Formatter(
-    '%(asctime)s - %(message)s',
-    '%m/%d/%Y %I:%M:%S %p'
+
+LEGACY_SUFFIXES = ('.db', '.dir', '.dat', '.bak', '.pag')
+
+
+class ShardStore:
+    """Fixed set of dbm shard files holding every user record.
+
+    A uid is hashed to one of ``shard_count`` shards and its record is kept
+    under the uid key inside that shard, so the number of files no longer
+    grows with the number of users. Shard handles stay open for the life of
+    the process and each shard has its own lock, which makes a store safe to
+    share between threads.
+
+    Shard files are owned by one process at a time: the first shard opened
+    takes an exclusive lock on the store directory, and a second process
+    opening the same store gets ``StoreLocked`` instead of silently losing
+    writes. Stop the server or daemon using a store before running
+    ``migrate-shards``, ``export``/``import`` or ``bench`` against it.
+
+    With ``sync_writes`` every write is flushed before it returns. On
+    ``dbm.dumb``, the fallback when no ndbm/gdbm module is built in, a flush
+    rewrites the shard's whole ``.dir`` index, so a write costs time in
+    proportion to the boxes in its shard; more shards keep that down.
+    """
+
+    def __init__(self, root: str, shard_count: int, sync_writes: bool = True) -> None:
+        self.root = os.path.join(root, 'shards')
+        self.shard_count = shard_count
+        self.sync_writes = sync_writes
+        self._handles: Dict[int, Any] = {}
+        self._locks = [threading.Lock() for _ in range(shard_count)]
+        self._open_lock = threading.Lock()
+        self._owner = StoreLock(self.root)
+
+    def shard_for(self, uid: str) -> int:
+        """Shard index of a uid"""
+        digest = hashlib.blake2b(uid.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.shard_count
+
+    def shard_path(self, index: int) -> str:
+        """Base path of a shard file"""
+        return os.path.join(self.root, f"shard_{index:04d}")
+
+    def path_for(self, uid: str) -> str:
+        """Base path of the shard holding a uid"""
+        return self.shard_path(self.shard_for(uid))
+
+    def _handle(self, index: int) -> Any:
+        handle = self._handles.get(index)
+        if handle is None:
+            with self._open_lock:
+                handle = self._handles.get(index)
+                if handle is None:
+                    self._owner.acquire()
+                    handle = dbm.open(self.shard_path(index), 'c')
+                    self._handles[index] = handle
+        return handle
+
+    def _sync(self, handle: Any) -> None:
+        if self.sync_writes and hasattr(handle, 'sync'):
+            handle.sync()
+
+    def get(self, uid: str) -> Optional[Dict[str, str]]:
+        """Read a record, None if the uid has no box"""
+        index = self.shard_for(uid)
+        with self._locks[index]:
+            raw = self._handle(index).get(uid.encode('utf-8'))
+        return None if raw is None else decode_record(raw)
+
+    def contains(self, uid: str) -> bool:
+        """Whether the uid has a box"""
+        index = self.shard_for(uid)
+        with self._locks[index]:
+            return uid.encode('utf-8') in self._handle(index)
+
+    def put(self, uid: str, record: Dict[str, str]) -> None:
+        """Write a record, replacing any existing one"""
+        index = self.shard_for(uid)
+        with self._locks[index]:
+            handle = self._handle(index)
+            handle[uid.encode('utf-8')] = encode_record(record)
+            self._sync(handle)
+
+    def create(self, uid: str, record: Dict[str, str]) -> bool:
+        """Write a record only if the uid has no box yet.
+
+        Returns:
+            bool: True if the record was created
+        """
+        index = self.shard_for(uid)
+        key = uid.encode('utf-8')
+        with self._locks[index]:
+            handle = self._handle(index)
+            if key in handle:
+                return False
+            handle[key] = encode_record(record)
+            self._sync(handle)
+            return True
+
+    def update(
+            self,
+            uid: str,
+            change: Callable[[Dict[str, str]], Optional[Dict[str, str]]]) \
+            -> Optional[Dict[str, str]]:
+        """Read-modify-write a record under the shard lock.
+
+        Args:
+            uid (str): Box to change
+            change (Callable): Receives the current record and returns the
+                record to write, or None to leave it untouched
+
+        Returns:
+            Optional[Dict[str, str]]: The written record, None if nothing was written
+        """
+        index = self.shard_for(uid)
+        key = uid.encode('utf-8')
+        with self._locks[index]:
+            handle = self._handle(index)
+            raw = handle.get(key)
+            if raw is None:
+                return None
+            record = change(decode_record(raw))
+            if record is None:
+                return None
+            handle[key] = encode_record(record)
+            self._sync(handle)
+            return record
+
+    def delete(self, uid: str) -> bool:
+        """Remove a box.
+
+        Returns:
+            bool: True if a record was removed
+        """
+        index = self.shard_for(uid)
+        key = uid.encode('utf-8')
+        with self._locks[index]:
+            handle = self._handle(index)
+            if key not in handle:
+                return False
+            del handle[key]
+            self._sync(handle)
+            return True
+
+    def shard_uids(self, index: int) -> List[str]:
+        """Every uid held by one shard"""
+        with self._locks[index]:
+            keys = list(self._handle(index).keys())
+        return [key.decode('utf-8') for key in keys]
+
+    def uids(self) -> Iterator[str]:
+        """Iterate over every uid, one shard at a time"""
+        for index in range(self.shard_count):
+            yield from self.shard_uids(index)
+
+    def close(self) -> None:
+        """Flush and close every open shard"""
+        with self._open_lock:
+            for handle in self._handles.values():
+                handle.close()
+            self._handles.clear()
+            self._owner.release()
+
+    def _forget_handles(self) -> None:
+        """Drop inherited handles in a forked child without closing the parent's files"""
+        self._orphaned = list(self._handles.values())
+        self._handles = {}
+        self._owner.forget()
+        self._open_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(self.shard_count)]
+
+
+shard_store = ShardStore(
+    os.path.expanduser(get_path) if get_path else '',
+    dbm_shard_count,
+    sync_writes=dbm_sync_writes,
 )
-handler.setFormatter(formatter)
+os.register_at_fork(after_in_child=shard_store._forget_handles)
+shard_filter = get_uid_filter('dbm', shard_store.uids)
+# Secured user string digest -> uid, in shard files of its own
+sus_store = ShardStore(
+    os.path.join(os.path.expanduser(get_path), 'sus_index') if get_path else 'sus_index',
+    dbm_shard_count,
+    sync_writes=dbm_sync_writes,
+)
+os.register_at_fork(after_in_child=sus_store._forget_handles)
+
+
+def _legacy_uids(path: str) -> List[Tuple[str, List[str]]]:
+    """Find per-user dbm files from the old layout, with every file belonging to each"""
+    files: Dict[str, List[str]] = {}
+    for entry in os.scandir(path):
+        if not entry.is_file() or not entry.name.startswith('user_db_'):
+            continue
+        base, ext = os.path.splitext(entry.name)
+        if ext not in LEGACY_SUFFIXES:
+            base = entry.name
+        files.setdefault(base, []).append(entry.path)
+    return [(base[len('user_db_'):], paths) for base, paths in sorted(files.items())]
+
 
+def migrate_legacy_files(path: Optional[str] = None, store: Optional[ShardStore] = None) -> Dict[str, int]:
+    """Move per-user ``user_db_<uid>`` dbm files into the shard store.
 
-logger.addHandler(handler)
+    Records already present in a shard are kept and the legacy files are
+    removed once their record is safely in a shard, so the migration can be
+    interrupted and run again.
+
+    Args:
+        path (Optional[str]): Directory holding the legacy files, defaults to GET_PATH
+        store (Optional[ShardStore]): Destination, defaults to the process shard store
+
+    Returns:
+        Dict[str, int]: Counts of migrated, skipped and failed boxes
+    """
+    path = path or (os.path.expanduser(get_path) if get_path else '')
+    store = store or shard_store
+    counts = {'migrated': 0, 'skipped': 0, 'failed': 0}
+    for uid, paths in _legacy_uids(path):
+        base = os.path.join(path, f"user_db_{uid}")
+        try:
+            with dbm.open(base, 'r') as individual_store:
+                record = {
+                    key.decode('utf-8'): individual_store[key].decode('utf-8')
+                    for key in individual_store.keys()
+                }
+        except dbm.error + (UnicodeDecodeError,) as e:
+            logger.error("[MIGRATE] Unable to read legacy file for UID: %s. Error: %s", uid, e)
+            counts['failed'] += 1
+            continue
+        if store is shard_store:
+            shard_filter.add(uid)
+        if store.create(uid, record):
+            counts['migrated'] += 1
+        else:
+            counts['skipped'] += 1
+        for file_path in paths:
+            os.remove(file_path)
+    logger.info("[MIGRATE] Legacy files migrated: %s", counts)
+    return counts
 
 
 class UserDBManager:
     """Main DB Manager for IRs.
 
     This class manages user-specific databases, allowing for the storage and retrieval
-    of hashed and secured user strings.
+    of hashed and secured user strings. Each user's box is a record in one
+    of the hash-partitioned shard files of ``shard_store``; subclasses can
+    point ``store`` at another backend with the same interface.
     """
-    
+
+    store: Any = shard_store
+    uid_filter: Any = shard_filter
+    sus_index: Any = LocalSusIndex(sus_store)
+    metrics_backend = 'dbm'
+
     def db_file_exists(self) -> bool:
-        """Check if a DBM file already exists with the given file path and name."""
-        return os.path.exists(self.get_file_path)
+        """Check if a box already exists for this uid."""
+        if not self.uid_filter.might_contain(self.__unique_identifier):
+            return False
+        return self.store.contains(self.__unique_identifier)
 
     def __init__(self, uid: Optional[str] = None) -> None:
         """Initialize the user storage instance
         with a unique identifier attached to file name."""
-        self.__get_path = os.path.expanduser(get_path) if get_path else ''
         self.__unique_identifier = uid if uid else str(uuid.uuid4()) #Except for storing strings, always pass in the uid
         self.__file_name = f"user_db_{self.__unique_identifier}"
-        self.__file_path = os.path.join(self.__get_path, self.__file_name)
         
         if self.db_file_exists():
-            logger.info(f"[INIT] UserDBManager instance already exists for {self.get_file_name}, skipping initialisation.")
+            logger.info("[INIT] UserDBManager instance already exists for %s, skipping initialisation.", self.get_file_name)
             return
         else:
             self.initialize_db()
-            logger.info(f"[INIT] UserDBManager instance initialized for {self.get_file_name}.")
+            logger.info("[INIT] UserDBManager instance initialized for %s.", self.get_file_name)
 
     @property
     def get_file_path(self) -> Union[str, os.PathLike]:
-        """Retrieve store path"""
-        return self.__file_path
+        """Retrieve the path of the shard holding this box"""
+        return self.store.path_for(self.__unique_identifier)
 
     @property
     def get_file_name(self) -> str:
@@ -88,27 +334,16 @@ class UserDBManager:
         return self.__unique_identifier
     
     def initialize_db(self) -> None:
-        """Initialize the user-specific database if it doesn't exist.
-        Ensure the directory exists or create it
-        Creates an empty file named 'user_db<uid>' inside the directory
-        """
-            
-        os.makedirs(self.__get_path, exist_ok=True)
-
-        with open(self.__file_path, 'w', encoding="utf-8"):
-            pass
-
-        self.__initialize_user_db()
+        """Initialize the user-specific box if it doesn't exist."""
+        self.uid_filter.add(self.__unique_identifier)
+        self.store.create(self.__unique_identifier, {
+            '_id': '',
+            'hash_string': '',
+            'secured_user_string': '',
+            'created_on': ''
+        })
         logger.info("UserDBManager instance initialised.")
 
-    def __initialize_user_db(self) -> None:
-        """Initialize the keys in the user-specific database"""
-        with dbm.open(self.__file_path, 'n') as individual_store:
-            individual_store['_id'] = b''
-            individual_store['hash_string'] = b''
-            individual_store['secured_user_string'] = b''
-            individual_store['created_on'] = b''
-
     def serialize_data(
             self,
             req: Dict[str, str]) \
@@ -135,18 +370,18 @@ class UserDBManager:
             Optional[Union[str, bytes]]: The data associated with the key, or None
         """
         file_name = f"user_db_{uid}"
-        file_path = os.path.join(self.__get_path, file_name)
-        if os.path.exists(file_path):
-            with dbm.open(file_path, 'r') as individual_store:
-                user_data_bytes = individual_store.get(key.encode('utf-8'))
-                if user_data_bytes is not None:
-                    logger.info(f"[FETCH] Data fetched from file: {file_name} ")
-                    return user_data_bytes.decode('utf-8')
-                logger.warning(f'[FETCH] Associated key not found in file: {file_name}')
-                return f"Associated key not found"
+        record = self.store.get(uid)
+        if record is not None:
+            user_data = record.get(key)
+            if user_data is not None:
+                logger.info("[FETCH] Data fetched from file: %s ", file_name)
+                return user_data
+            logger.warning('[FETCH] Associated key not found in file: %s', file_name)
+            return f"Associated key not found"
         logger.error("[FETCH] System Error while key lookup")
         return f'System Error while fetching'
 
+    @timed_operation('retrieve')
     def deserialize_data(self, uid: str, key: str) -> Optional[Union[str, bytes]]:
         """Fetch and deserialize user data from the database using a specific key.
 
@@ -170,9 +405,7 @@ class UserDBManager:
         Returns:
             str: The hashed user string.
         """
-        user_string_bytes = user_string.encode('utf-8')
-        passwd_hash = PasswordHasher()
-        hashed_user_string = passwd_hash.hash(user_string_bytes)
+        hashed_user_string = get_hash_executor().hash(user_string)
         return hashed_user_string
 
     def generate_secured_string(self) -> str:
@@ -184,6 +417,7 @@ class UserDBManager:
         return secure_user_string
 
 
+    @timed_operation('store')
     def store_user_string(self, req: Dict[str, str]) -> Optional[Dict[str, str]]:
         """
         Store user string after encryption and generate secure user string.
@@ -202,25 +436,32 @@ class UserDBManager:
         serialised_data = self.serialize_data(req)
         user_hash = self.hash_user_string(serialised_data)
 
-        with dbm.open(self.__file_path, 'c') as individual_store:
-            individual_store['hash_string'] = user_hash
-            
-            current_datetime = datetime.datetime.now().isoformat()
-            secured_user_string = self.generate_secured_string()
-
-            individual_store['secured_user_string'] = secured_user_string
-            individual_store['_id'] = self.__unique_identifier
-            individual_store['created_on'] = current_datetime
-
-            user_id = individual_store.get('_id')
-            
-            if user_id:
-                logger.info("[STORAGE] UserID successfully assigned")
-                return {"id": user_id.decode('utf-8') }
-            else:
-                logger.error("[STORAGE] User ID is None. Unable to assign to uid")
-                return None
+        current_datetime = datetime.datetime.now().isoformat()
+        secured_user_string = self.generate_secured_string()
+        record = self.store.get(self.__unique_identifier) or {}
+        replaced = record.get('secured_user_string')
+        # Indexed before the box is written, unindexed once it is replaced
+        self.sus_index.add(secured_user_string, self.__unique_identifier)
+        record.update({
+            'hash_string': user_hash,
+            'secured_user_string': secured_user_string,
+            '_id': self.__unique_identifier,
+            'created_on': current_datetime
+        })
+        self.store.put(self.__unique_identifier, record)
+        if replaced:
+            self.sus_index.remove(replaced)
+
+        user_id = record.get('_id')
+        
+        if user_id:
+            logger.info("[STORAGE] UserID successfully assigned")
+            return {"id": user_id}
+        else:
+            logger.error("[STORAGE] User ID is None. Unable to assign to uid")
+            return None
 
+    @timed_operation('verify')
     def verify_user(
             self,
             req: Dict[str, str]) \
@@ -230,7 +471,6 @@ class UserDBManager:
         Returns:
             Optional[str]: A success message or None if verification fails.
         """
-        passwd_hash = PasswordHasher()
         user_id = req.get('uid')
 
         if not user_id:
@@ -248,25 +488,39 @@ class UserDBManager:
                     return "User hash not found in the database."
 
                 try:
-                    check_validity = passwd_hash.verify(user_hash, user_string)
+                    check_validity = get_hash_executor().verify(user_hash, user_string)
                 except argon2.exceptions.VerifyMismatchError:
-                    logger.error(f"[VERIF] User string does not match the stored hash for UID: {user_id}.")
+                    logger.error("[VERIF] User string does not match the stored hash for UID: %s.", user_id)
                     return "User string does not match the stored hash."
 
                 if check_validity:
-                    logger.info(f"[VERIF] User verification successful for UID: {user_id}.")
+                    logger.info("[VERIF] User verification successful for UID: %s.", user_id)
+                    if get_hash_executor().needs_rehash(user_hash):
+                        get_hash_executor().schedule_rehash(
+                            user_string, lambda new_hash: self._upgrade_hash(user_id, user_hash, new_hash))
                     return "Successful"
                 
-                logger.warning(f"[VERIF] User verification failed for UID: {user_id}.")
+                logger.warning("[VERIF] User verification failed for UID: %s.", user_id)
                 return None
             except Exception as e:
-                logger.error(f"[VERIF] Error during verification for UID: {user_id}. Error: {str(e)}")
+                logger.error("[VERIF] Error during verification for UID: %s. Error: %s", user_id, e)
                 return f"Error during verification: {str(e)}"
         else:
             # If user_data is a string, it means no database was found
-            logger.error(f"[VERIF] {user_data}")
+            logger.error("[VERIF] %s", user_data)
             return user_data
 
+    def _upgrade_hash(self, user_id: str, old_hash: str, new_hash: str) -> None:
+        """Replace a hash made with an outdated cost profile, unless it changed meanwhile"""
+        def upgrade(record: Dict[str, str]) -> Optional[Dict[str, str]]:
+            if record.get('hash_string') != old_hash:
+                return None
+            return dict(record, hash_string=new_hash)
+
+        if self.store.update(user_id, upgrade) is not None:
+            logger.info("[REHASH] Hash upgraded to current profile for UID: %s", user_id)
+
+    @timed_operation('view')
     def display_user_db(self, user_id: str) -> Union[str, Dict[str, str]]:
         """Display the contents of the user-specific database
 
@@ -277,24 +531,16 @@ class UserDBManager:
             Union[str, Dict[str, str]]: A dictionary containing the database contents,
             or an error message if the database is not found.
         """
-        view_database: Dict[str, str] = {}
-        file_name = f"user_db_{user_id}"
-        file_path = os.path.join(self.__get_path, file_name)
+        view_database = self.store.get(user_id)
         
-        if os.path.exists(file_path):
-            with dbm.open(file_path, 'r') as individual_store:
-                for key in individual_store.keys():
-                    try:
-                        view_database[key.decode('utf-8')] = individual_store[key].decode('utf-8')
-                    except UnicodeDecodeError:
-                        view_database[key.decode('utf-8')] = individual_store[key].hex()
-            
-            logger.info(f"[DISPLAY] Database contents retrieved for UID: {user_id}")
+        if view_database is not None:
+            logger.info("[DISPLAY] Database contents retrieved for UID: %s", user_id)
             return view_database
                 
-        logger.error(f"[DISPLAY] No database found for UID: {user_id}")
+        logger.error("[DISPLAY] No database found for UID: %s", user_id)
         return f"No database found for UID: {user_id}"
 
+    @timed_operation('check_integrity')
     def check_sus_integrity(self, req: Dict[str, str]) -> str:
         """Check secured user strings integrity before restoring dbm
 
@@ -311,28 +557,48 @@ class UserDBManager:
             = req.get('uid'), req.get('secured_user_string')
         if not get_user_id and not get_secured_user_string :
             raise TypeError("Invalid key passed")
-        file_name = f"user_db_{get_user_id}"
-        file_path = os.path.join(self.__get_path, file_name)
-        if os.path.exists(file_path):
-            logger.info(f'[RESTORE] File for user: {get_user_id} exists.')
-            with dbm.open(file_path, 'r') as individual_store:
-                try:
-                    find_secure_user_string = individual_store.get(
-                        "secured_user_string")
-                    if find_secure_user_string is not None:
-                        check_string_integrity = \
-                            find_secure_user_string.decode('utf-8') \
-                            == get_secured_user_string
-                        if check_string_integrity:
-                            logger.info(f"[RESTORE] Integrity check passed for user:{get_user_id}")
-                            return "Success"
-                        logger.warning(f"[RESTORE] Integrity check failed for user:{get_user_id}")
-                        return "Error, Integrity check failed"
-                except KeyError:
-                    return "User string not found in the database."
-        logger.error(f"[RESTORE] DBM not found for user: {get_user_id}")
+        record = self.store.get(get_user_id)
+        if record is not None:
+            logger.info('[RESTORE] File for user: %s exists.', get_user_id)
+            find_secure_user_string = record.get("secured_user_string")
+            if find_secure_user_string is None:
+                return "User string not found in the database."
+            if find_secure_user_string == get_secured_user_string:
+                logger.info("[RESTORE] Integrity check passed for user:%s", get_user_id)
+                return "Success"
+            logger.warning("[RESTORE] Integrity check failed for user:%s", get_user_id)
+            return "Error, Integrity check failed"
+        logger.error("[RESTORE] DBM not found for user: %s", get_user_id)
         return f"DBM not found"
 
+    @classmethod
+    @timed_operation('lookup')
+    def find_uid(cls, secured_user_string: str) -> Optional[str]:
+        """Find the box a secured user string belongs to.
+
+        One read of ``sus_index`` and one of the box it points at, which
+        confirms the match.
+
+        Args:
+            secured_user_string (str): The secured user string handed out by store or recover
+
+        Returns:
+            Optional[str]: The uid, or None if no box holds this secured user string
+        """
+        if not secured_user_string:
+            return None
+        uid = cls.sus_index.lookup(secured_user_string)
+        if uid is None:
+            logger.info("[LOOKUP] No box indexed for the secured user string")
+            return None
+        record = cls.store.get(uid)
+        if record is None or record.get('secured_user_string') != secured_user_string:
+            logger.warning("[LOOKUP] Index entry for UID: %s no longer matches its box", uid)
+            return None
+        logger.info("[LOOKUP] Secured user string belongs to UID: %s", uid)
+        return uid
+
+    @timed_operation('recover')
     def recover_account(self, req: Dict[str, str]) -> Optional[Dict[str, str]]:
         """
         Recover an account with id and user string.
@@ -350,33 +616,44 @@ class UserDBManager:
             logger.error("[RECOVER] Missing '_id' or 'user_string' in request")
             return None
 
-        file_name = f"user_db_{get_uid}"
-        file_path = os.path.join(self.__get_path, file_name)
-        
-        if not os.path.exists(file_path):
-            logger.error(f"[RECOVER] DBM not found for user: {get_uid}")
+        if not self.store.contains(get_uid):
+            logger.error("[RECOVER] DBM not found for user: %s", get_uid)
             return None
 
         serialized_data = self.serialize_data({'request_string': user_string})
         user_hash = self.hash_user_string(serialized_data)
 
-        with dbm.open(file_path, 'c') as individual_store:
-            individual_store['hash_string'] = user_hash
-            
-            current_datetime = datetime.datetime.now().isoformat()
-            secured_user_string = self.generate_secured_string()
-
-            individual_store['secured_user_string'] = secured_user_string
-            individual_store['_id'] = get_uid
-            individual_store['created_on'] = current_datetime
-
-            logger.info(f"[RECOVER] Account recovered successfully for user: {get_uid}")
-            return {
-                "id": get_uid,
-                "sus": secured_user_string
-            }
+        current_datetime = datetime.datetime.now().isoformat()
+        secured_user_string = self.generate_secured_string()
+        replaced = []
+
+        def recover(record: Dict[str, str]) -> Dict[str, str]:
+            replaced.append(record.get('secured_user_string'))
+            return dict(
+                record,
+                hash_string=user_hash,
+                secured_user_string=secured_user_string,
+                _id=get_uid,
+                created_on=current_datetime,
+            )
+
+        self.sus_index.add(secured_user_string, get_uid)
+        recovered = self.store.update(get_uid, recover)
+        if recovered is None:
+            self.sus_index.remove(secured_user_string)
+            logger.error("[RECOVER] DBM not found for user: %s", get_uid)
+            return None
+        if replaced[0]:
+            self.sus_index.remove(replaced[0])
+
+        logger.info("[RECOVER] Account recovered successfully for user: %s", get_uid)
+        return {
+            "id": get_uid,
+            "sus": secured_user_string
+        }
     
     
+    @timed_operation('close')
     def close_account(self, req: Dict[str, str]) -> str:
         """Method to support permanent account deletion
 
@@ -394,32 +671,29 @@ class UserDBManager:
         if not user_id or not secured_user_string:
             raise KeyError('Error parsing user input')
         
-        file_name = f"user_db_{user_id}"
-        file_path = os.path.join(self.__get_path, file_name)
-        
-        if not os.path.exists(file_path):
-            logger.error(f"[CLOSE ACCOUNT] DBM not found for user: {user_id}")
+        record = self.store.get(user_id)
+        if record is None:
+            logger.error("[CLOSE ACCOUNT] DBM not found for user: %s", user_id)
             return 'DBM not found'
 
         try:
-            with dbm.open(file_path, 'r') as individual_store:
-                db_secured = individual_store.get('secured_user_string')
-                if db_secured is None:
-                    logger.error(f"[CLOSE ACCOUNT] Account does not exist for UID: {user_id}")
-                    return 'User not found'
-                if db_secured.decode('utf-8') != secured_user_string:
-                    logger.warning(f"[CLOSE ACCOUNT] Provided Secured User String does not match for UID: {user_id}")
-                    return 'Provided Secured User String does not match for UID'
+            db_secured = record.get('secured_user_string')
+            if db_secured is None:
+                logger.error("[CLOSE ACCOUNT] Account does not exist for UID: %s", user_id)
+                return 'User not found'
+            if db_secured != secured_user_string:
+                logger.warning("[CLOSE ACCOUNT] Provided Secured User String does not match for UID: %s", user_id)
+                return 'Provided Secured User String does not match for UID'
             
-            os.remove(file_path)
-            if os.path.exists(file_path):
-                logger.error(f"[CLOSE ACCOUNT] Failed to delete DBM file for UID: {user_id}")
+            if not self.store.delete(user_id):
+                logger.error("[CLOSE ACCOUNT] Failed to delete DBM file for UID: %s", user_id)
                 return 'Error: Failed to delete account'
+            self.sus_index.remove(secured_user_string)
             
-            logger.info(f"[CLOSE ACCOUNT] Account deleted successfully for UID: {user_id}")
+            logger.info("[CLOSE ACCOUNT] Account deleted successfully for UID: %s", user_id)
             return 'Success'
         except Exception as e:
-            logger.error(f"[CLOSE ACCOUNT] Error deleting account for UID: {user_id}. Error: {str(e)}", exc_info=True)
+            logger.error("[CLOSE ACCOUNT] Error deleting account for UID: %s. Error: %s", user_id, e, exc_info=True)
             return 'Error deleting account'
 
 
@@ -0,0 +1,80 @@
+"""gunicorn configuration for serving main.py in production.
+
+    cd src && gunicorn main:app
+
+gunicorn picks this file up from the working directory. The master imports
+the app and warms it up (boto3 session, Argon2) once, then forks
+``WEB_WORKERS`` processes that each build their own S3 client from the warm
+session and serve ``WEB_THREADS`` requests at a time. Argon2 runs on
+the request threads by default (``HASH_EXECUTOR=inline``): argon2-cffi
+releases the GIL, and one worker per core already keeps every core busy,
+so a hashing pool per worker would only oversubscribe them. Admission
+control splits ``ADMISSION_HOST_LIMIT`` (two hashes per route and core by
+default) between the ``WEB_WORKERS`` workers, so the host-wide concurrency
+stays the same whatever the worker count; ``ADMISSION_LIMIT`` instead sets
+the limit of each worker. Requests queued by admission control hold a thread
+too, so ``WEB_THREADS`` should cover the limits and queues of the limited
+routes plus the cheap ones.
+
+``kill -HUP`` on the master (see ``WEB_PIDFILE``) replaces the workers
+gracefully: each stops accepting, finishes its in-flight requests within
+``WEB_GRACEFUL_TIMEOUT`` and is replaced by a fresh fork. ``WEB_MAX_REQUESTS``
+does the same for a worker after that many requests. The preloaded app and
+these settings are not re-read; deploy new code or settings by restarting
+the master.
+
+Every worker saves its metrics to a snapshot file under ``METRICS_DIR``
+(a fresh directory per master by default), and ``/metrics`` merges them,
+so a scrape covers all workers whichever one answers it.
+"""
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('HASH_EXECUTOR', 'inline')
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'susdb-metrics-{os.getpid()}'))
+
+from hashing import default_worker_count  # noqa: E402
+from settings import (  # noqa: E402
+    web_bind,
+    web_graceful_timeout,
+    web_keepalive,
+    web_max_requests,
+    web_max_requests_jitter,
+    web_pidfile,
+    web_threads,
+    web_timeout,
+    web_workers,
+)
+
+bind = web_bind
+workers = web_workers or default_worker_count()
+worker_class = 'gthread'
+threads = web_threads
+keepalive = web_keepalive
+timeout = web_timeout
+graceful_timeout = web_graceful_timeout
+max_requests = web_max_requests
+max_requests_jitter = web_max_requests_jitter
+pidfile = web_pidfile
+preload_app = True
+
+
+def when_ready(server):
+    """Warm the preloaded app up in the master, before the first fork"""
+    import main
+    main.warm_up()
+    from admission import limiters
+    server.log.info("[WEB] Warmed up, starting %d workers x %d threads, admission limits per worker: %s",
+                    workers, threads, {route: limiter.limit for route, limiter in limiters.items()})
+
+
+def post_fork(server, worker):
+    """Build the worker's own S3 client before it accepts requests"""
+    from s3_client import get_s3_client
+    get_s3_client()
+
+
+def on_exit(server):
+    """Remove the metrics snapshots of this master's workers"""
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
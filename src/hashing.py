@@ -0,0 +1,329 @@
+"""Module to run Argon2 hashing and verification off the request thread"""
+
+import functools
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from argon2 import PasswordHasher
+
+from metrics import HASH_QUEUE_FULL, observe_stage
+from settings import (
+    hash_executor_mode,
+    hash_memory_cost,
+    hash_parallelism,
+    hash_profile,
+    hash_queue_size,
+    hash_queue_timeout,
+    hash_start_method,
+    hash_time_cost,
+    hash_workers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Named Argon2id cost profiles, memory_cost is in KiB
+HASH_PROFILES: Dict[str, Dict[str, int]] = {
+    'minimal': {'time_cost': 2, 'memory_cost': 19456, 'parallelism': 1},
+    'default': {'time_cost': 3, 'memory_cost': 65536, 'parallelism': 4},
+    'hardened': {'time_cost': 4, 'memory_cost': 131072, 'parallelism': 4},
+}
+
+
+class HashQueueFull(RuntimeError):
+    """Raised when the hashing queue stays full for longer than the queue timeout"""
+
+
+def get_profile(name: Optional[str] = None) -> Dict[str, int]:
+    """Resolve the Argon2 cost parameters to hash with.
+
+    Args:
+        name (Optional[str]): Profile name, defaults to HASH_PROFILE. Explicit
+            HASH_TIME_COST / HASH_MEMORY_COST / HASH_PARALLELISM settings
+            override the profile's values.
+
+    Raises:
+        KeyError: If the profile does not exist
+
+    Returns:
+        Dict[str, int]: time_cost, memory_cost and parallelism
+    """
+    name = name or hash_profile
+    if name not in HASH_PROFILES:
+        raise KeyError(f"Unknown hash profile: {name}")
+    params = dict(HASH_PROFILES[name])
+    overrides = {
+        'time_cost': hash_time_cost,
+        'memory_cost': hash_memory_cost,
+        'parallelism': hash_parallelism,
+    }
+    params.update({key: value for key, value in overrides.items() if value})
+    return params
+
+
+@functools.lru_cache(maxsize=8)
+def _hasher(time_cost: int, memory_cost: int, parallelism: int) -> PasswordHasher:
+    return PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+
+def _hash(user_string: str, params: Dict[str, int]) -> str:
+    """Worker side of HashingExecutor.hash"""
+    return _hasher(**params).hash(user_string.encode('utf-8'))
+
+
+def _verify(user_hash: str, user_string: str) -> bool:
+    """Worker side of HashingExecutor.verify, parameters are read from the hash"""
+    return _hasher(**HASH_PROFILES['default']).verify(user_hash, user_string)
+
+
+def default_worker_count() -> int:
+    """Number of cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class HashingExecutor:
+    """Bounded pool that runs Argon2 work in separate processes.
+
+    At most ``workers + queue_size`` calls are in flight; further submissions
+    wait up to ``queue_timeout`` seconds for a slot and then raise
+    HashQueueFull. In ``inline`` mode the work runs on the calling thread,
+    which is what one-shot CLI invocations want.
+    """
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            queue_size: Optional[int] = None,
+            mode: str = 'process',
+            queue_timeout: Optional[float] = None,
+            start_method: Optional[str] = None,
+            params: Optional[Dict[str, int]] = None) \
+            -> None:
+        if mode not in ('process', 'inline'):
+            raise ValueError(f"Unknown hashing executor mode: {mode}")
+        self.params = params or get_profile()
+        self.workers = workers or default_worker_count()
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self.mode = mode
+        self.queue_timeout = queue_timeout
+        self._start_method = start_method
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.Lock()
+        self._background: Optional[ThreadPoolExecutor] = None
+        self._pending_rehashes = 0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    context = multiprocessing.get_context(self._start_method) if self._start_method else None
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    logger.info("[HASH] Process pool started with %d workers", self.workers)
+        return self._pool
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Queue a picklable callable on the pool.
+
+        Raises:
+            HashQueueFull: If no slot frees up within the queue timeout
+
+        Returns:
+            Future: Resolves to the callable's result
+        """
+        if self.mode == 'inline':
+            future: Future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            HASH_QUEUE_FULL.inc()
+            raise HashQueueFull("Hashing queue is full")
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _timed(stage: str, started: float, future: Future) -> Future:
+        """Record the time from submission (queue wait included) to completion"""
+        future.add_done_callback(lambda _: observe_stage(stage, time.perf_counter() - started))
+        return future
+
+    def submit_hash(self, user_string: str) -> Future:
+        """Queue an Argon2 hash of ``user_string`` with the configured profile"""
+        started = time.perf_counter()
+        return self._timed('argon2_hash', started, self.submit(_hash, user_string, self.params))
+
+    def submit_verify(self, user_hash: str, user_string: str) -> Future:
+        """Queue an Argon2 verification of ``user_string`` against ``user_hash``"""
+        started = time.perf_counter()
+        return self._timed('argon2_verify', started, self.submit(_verify, user_hash, user_string))
+
+    def hash(self, user_string: str) -> str:
+        """Hash on the pool and wait for the result"""
+        return self.submit_hash(user_string).result()
+
+    def verify(self, user_hash: str, user_string: str) -> bool:
+        """Verify on the pool and wait for the result.
+
+        Raises:
+            argon2.exceptions.VerifyMismatchError: If the string does not match
+            argon2.exceptions.InvalidHashError: If the stored hash is malformed
+        """
+        return self.submit_verify(user_hash, user_string).result()
+
+    def needs_rehash(self, user_hash: str) -> bool:
+        """Whether ``user_hash`` was made with parameters other than the current profile"""
+        return _hasher(**self.params).check_needs_rehash(user_hash)
+
+    def schedule_rehash(self, user_string: str, on_done: Callable[[str], None]) -> None:
+        """Hash ``user_string`` again in the background and hand the new hash to ``on_done``.
+
+        ``on_done`` runs on a background thread, never on the caller's, and
+        errors are logged rather than raised.
+        """
+        def store(future: Future) -> None:
+            try:
+                on_done(future.result())
+            except Exception as e:
+                logger.warning("[REHASH] Background rehash failed: %s", e)
+
+        def start() -> None:
+            try:
+                store(self.submit_hash(user_string))
+            except HashQueueFull:
+                logger.info("[REHASH] Hashing queue full, rehash skipped")
+            finally:
+                with self._pool_lock:
+                    self._pending_rehashes -= 1
+
+        with self._pool_lock:
+            # Upgrades are best effort, the next verify retries a skipped one
+            if self._pending_rehashes >= max(1, self.queue_size):
+                return
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=2, thread_name_prefix='rehash')
+            self._pending_rehashes += 1
+            self._background.submit(start)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker processes"""
+        with self._pool_lock:
+            if self._background is not None:
+                self._background.shutdown(wait=wait)
+                self._background = None
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+
+    def _forget_pool(self) -> None:
+        """Drop the parent's pool in a forked child without touching its workers"""
+        self._pool = None
+        self._background = None
+        self._pending_rehashes = 0
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+
+
+def measure_hash_latency(params: Dict[str, int], samples: int = 20) -> List[float]:
+    """Time ``samples`` inline hashes with ``params``.
+
+    Returns:
+        List[float]: Sorted latencies in milliseconds
+    """
+    hasher = PasswordHasher(**params)
+    hasher.hash(b'warm-up')
+    latencies = []
+    for i in range(samples):
+        start = time.perf_counter()
+        hasher.hash(f"calibration-{i}".encode('utf-8'))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return sorted(latencies)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def calibrate(
+        target_p99_ms: float,
+        memory_cost: int = 65536,
+        parallelism: int = 4,
+        samples: int = 20,
+        max_time_cost: int = 32) \
+        -> Dict[str, Any]:
+    """Pick Argon2 parameters whose p99 hash latency on this machine stays under a target.
+
+    Memory is halved until a single pass fits the target, then the number of
+    passes is raised for as long as the p99 stays under it.
+
+    Args:
+        target_p99_ms (float): Latency budget for one hash
+        memory_cost (int): Starting memory cost in KiB
+        parallelism (int): Lanes to hash with
+        samples (int): Hashes timed per candidate
+        max_time_cost (int): Upper bound on passes
+
+    Returns:
+        Dict[str, Any]: time_cost, memory_cost, parallelism and the measured p99_ms
+    """
+    params = {'time_cost': 1, 'memory_cost': memory_cost, 'parallelism': parallelism}
+    p99 = percentile(measure_hash_latency(params, samples), 99)
+    while p99 > target_p99_ms and params['memory_cost'] // 2 >= 8 * parallelism:
+        params['memory_cost'] //= 2
+        p99 = percentile(measure_hash_latency(params, samples), 99)
+
+    while params['time_cost'] < max_time_cost:
+        candidate = dict(params, time_cost=params['time_cost'] + 1)
+        candidate_p99 = percentile(measure_hash_latency(candidate, samples), 99)
+        if candidate_p99 > target_p99_ms:
+            break
+        params, p99 = candidate, candidate_p99
+
+    return dict(params, p99_ms=round(p99, 2))
+
+
+_executor: Optional[HashingExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_hash_executor() -> HashingExecutor:
+    """Return the process-wide hashing executor built from settings"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = HashingExecutor(
+                    workers=hash_workers,
+                    queue_size=hash_queue_size,
+                    mode=hash_executor_mode,
+                    queue_timeout=hash_queue_timeout,
+                    start_method=hash_start_method,
+                )
+    return _executor
+
+
+def _reset_after_fork() -> None:
+    global _executor_lock
+    _executor_lock = threading.Lock()
+    if _executor is not None:
+        _executor._forget_pool()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,334 @@
+"""Module to generate SusDB load for capacity tests.
+
+``run`` drives a weighted mix of operations from a pool of worker threads
+against a target, either the managers in this process or a running server,
+for a fixed duration after a warmup. Keys are drawn uniformly or with a
+zipfian skew over a pool of pre-created boxes. With a rate limit, each call
+is scheduled at a fixed interval and its latency is measured from the
+scheduled time, so a stalled server shows up in the tail instead of
+silently lowering the request rate.
+"""
+
+import bisect
+import itertools
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from hashing import percentile
+
+OPERATIONS = ('store', 'verify', 'view', 'retrieve', 'recover', 'close')
+DEFAULT_MIX = 'verify=50,view=20,retrieve=10,store=10,recover=5,close=5'
+FETCH_ERRORS = (None, 'Associated key not found', 'System Error while fetching')
+
+Account = Tuple[str, str, str]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse ``op=weight,...`` into a weight per operation.
+
+    Raises:
+        ValueError: For unknown operations or weights that are not positive numbers
+    """
+    mix: Dict[str, float] = {}
+    for part in spec.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+        if mix[name] <= 0:
+            raise ValueError(f"Weight of '{name}' must be positive")
+    return mix
+
+
+def manager_factory(backend: str) -> Callable[..., Any]:
+    """Return a callable building a manager of a backend for a uid, or for a new box"""
+    if backend == 'dbm':
+        from dbm_engine import UserDBManager
+        return lambda uid=None: UserDBManager(uid)
+    if backend == 'log':
+        from log_engine import UserDBManager
+        return lambda uid=None: UserDBManager(uid)
+    if backend == 's3':
+        from user_db_manager import UserDBManager
+        return lambda uid=None: UserDBManager(uid, accept_init=uid is None)
+    raise ValueError(f"Unknown backend '{backend}', expected dbm, log or s3")
+
+
+class InProcessTarget:
+    """Calls the UserDBManager of a backend directly"""
+
+    def __init__(self, backend: str = 's3') -> None:
+        self.name = f"in-process {backend}"
+        self.manager = manager_factory(backend)
+
+    def store(self, user_string: str) -> Optional[str]:
+        stored = self.manager().store_user_string({'request_string': user_string})
+        return stored.get('id') if stored else None
+
+    def view(self, uid: str) -> Optional[Dict[str, str]]:
+        view = self.manager(uid).display_user_db(uid)
+        return view if isinstance(view, dict) else None
+
+    def verify(self, uid: str, user_string: str) -> bool:
+        return self.manager(uid).verify_user({'uid': uid, 'request_string': user_string}) == 'Successful'
+
+    def retrieve(self, uid: str, key: str) -> bool:
+        return self.manager(uid).deserialize_data(uid, key) not in FETCH_ERRORS
+
+    def recover(self, uid: str, user_string: str) -> Optional[str]:
+        recovered = self.manager(uid).recover_account({'_id': uid, 'user_string': user_string})
+        return recovered.get('sus') if recovered else None
+
+    def close(self, uid: str, sus: str) -> bool:
+        return self.manager(uid).close_account({'uid': uid, 'sus': sus}) == 'Success'
+
+
+class HttpTarget:
+    """Calls the routes of a running main.py (or async_main.py) server"""
+
+    def __init__(self, base_url: str, timeout: float = 10.0) -> None:
+        self.name = base_url
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        import requests
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def store(self, user_string: str) -> Optional[str]:
+        from urls import STORE
+        return self._post(STORE, {'req': user_string, 'accept_init': 'true'}).get('uid')
+
+    def view(self, uid: str) -> Optional[Dict[str, str]]:
+        from urls import VIEW
+        view = self._post(VIEW, {'uid': uid}).get('db_view')
+        return view if isinstance(view, dict) else None
+
+    def verify(self, uid: str, user_string: str) -> bool:
+        from urls import VERIFY
+        return self._post(VERIFY, {'uid': uid, 'string': user_string}).get('status') == 'Successful'
+
+    def retrieve(self, uid: str, key: str) -> bool:
+        from urls import RETRIEVE
+        return self._post(RETRIEVE, {'uid': uid, 'key': key}).get('user_data') not in FETCH_ERRORS
+
+    def recover(self, uid: str, user_string: str) -> Optional[str]:
+        from urls import RECOVER
+        recovered = self._post(RECOVER, {'uid': uid, 'user_string': user_string}).get('response')
+        return recovered.get('sus') if isinstance(recovered, dict) else None
+
+    def close(self, uid: str, sus: str) -> bool:
+        from urls import CLOSE
+        return self._post(CLOSE, {'uid': uid, 'sus': sus}).get('response') == 'Success'
+
+
+class KeyChooser:
+    """Draws account indexes uniformly or with a zipfian skew (rank 1 is index 0)"""
+
+    def __init__(self, size: int, distribution: str = 'uniform', zipf_s: float = 1.0) -> None:
+        if distribution not in ('uniform', 'zipfian'):
+            raise ValueError(f"Unknown distribution '{distribution}'")
+        self.size = size
+        self.distribution = distribution
+        self._cumulative = list(itertools.accumulate(1 / rank ** zipf_s for rank in range(1, size + 1))) \
+            if distribution == 'zipfian' else []
+
+    def choose(self, rng: random.Random) -> int:
+        if self.distribution == 'uniform':
+            return rng.randrange(self.size)
+        return min(bisect.bisect_left(self._cumulative, rng.random() * self._cumulative[-1]), self.size - 1)
+
+
+class LoadReport:
+    """Latencies in milliseconds and failure counts per operation"""
+
+    def __init__(self, target: str, duration: float) -> None:
+        self.target = target
+        self.duration = duration
+        self.latencies: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        self.errors: Dict[str, int] = {name: 0 for name in OPERATIONS}
+        self.skipped = 0
+
+    def merge(self, latencies: Dict[str, List[float]], errors: Dict[str, int], skipped: int) -> None:
+        for name in OPERATIONS:
+            self.latencies[name].extend(latencies[name])
+            self.errors[name] += errors[name]
+        self.skipped += skipped
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per operation that ran, plus a total row"""
+        rows = []
+        everything = sorted(itertools.chain.from_iterable(self.latencies.values()))
+        for name, samples in list(self.latencies.items()) + [('total', everything)]:
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            rows.append({
+                'operation': name,
+                'count': len(ordered),
+                'errors': sum(self.errors.values()) if name == 'total' else self.errors[name],
+                'ops_per_s': len(ordered) / self.duration,
+                'p50_ms': percentile(ordered, 50),
+                'p90_ms': percentile(ordered, 90),
+                'p99_ms': percentile(ordered, 99),
+                'p999_ms': percentile(ordered, 99.9),
+                'max_ms': ordered[-1],
+            })
+        return rows
+
+    def histogram(self, width: int = 40) -> List[str]:
+        """Text histogram of every latency over 1-2-5 millisecond buckets"""
+        samples = sorted(itertools.chain.from_iterable(self.latencies.values()))
+        if not samples:
+            return []
+        bounds = [base * 10 ** exponent for exponent in range(-2, 6) for base in (1, 2, 5)]
+        counts = [0] * (len(bounds) + 1)
+        for latency in samples:
+            counts[bisect.bisect_left(bounds, latency)] += 1
+        first = next(i for i, count in enumerate(counts) if count)
+        last = max(i for i, count in enumerate(counts) if count)
+        peak = max(counts)
+        lines = []
+        for i in range(first, last + 1):
+            label = f"<= {bounds[i]:g} ms" if i < len(bounds) else f"> {bounds[-1]:g} ms"
+            bar = '#' * max(1 if counts[i] else 0, round(counts[i] / peak * width))
+            lines.append(f"{label:>14} {counts[i]:>9} {bar}")
+        return lines
+
+
+def create_accounts(target: Any, count: int, concurrency: int) -> List[Account]:
+    """Store boxes for the run to work on and read back their secured strings"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def create(_: int) -> Account:
+        user_string = f"load-{uuid.uuid4()}"
+        uid = target.store(user_string)
+        view = target.view(uid) if uid else None
+        if not view:
+            raise RuntimeError(f"Unable to create a box on {target.name}")
+        return uid, user_string, view['secured_user_string']
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(create, range(count)))
+
+
+def run(
+        target: Any,
+        mix: Dict[str, float],
+        accounts: List[Account],
+        concurrency: int = 8,
+        duration: float = 30.0,
+        warmup: float = 5.0,
+        rate: Optional[float] = None,
+        distribution: str = 'uniform',
+        zipf_s: float = 1.0,
+        seed: Optional[int] = None) \
+        -> LoadReport:
+    """Generate load and collect the latencies recorded after the warmup.
+
+    verify, view, retrieve and recover pick from ``accounts`` (recover keeps
+    each box's string, so verify keeps succeeding). close only takes boxes
+    created by store during the same run and is skipped while there are none.
+
+    Args:
+        target: InProcessTarget or HttpTarget
+        mix (Dict[str, float]): Weight per operation
+        accounts (List[Account]): Pre-created (uid, user string, secured string) boxes
+        concurrency (int): Worker threads
+        duration (float): Measured seconds, after the warmup
+        warmup (float): Seconds of load whose samples are discarded
+        rate (Optional[float]): Total calls per second, None for as fast as possible
+        distribution (str): ``uniform`` or ``zipfian`` over accounts
+        zipf_s (float): Zipf exponent, larger is more skewed
+        seed (Optional[int]): Seed for reproducible operation and key choices
+
+    Returns:
+        LoadReport: Samples of the measured window
+    """
+    names = list(mix)
+    cumulative = list(itertools.accumulate(mix[name] for name in names))
+    chooser = KeyChooser(len(accounts), distribution, zipf_s)
+    closable: Deque[Account] = deque()
+    ticket = itertools.count()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+    report = LoadReport(target.name, duration)
+    report_lock = threading.Lock()
+    seeds = random.Random(seed)
+    worker_seeds = [seeds.random() for _ in range(concurrency)]
+
+    def call(name: str, rng: random.Random) -> Optional[bool]:
+        if name == 'store':
+            user_string = f"load-{uuid.uuid4()}"
+            uid = target.store(user_string)
+            if uid is None:
+                return False
+            if 'close' in mix:
+                view = target.view(uid)
+                if view:
+                    closable.append((uid, user_string, view['secured_user_string']))
+            return True
+        if name == 'close':
+            try:
+                uid, _, sus = closable.popleft()
+            except IndexError:
+                return None
+            return target.close(uid, sus)
+        uid, user_string, _ = accounts[chooser.choose(rng)]
+        if name == 'verify':
+            return target.verify(uid, user_string)
+        if name == 'view':
+            return target.view(uid) is not None
+        if name == 'retrieve':
+            return target.retrieve(uid, 'created_on')
+        return target.recover(uid, user_string) is not None
+
+    def worker(worker_seed: float) -> None:
+        rng = random.Random(worker_seed)
+        latencies: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        errors = {name: 0 for name in OPERATIONS}
+        skipped = 0
+        while True:
+            if rate:
+                scheduled = start + next(ticket) / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.perf_counter()
+            if scheduled >= stop_at:
+                break
+            name = names[bisect.bisect_left(cumulative, rng.random() * cumulative[-1])]
+            try:
+                ok = call(name, rng)
+            except Exception:
+                ok = False
+            if ok is None:
+                skipped += 1
+                continue
+            if scheduled < measure_from:
+                continue
+            latencies[name].append((time.perf_counter() - scheduled) * 1000)
+            if not ok:
+                errors[name] += 1
+        with report_lock:
+            report.merge(latencies, errors, skipped)
+
+    threads = [threading.Thread(target=worker, args=(worker_seed,), daemon=True) for worker_seed in worker_seeds]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return report
@@ -0,0 +1,51 @@
+"""Log-structured alternative to dbm_engine.
+
+Boxes are appended to segment files under ``GET_PATH/logstore`` and found
+through an in-memory index (see ``log_store.LogStore``); every operation
+of ``dbm_engine.UserDBManager`` is available unchanged.
+"""
+import atexit
+import os
+
+from dbm_engine import UserDBManager as ShardedUserDBManager
+from log_store import LogStore
+from settings import (
+    get_path,
+    logstore_compact_interval,
+    logstore_compact_ratio,
+    logstore_fsync,
+    logstore_segment_bytes,
+)
+from sus_index import LocalSusIndex
+from uid_filter import DISABLED
+
+log_store = LogStore(
+    os.path.expanduser(get_path) if get_path else '',
+    segment_bytes=logstore_segment_bytes,
+    fsync=logstore_fsync,
+    compact_interval=logstore_compact_interval,
+    compact_ratio=logstore_compact_ratio,
+)
+os.register_at_fork(after_in_child=log_store._forget_handles)
+atexit.register(log_store.close)
+# Secured user string digest -> uid, in a log store of its own
+sus_log_store = LogStore(
+    os.path.join(os.path.expanduser(get_path), 'sus_index') if get_path else 'sus_index',
+    segment_bytes=logstore_segment_bytes,
+    fsync=logstore_fsync,
+    compact_interval=logstore_compact_interval,
+    compact_ratio=logstore_compact_ratio,
+)
+os.register_at_fork(after_in_child=sus_log_store._forget_handles)
+atexit.register(sus_log_store.close)
+
+
+class UserDBManager(ShardedUserDBManager):
+    """Main DB Manager for IRs, keeping each box as the latest entry for
+    its uid in the append-only ``log_store``."""
+
+    store = log_store
+    sus_index = LocalSusIndex(sus_log_store)
+    # The in-memory index of the log store already answers misses without I/O
+    uid_filter = DISABLED
+    metrics_backend = 'log'
@@ -0,0 +1,199 @@
+"""Module for the non-blocking logging pipeline of the storage managers.
+
+With LOG_QUEUE enabled, handlers returned by ``file_handler`` and ``queued``
+only put the record on an in-memory queue. A single listener thread drains
+the queue in batches, formats the records and writes them, flushing each
+target once per batch instead of once per line. When the queue is full,
+records are dropped and counted instead of blocking the request.
+
+Records are formatted on the listener thread, so log with lazy %-style
+arguments (``logger.info("... %s", uid)``) and pass values that are not
+mutated afterwards.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Dict, Optional
+
+from metrics import LOG_RECORDS_DROPPED
+from settings import (
+    log_backup_count,
+    log_batch_size,
+    log_info_sample_rate,
+    log_max_bytes,
+    log_queue,
+    log_queue_size,
+)
+
+FORMAT = '%(asctime)s - %(message)s'
+DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+_STOP = object()
+
+
+class InfoSampler(logging.Filter):
+    """Keep a fraction of INFO records; other levels always pass"""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno != logging.INFO or random.random() < self.rate
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that leaves flushing to the caller.
+
+    The file size is tracked in memory, in encoded bytes like ``maxBytes``,
+    since the stock rollover check seeks the stream and so flushes it on
+    every record.
+    """
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0, encoding: str = 'utf-8') -> None:
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding)
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record) + self.terminator
+            size = len(msg.encode(self.encoding or 'utf-8'))
+            if self.maxBytes > 0 and self._size and self._size + size >= self.maxBytes:
+                self.doRollover()
+                self._size = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self._size += size
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class QueuedHandler(QueueHandler):
+    """Hand records to the listener thread for ``target`` without formatting them"""
+
+    def __init__(self, target: logging.Handler) -> None:
+        super().__init__(None)
+        self.target = target
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        # logging.basicConfig formats through the handlers it is given
+        super().setFormatter(fmt)
+        if self.target.formatter is None:
+            self.target.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            _listener().queue.put_nowait((self.target, record))
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class BatchingListener:
+    """Thread writing queued records to their handlers, one flush per handler and batch"""
+
+    def __init__(self, maxsize: int, batch_size: int) -> None:
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.batch_size = batch_size
+        self._thread = threading.Thread(target=self._run, name='susdb-log-listener', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            touched = set()
+            stop = False
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                    continue
+                handler, record = item
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                    touched.add(handler)
+            for handler in touched:
+                handler.flush()
+            if stop:
+                return
+
+    def stop(self) -> None:
+        """Write what is queued and end the thread"""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+
+_lock = threading.Lock()
+_listener_instance: Optional[BatchingListener] = None
+_file_handlers: Dict[str, logging.Handler] = {}
+
+
+def _listener() -> BatchingListener:
+    global _listener_instance
+    if _listener_instance is None:
+        with _lock:
+            if _listener_instance is None:
+                _listener_instance = BatchingListener(log_queue_size, log_batch_size)
+    return _listener_instance
+
+
+def queued(target: logging.Handler) -> logging.Handler:
+    """Wrap ``target`` so emitting only enqueues (when LOG_QUEUE is on) and
+    routine INFO records are sampled at LOG_INFO_SAMPLE_RATE"""
+    handler = QueuedHandler(target) if log_queue else target
+    if log_info_sample_rate < 1.0:
+        handler.addFilter(InfoSampler(log_info_sample_rate))
+    return handler
+
+
+def file_handler(path: str, level: int = logging.DEBUG) -> logging.Handler:
+    """The process-wide handler for the log file at ``path``.
+
+    Loggers logging to the same file share one handler, so rotation is
+    done in one place.
+    """
+    key = os.path.abspath(path)
+    with _lock:
+        handler = _file_handlers.get(key)
+        if handler is None:
+            target_class = BatchedRotatingFileHandler if log_queue else RotatingFileHandler
+            target = target_class(path, maxBytes=log_max_bytes, backupCount=log_backup_count, encoding='utf-8')
+            target.setLevel(level)
+            target.setFormatter(logging.Formatter(FORMAT, DATE_FORMAT))
+            handler = _file_handlers[key] = queued(target)
+    return handler
+
+
+def shutdown() -> None:
+    """Flush and stop the listener thread"""
+    global _listener_instance
+    with _lock:
+        listener, _listener_instance = _listener_instance, None
+    if listener is not None:
+        listener.stop()
+
+
+def _reset_after_fork() -> None:
+    """Records queued in the parent belong to the parent; the child starts its own listener."""
+    global _lock, _listener_instance
+    _lock = threading.Lock()
+    _listener_instance = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(shutdown)
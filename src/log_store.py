@@ -0,0 +1,462 @@
+"""Module for the append-only, log-structured record store"""
+
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from record_format import RecordFormatError, decode_record, encode_record
+from store_lock import StoreLock, StoreLocked
+
+logger = logging.getLogger(__name__)
+
+# crc32, timestamp, key length, value length
+ENTRY_HEADER = struct.Struct('>IdHI')
+# key length, value length, value offset
+HINT_ENTRY = struct.Struct('>HIQ')
+# Value length marking a deleted key
+TOMBSTONE = 0xFFFFFFFF
+
+SegmentId = Tuple[int, int]
+IndexEntry = Tuple[SegmentId, int, int]
+HintEntry = Tuple[str, int, int]
+
+_SEGMENT_NAME = re.compile(r'^segment_(\d{8})_(\d{3})\.log$')
+
+
+def _entry_size(key: str, value_len: int) -> int:
+    """Bytes taken by one log entry"""
+    body = 0 if value_len == TOMBSTONE else value_len
+    return ENTRY_HEADER.size + len(key.encode('utf-8')) + body
+
+
+class LogStore:
+    """Bitcask-style store of user records.
+
+    Every write appends an entry (header with CRC, key, encoded record) to the
+    active segment file and points an in-memory index of uid to
+    (segment, offset, length) at it, so a read is one dictionary lookup and
+    one ``pread``. A closed account is a tombstone entry. When the active
+    segment reaches ``segment_bytes`` it is sealed and a hint file listing
+    its keys and offsets is written next to it, which lets a restart rebuild
+    the index without reading the values.
+
+    A background thread merges the sealed segments once at least
+    ``compact_ratio`` of their bytes belong to overwritten or closed boxes.
+    The merged segment is named with the highest merged id and a higher
+    generation; on open, any segment older than a finished merge is
+    discarded, so an interrupted compaction never resurrects data.
+
+    Like the dbm shards, the files are owned by one process at a time: opening
+    the store locks its directory, and another process opening it gets
+    ``StoreLocked``. Every read checks the entry's CRC and key, so a damaged
+    entry raises ``RecordFormatError`` instead of returning a corrupt record.
+    """
+
+    def __init__(
+            self,
+            root: str,
+            segment_bytes: int = 64 * 1024 * 1024,
+            fsync: bool = False,
+            compact_interval: float = 60.0,
+            compact_ratio: float = 0.5) \
+            -> None:
+        self.root = os.path.join(root, 'logstore')
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.compact_interval = compact_interval
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._owner = StoreLock(self.root)
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._opened = False
+        self._index: Dict[str, IndexEntry] = {}
+        self._fds: Dict[SegmentId, int] = {}
+        self._sizes: Dict[SegmentId, int] = {}
+        self._dead: Dict[SegmentId, int] = {}
+        self._active: SegmentId = (0, 0)
+        self._active_hints: List[HintEntry] = []
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+
+    def _path(self, segment: SegmentId) -> str:
+        return os.path.join(self.root, f"segment_{segment[0]:08d}_{segment[1]:03d}.log")
+
+    def _hint_path(self, segment: SegmentId) -> str:
+        return self._path(segment)[:-len('.log')] + '.hint'
+
+    def _ensure_open(self) -> None:
+        if self._opened:
+            return
+        with self._lock:
+            if self._opened:
+                return
+            self._load()
+            self._opened = True
+            if self.compact_interval > 0:
+                self._compactor = threading.Thread(
+                    target=self._run_compactor, name='logstore-compactor', daemon=True)
+                self._compactor.start()
+
+    def _load(self) -> None:
+        """Rebuild the index from hint files, scanning segments that have none"""
+        self._owner.acquire()
+        segments = []
+        for name in os.listdir(self.root):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.root, name))
+                continue
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                segments.append((int(match.group(1)), int(match.group(2))))
+        segments.sort()
+
+        live = []
+        for segment in segments:
+            if any(other[1] > segment[1] and other[0] >= segment[0] for other in segments):
+                # Superseded by a compaction that finished before the files were removed
+                self._remove_segment_files(segment)
+            else:
+                live.append(segment)
+
+        last = live[-1] if live else None
+        reuse_last = last is not None and last[1] == 0 and os.path.getsize(self._path(last)) < self.segment_bytes
+        for segment in live:
+            entries = self._read_hints(segment) if os.path.exists(self._hint_path(segment)) else None
+            has_hints = entries is not None and self._hints_end(entries) == os.path.getsize(self._path(segment))
+            if not has_hints:
+                entries = self._scan(segment)
+            self._fds[segment] = os.open(self._path(segment), os.O_RDONLY)
+            self._sizes[segment] = os.fstat(self._fds[segment]).st_size
+            self._dead[segment] = 0
+            for key, value_len, offset in entries:
+                self._apply(segment, key, value_len, offset)
+            if reuse_last and segment == last:
+                # Keep appending to the segment the previous run was writing
+                os.close(self._fds[last])
+                self._fds[last] = os.open(self._path(last), os.O_RDWR | os.O_APPEND)
+                self._active = last
+                self._active_hints = entries
+                if os.path.exists(self._hint_path(last)):
+                    os.remove(self._hint_path(last))
+            elif not has_hints:
+                self._write_hints(segment, entries)
+
+        if not reuse_last:
+            self._open_active((last[0] + 1, 0) if last else (1, 0))
+        logger.info("[LOGSTORE] Opened %s segments with %s boxes from %s", len(self._fds), len(self._index), self.root)
+
+    def _scan(self, segment: SegmentId) -> List[HintEntry]:
+        """Read a segment entry by entry, truncating it at the first damaged entry"""
+        path = self._path(segment)
+        entries: List[HintEntry] = []
+        offset = 0
+        with open(path, 'rb') as log_file:
+            while True:
+                header = log_file.read(ENTRY_HEADER.size)
+                if len(header) < ENTRY_HEADER.size:
+                    break
+                crc, _, key_len, value_len = ENTRY_HEADER.unpack(header)
+                body_len = key_len + (0 if value_len == TOMBSTONE else value_len)
+                body = log_file.read(body_len)
+                if len(body) < body_len or zlib.crc32(header[4:] + body) != crc:
+                    break
+                entries.append((body[:key_len].decode('utf-8'), value_len, offset + ENTRY_HEADER.size + key_len))
+                offset += ENTRY_HEADER.size + body_len
+        if offset < os.path.getsize(path):
+            logger.warning("[LOGSTORE] Damaged entry in %s at byte %s, truncating", path, offset)
+            os.truncate(path, offset)
+        return entries
+
+    def _read_hints(self, segment: SegmentId) -> List[HintEntry]:
+        with open(self._hint_path(segment), 'rb') as hint_file:
+            data = hint_file.read()
+        entries: List[HintEntry] = []
+        position = 0
+        while position < len(data):
+            key_len, value_len, offset = HINT_ENTRY.unpack_from(data, position)
+            position += HINT_ENTRY.size
+            entries.append((data[position:position + key_len].decode('utf-8'), value_len, offset))
+            position += key_len
+        return entries
+
+    @staticmethod
+    def _hints_end(entries: List[HintEntry]) -> int:
+        """Offset just past the last entry a hint file describes"""
+        if not entries:
+            return 0
+        _, value_len, offset = entries[-1]
+        return offset + (0 if value_len == TOMBSTONE else value_len)
+
+    def _write_hints(self, segment: SegmentId, entries: List[HintEntry], fsync: bool = False) -> None:
+        path = self._hint_path(segment)
+        with open(path + '.tmp', 'wb') as hint_file:
+            for key, value_len, offset in entries:
+                encoded = key.encode('utf-8')
+                hint_file.write(HINT_ENTRY.pack(len(encoded), value_len, offset) + encoded)
+            if fsync or self.fsync:
+                hint_file.flush()
+                os.fsync(hint_file.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _remove_segment_files(self, segment: SegmentId) -> None:
+        for path in (self._path(segment), self._hint_path(segment)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _open_active(self, segment: SegmentId) -> None:
+        self._fds[segment] = os.open(self._path(segment), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._sizes[segment] = 0
+        self._dead[segment] = 0
+        self._active = segment
+        self._active_hints = []
+
+    def _rotate(self) -> None:
+        """Seal the active segment and start the next one"""
+        self._write_hints(self._active, self._active_hints)
+        self._open_active((self._active[0] + 1, 0))
+
+    def _apply(self, segment: SegmentId, key: str, value_len: int, offset: int) -> None:
+        """Point the index at an entry, counting whatever it replaces as dead"""
+        previous = self._index.pop(key, None)
+        if previous is not None and previous[0] in self._dead:
+            self._dead[previous[0]] += _entry_size(key, previous[2])
+        if value_len == TOMBSTONE:
+            self._dead[segment] += _entry_size(key, value_len)
+        else:
+            self._index[key] = (segment, offset, value_len)
+
+    def _append(self, key: str, value: Optional[bytes]) -> None:
+        """Append an entry to the active segment, a tombstone if value is None"""
+        if self._sizes[self._active] >= self.segment_bytes:
+            self._rotate()
+        encoded = key.encode('utf-8')
+        value_len = TOMBSTONE if value is None else len(value)
+        fields = ENTRY_HEADER.pack(0, time.time(), len(encoded), value_len)[4:]
+        body = encoded + (value or b'')
+        entry = struct.pack('>I', zlib.crc32(fields + body)) + fields + body
+        fd = self._fds[self._active]
+        written = 0
+        while written < len(entry):
+            written += os.write(fd, entry[written:])
+        if self.fsync:
+            os.fsync(fd)
+        offset = self._sizes[self._active] + ENTRY_HEADER.size + len(encoded)
+        self._sizes[self._active] += len(entry)
+        self._active_hints.append((key, value_len, offset))
+        self._apply(self._active, key, value_len, offset)
+
+    def _read(self, key: str) -> Optional[Dict[str, str]]:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        segment, offset, value_len = entry
+        encoded = key.encode('utf-8')
+        start = offset - ENTRY_HEADER.size - len(encoded)
+        raw = os.pread(self._fds[segment], offset + value_len - start, start)
+        crc = ENTRY_HEADER.unpack_from(raw)[0] if len(raw) >= ENTRY_HEADER.size else None
+        if (len(raw) != offset + value_len - start or zlib.crc32(raw[4:]) != crc
+                or raw[ENTRY_HEADER.size:ENTRY_HEADER.size + len(encoded)] != encoded):
+            raise RecordFormatError(f"Damaged entry for {key} in {self._path(segment)} at byte {start}")
+        return decode_record(raw[ENTRY_HEADER.size + len(encoded):])
+
+    def path_for(self, uid: str) -> str:
+        """Path of the segment holding a uid, the active one if it has no box"""
+        self._ensure_open()
+        with self._lock:
+            entry = self._index.get(uid)
+            return self._path(entry[0] if entry else self._active)
+
+    def get(self, uid: str) -> Optional[Dict[str, str]]:
+        """Read a record, None if the uid has no box"""
+        self._ensure_open()
+        with self._lock:
+            return self._read(uid)
+
+    def contains(self, uid: str) -> bool:
+        """Whether the uid has a box"""
+        self._ensure_open()
+        return uid in self._index
+
+    def put(self, uid: str, record: Dict[str, str]) -> None:
+        """Write a record, replacing any existing one"""
+        self._ensure_open()
+        with self._lock:
+            self._append(uid, encode_record(record))
+
+    def create(self, uid: str, record: Dict[str, str]) -> bool:
+        """Write a record only if the uid has no box yet.
+
+        Returns:
+            bool: True if the record was created
+        """
+        self._ensure_open()
+        with self._lock:
+            if uid in self._index:
+                return False
+            self._append(uid, encode_record(record))
+            return True
+
+    def update(
+            self,
+            uid: str,
+            change: Callable[[Dict[str, str]], Optional[Dict[str, str]]]) \
+            -> Optional[Dict[str, str]]:
+        """Read-modify-write a record under the store lock.
+
+        Args:
+            uid (str): Box to change
+            change (Callable): Receives the current record and returns the
+                record to write, or None to leave it untouched
+
+        Returns:
+            Optional[Dict[str, str]]: The written record, None if nothing was written
+        """
+        self._ensure_open()
+        with self._lock:
+            record = self._read(uid)
+            if record is None:
+                return None
+            record = change(record)
+            if record is None:
+                return None
+            self._append(uid, encode_record(record))
+            return record
+
+    def delete(self, uid: str) -> bool:
+        """Close a box by appending a tombstone.
+
+        Returns:
+            bool: True if a record was removed
+        """
+        self._ensure_open()
+        with self._lock:
+            if uid not in self._index:
+                return False
+            self._append(uid, None)
+            return True
+
+    def uids(self) -> Iterator[str]:
+        """Iterate over every uid with a box"""
+        self._ensure_open()
+        with self._lock:
+            keys = list(self._index)
+        yield from keys
+
+    def stats(self) -> Dict[str, Any]:
+        """Segment count, live boxes and byte counters"""
+        self._ensure_open()
+        with self._lock:
+            return {
+                'segments': len(self._fds),
+                'boxes': len(self._index),
+                'bytes': sum(self._sizes.values()),
+                'dead_bytes': sum(self._dead.values()),
+            }
+
+    def _should_compact(self) -> bool:
+        with self._lock:
+            sealed = [segment for segment in self._sizes if segment != self._active]
+            total = sum(self._sizes[segment] for segment in sealed)
+            dead = sum(self._dead[segment] for segment in sealed)
+        return total > 0 and dead / total >= self.compact_ratio
+
+    def compact(self) -> bool:
+        """Merge the sealed segments into one holding only live records.
+
+        Writes keep going to the active segment while the live entries are
+        copied; entries overwritten meanwhile stay in the index as written.
+
+        Returns:
+            bool: True if any segment was merged
+        """
+        self._ensure_open()
+        with self._compact_lock:
+            with self._lock:
+                sealed = sorted(segment for segment in self._fds if segment != self._active)
+                if not sealed:
+                    return False
+                live = sorted(
+                    (segment, offset, value_len, key)
+                    for key, (segment, offset, value_len) in self._index.items()
+                    if segment != self._active
+                )
+            target = (sealed[-1][0], max(segment[1] for segment in sealed) + 1)
+
+            moved = []
+            hints: List[HintEntry] = []
+            size = 0
+            if live:
+                tmp_path = self._path(target) + '.tmp'
+                with open(tmp_path, 'wb') as merged:
+                    for segment, offset, value_len, key in live:
+                        key_len = len(key.encode('utf-8'))
+                        start = offset - ENTRY_HEADER.size - key_len
+                        merged.write(os.pread(self._fds[segment], offset + value_len - start, start))
+                        new_offset = size + ENTRY_HEADER.size + key_len
+                        hints.append((key, value_len, new_offset))
+                        moved.append((key, (segment, offset, value_len), (target, new_offset, value_len)))
+                        size = new_offset + value_len
+                    merged.flush()
+                    os.fsync(merged.fileno())
+                os.replace(tmp_path, self._path(target))
+                self._write_hints(target, hints, fsync=True)
+
+            with self._lock:
+                if live:
+                    self._fds[target] = os.open(self._path(target), os.O_RDONLY)
+                    self._sizes[target] = size
+                    self._dead[target] = 0
+                    for key, old, new in moved:
+                        if self._index.get(key) == old:
+                            self._index[key] = new
+                        else:
+                            self._dead[target] += _entry_size(key, old[2])
+                for segment in sealed:
+                    os.close(self._fds.pop(segment))
+                    self._sizes.pop(segment)
+                    self._dead.pop(segment)
+            # Oldest first, so a crash midway never leaves a value without its tombstone
+            for segment in sealed:
+                self._remove_segment_files(segment)
+            logger.info("[LOGSTORE] Compacted %s segments into %s, %s boxes kept", len(sealed), self._path(target), len(moved))
+            return True
+
+    def _run_compactor(self) -> None:
+        while not self._stop.wait(self.compact_interval):
+            try:
+                if self._should_compact():
+                    self.compact()
+            except OSError as e:
+                logger.error("[LOGSTORE] Compaction failed: %s", e)
+
+    def close(self) -> None:
+        """Stop compaction, write the active segment's hints and close every file"""
+        if not self._opened:
+            return
+        self._stop.set()
+        if self._compactor is not None and self._compactor is not threading.current_thread():
+            self._compactor.join()
+        with self._compact_lock, self._lock:
+            if self._active_hints:
+                self._write_hints(self._active, self._active_hints)
+            for fd in self._fds.values():
+                os.close(fd)
+            self._reset_state()
+            self._owner.release()
+
+    def _forget_handles(self) -> None:
+        """Drop inherited descriptors and threads in a forked child"""
+        for fd in self._fds.values():
+            os.close(fd)
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._owner.forget()
+        self._reset_state()
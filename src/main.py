@@ -1,11 +1,17 @@
-from flask import Flask, request, jsonify
+import time
+
+from flask import Flask, Response, g, request, jsonify
 from user_db_manager import UserDBManager
 import argon2
 import logging
+import metrics
+from admission import Overloaded, admission, admitted
+from log_pipeline import queued
 from urls import *
+from settings import batch_max_items, metrics_enabled
 app = Flask(__name__)
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG, handlers=[queued(logging.StreamHandler())])
 logger = logging.getLogger(__name__)
 
 def get_request_data():
@@ -24,7 +30,41 @@ def parse_accept_init(data):
     """Parse the accept_init parameter from request data."""
     return data.get('accept_init', '').lower() == 'true'
 
+@app.before_request
+def start_request_timer():
+    """Remember when the request started, for the request latency histogram."""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    """Record the request latency by route, method and status."""
+    started = g.get('request_started')
+    if metrics_enabled and started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started)
+    return response
+
+@app.errorhandler(Overloaded)
+def reject_overloaded(error):
+    """Shed a request that admission control did not admit, telling the client when to retry."""
+    response = jsonify({'error': str(error)})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.route(METRICS, methods=['GET'])
+def scrape_metrics():
+    """
+    Expose the metrics of this process in the Prometheus text format.
+
+    Returns:
+        The current counters and histograms, formatted only when scraped.
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route(STORE, methods=['POST'])
+@admitted('store')
 def store_user_string():
     """
     Store a user string in the database.
@@ -41,7 +81,32 @@ def store_user_string():
     uid = UserDBManager(accept_init=parse_accept_init(data)).store_user_string(req).get('id')
     return jsonify({'uid': uid})
 
+@app.route(STORE_BATCH, methods=['POST'])
+def store_user_strings():
+    """
+    Store a batch of user strings in the database.
+
+    This endpoint expects a POST request with a JSON body whose 'reqs' key holds a list of user strings.
+    Each string is stored in its own box. The batch takes one 'store' admission slot per
+    string, up to the whole limit, and is shed like a single store when there is no room.
+
+    Returns:
+        A JSON object whose 'results' list holds, in input order, either a 'uid' or an 'error' per string.
+    """
+    data = get_request_data()
+    user_strings = data.get('reqs')
+    if not isinstance(user_strings, list):
+        return jsonify({'error': "'reqs' must be a list of user strings"}), 400
+    if len(user_strings) > batch_max_items:
+        return jsonify({'error': f'Batch larger than {batch_max_items} items'}), 413
+    with admission('store', len(user_strings)):
+        results = UserDBManager.store_many(user_strings)
+    return jsonify({'results': [
+        {'uid': result['id']} if 'id' in result else result for result in results
+    ]})
+
 @app.route(VERIFY, methods=['POST'])
+@admitted('verify')
 def verify_user():
     """
     Verify a user's string in the database.
@@ -63,6 +128,29 @@ def verify_user():
     except argon2.exceptions.InvalidHashError:
         return jsonify({'error': 'Invalid parameters passed, Check uid or string'}), 400
 
+@app.route(VERIFY_BATCH, methods=['POST'])
+def verify_users():
+    """
+    Verify a batch of user strings in the database.
+
+    This endpoint expects a POST request with a JSON body whose 'reqs' key holds a list of
+    objects with 'uid' and 'string' keys.
+
+    Returns:
+        A JSON object whose 'statuses' list holds the verification status of each pair, in input order.
+        The batch takes one 'verify' admission slot per pair, up to the whole limit.
+    """
+    data = get_request_data()
+    pairs = data.get('reqs')
+    if not isinstance(pairs, list) or not all(isinstance(pair, dict) for pair in pairs):
+        return jsonify({'error': "'reqs' must be a list of objects with 'uid' and 'string'"}), 400
+    if len(pairs) > batch_max_items:
+        return jsonify({'error': f'Batch larger than {batch_max_items} items'}), 413
+    reqs = [{'request_string': pair.get('string'), 'uid': pair.get('uid')} for pair in pairs]
+    with admission('verify', len(reqs)):
+        statuses = UserDBManager.verify_many(reqs)
+    return jsonify({'statuses': statuses})
+
 @app.route(VIEW, methods=['POST'])
 def display_user_db():
     """
@@ -116,6 +204,7 @@ def remove_user_account():
     return jsonify({'response': response})
 
 @app.route(RECOVER, methods=['POST'])
+@admitted('recover')
 def recover_account():
     """
     Recover a user's account from the database.
@@ -133,6 +222,23 @@ def recover_account():
     response = UserDBManager(accept_init=parse_accept_init(data), uid=uid).recover_account(req)
     return jsonify({'response': response})
 
+def warm_up():
+    """
+    Do the one-off start-up work before the first request.
+
+    Builds the shared S3 client (credentials and endpoint resolved, no
+    connection opened) and runs one Argon2 hash and verify on this thread,
+    without starting the hashing pool. Under gunicorn this runs once in the
+    master: forked workers drop the inherited client but rebuild theirs from
+    the warm session in milliseconds.
+    """
+    from hashing import HashingExecutor, get_hash_executor
+    from s3_client import get_s3_client
+
+    get_s3_client()
+    hasher = HashingExecutor(mode='inline', params=get_hash_executor().params)
+    hasher.verify(hasher.hash('warm-up'), 'warm-up')
+
 if __name__ == '__main__':
     app.run(
         debug=False, 
@@ -0,0 +1,430 @@
+"""Module for in-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are plain Python objects updated under a small
+lock, so recording costs a dictionary lookup and a few additions; nothing
+is formatted until ``/metrics`` is scraped. Values that already live
+elsewhere (e.g. the record cache counters) are read by collectors at
+scrape time instead of being mirrored on every request.
+
+Values are kept per process. Under a pre-fork server each worker counts
+only the requests it served, and a scrape reaches whichever worker accepts
+it. With ``METRICS_DIR`` set, which gunicorn.conf.py does, every process
+saves its values to a snapshot file in that directory every few seconds.
+A scrape merges all the snapshots into one view of the whole server.
+Counters and histograms of exited workers are folded into one file, so
+totals never go backwards. Their gauges are dropped.
+"""
+
+import abc
+import atexit
+import bisect
+import fcntl
+import functools
+import glob
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from settings import metrics_dir, metrics_enabled, metrics_flush_seconds, metrics_pid_label
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SNAPSHOT_PREFIX = 'metrics_'
+EXITED_SNAPSHOT = 'metrics_exited.json'
+
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', '_bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the seconds spent in the ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric(abc.ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    @abc.abstractmethod
+    def _new_child(self) -> Any:
+        """New child holding the values of one combination of labels"""
+
+    def labels(self, *values: str) -> Any:
+        """Child for one combination of label values, created on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def samples(self) -> List[Sample]:
+        """Current ``(name, labels, value)`` samples of every child"""
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. S3 calls or bytes transferred"""
+
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        """Increment the unlabelled counter"""
+        self.labels().inc(amount)
+
+    def samples(self) -> List[Sample]:
+        return [
+            (self.name, dict(zip(self.labelnames, values)), child.value)
+            for values, child in list(self._children.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of durations in seconds over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS) \
+            -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def samples(self) -> List[Sample]:
+        samples: List[Sample] = []
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+def _merge(snapshots: Sequence[Sequence[Family]], gauges: bool = True) -> List[Family]:
+    """Sum the samples of several processes' families, label set by label set"""
+    merged: Dict[str, Tuple[str, str, Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[Any]]]] = {}
+    for families in snapshots:
+        for name, kind, documentation, samples in families:
+            if kind == 'gauge' and not gauges:
+                continue
+            totals = merged.setdefault(name, (kind, documentation, {}))[2]
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(sorted(labels.items())))
+                if key in totals:
+                    totals[key][2] += value
+                else:
+                    totals[key] = [sample_name, labels, value]
+    return [(name, kind, documentation, [tuple(sample) for sample in totals.values()])
+            for name, (kind, documentation, totals) in merged.items()]
+
+
+def _load(path: str) -> List[Family]:
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return []
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Every metric of the process plus callbacks sampled at scrape time.
+
+    Args:
+        pid_label (bool): Add the pid of the process rendering the text
+            as a ``pid`` label to every sample. Only for telling processes
+            apart while debugging: a scrape still reaches one worker, and
+            every restarted worker adds new series
+        directory (Optional[str]): Snapshot directory shared by the
+            processes of one server; ``render`` then merges all of them
+    """
+
+    def __init__(self, pid_label: bool = False, directory: Optional[str] = None) -> None:
+        self.pid_label = pid_label
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[Family]]] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], List[Family]]) -> None:
+        """Add a callback returning ``(name, kind, help, samples)`` families"""
+        self._collectors.append(collector)
+
+    def reset(self) -> None:
+        """Forget every recorded value, e.g. those a forked worker inherited from its parent"""
+        for metric in self._metrics:
+            metric._children = {}
+            metric._lock = threading.Lock()
+
+    def collect(self) -> List[Family]:
+        """Current families of this process"""
+        families = [(metric.name, metric.kind, metric.documentation, metric.samples()) for metric in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+        return families
+
+    def write_snapshot(self) -> None:
+        """Save the values of this process for scrapes answered by the others"""
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f'{SNAPSHOT_PREFIX}{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as snapshot_file:
+            json.dump(self.collect(), snapshot_file, separators=(',', ':'))
+        os.replace(f'{path}.tmp', path)
+
+    def _collect_directory(self) -> List[Family]:
+        """Families of every process that wrote to ``directory``, summed"""
+        assert self.directory is not None
+        self.write_snapshot()
+        lock_fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            self._fold_exited()
+            paths = sorted(glob.glob(os.path.join(self.directory, f'{SNAPSHOT_PREFIX}*.json')))
+            return _merge([_load(path) for path in paths])
+        finally:
+            os.close(lock_fd)
+
+    def _fold_exited(self) -> None:
+        """Move the counters and histograms of exited processes into one snapshot"""
+        assert self.directory is not None
+        exited = []
+        for path in glob.glob(os.path.join(self.directory, f'{SNAPSHOT_PREFIX}*.json')):
+            pid = os.path.basename(path)[len(SNAPSHOT_PREFIX):-len('.json')]
+            if pid.isdigit() and not _alive(int(pid)):
+                exited.append(path)
+        if not exited:
+            return
+        exited_path = os.path.join(self.directory, EXITED_SNAPSHOT)
+        families = _merge([_load(path) for path in [exited_path] + exited], gauges=False)
+        with open(f'{exited_path}.tmp', 'w') as snapshot_file:
+            json.dump(families, snapshot_file, separators=(',', ':'))
+        os.replace(f'{exited_path}.tmp', exited_path)
+        for path in exited:
+            os.remove(path)
+
+    def render(self) -> str:
+        """All metrics in the text exposition format, of every process sharing ``directory`` if set"""
+        if self.directory is not None:
+            families = self._collect_directory()
+            process = {}
+        else:
+            families = self.collect()
+            # Read at scrape time: a worker forked after import has its own pid
+            process = {'pid': str(os.getpid())} if self.pid_label else {}
+        lines = []
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(dict(labels, **process))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry(pid_label=metrics_pid_label, directory=metrics_dir if metrics_enabled else None)
+
+OPERATION_SECONDS = Histogram(
+    'susdb_operation_seconds', 'Time spent in a UserDBManager operation', ['backend', 'operation'])
+OPERATION_ERRORS = Counter(
+    'susdb_operation_errors_total', 'UserDBManager operations that raised', ['backend', 'operation'])
+STAGE_SECONDS = Histogram(
+    'susdb_stage_seconds', 'Time spent in one stage of an operation (S3 call, Argon2, record decode, ...)', ['stage'])
+S3_REQUESTS = Counter('susdb_s3_requests_total', 'S3 API calls by outcome', ['operation', 'status'])
+S3_BYTES = Counter('susdb_s3_bytes_total', 'Object bytes sent to and received from S3', ['direction'])
+HASH_QUEUE_FULL = Counter('susdb_hash_queue_full_total', 'Hashing calls rejected because the queue was full')
+COALESCED_CALLS = Counter(
+    'susdb_coalesced_calls_total', 'Calls that shared an identical call already in flight', ['operation'])
+UID_FILTER_REJECTIONS = Counter(
+    'susdb_uid_filter_rejections_total', 'Lookups answered as missing by the uid filter without storage I/O', ['filter'])
+REDIS_CACHE_EVENTS = Counter(
+    'susdb_redis_cache_events_total', 'Redis record cache lookups, writes, deletes and errors', ['event'])
+ADMISSION_REJECTIONS = Counter(
+    'susdb_admission_rejections_total', 'Requests shed by admission control, by route and status', ['route', 'status'])
+LOG_RECORDS_DROPPED = Counter('susdb_log_records_dropped_total', 'Log records dropped because the log queue was full')
+HTTP_REQUEST_SECONDS = Histogram(
+    'susdb_http_request_seconds', 'Time from request to response in the web app', ['route', 'method', 'status'])
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record the duration of a stage"""
+    if metrics_enabled:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the ``with`` block as a stage"""
+    if not metrics_enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def timed_operation(operation: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorate a manager method (sync or async) to record its latency and raised errors.
+
+    The backend label is the ``metrics_backend`` attribute of the instance
+    or class the method is called on.
+    """
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        if not metrics_enabled:
+            return fn
+
+        def record(owner: Any, started: float, failed: bool) -> None:
+            backend = getattr(owner, 'metrics_backend', 'unknown')
+            OPERATION_SECONDS.labels(backend, operation).observe(time.perf_counter() - started)
+            if failed:
+                OPERATION_ERRORS.labels(backend, operation).inc()
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(owner: Any, *args: Any, **kwargs: Any) -> Any:
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = await fn(owner, *args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    record(owner, started, failed)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(owner: Any, *args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = fn(owner, *args, **kwargs)
+                failed = False
+                return result
+            finally:
+                record(owner, started, failed)
+        return wrapper
+    return decorate
+
+
+def render() -> str:
+    """Current metrics in the text exposition format, merged across workers if METRICS_DIR is set"""
+    return REGISTRY.render()
+
+
+def _flush_periodically() -> None:
+    while True:
+        time.sleep(metrics_flush_seconds)
+        try:
+            REGISTRY.write_snapshot()
+        except OSError as e:
+            logger.warning("[METRICS] Unable to write the metrics snapshot: %s", e)
+
+
+def _start_flusher() -> None:
+    """Save this process's snapshot every METRICS_FLUSH_SECONDS"""
+    threading.Thread(target=_flush_periodically, name='susdb-metrics-flush', daemon=True).start()
+
+
+def _after_fork() -> None:
+    # The parent's snapshot already holds the values the child was forked with
+    REGISTRY.reset()
+    _start_flusher()
+
+
+if REGISTRY.directory is not None:
+    _start_flusher()
+    os.register_at_fork(after_in_child=_after_fork)
+    atexit.register(REGISTRY.write_snapshot)
@@ -6,10 +6,9 @@ from pydantic import FilePath
 from redis_om import EmbeddedJsonModel, JsonModel, Field, Migrator
 
 from settings import redis
-from user_db_manager import UserDBManager
 
 
-class User(JsonModel):
+class User(JsonModel, index=True):
     """User Model"""
     username: Optional[str] = Field(default='admin000')
     title: Optional[str]
@@ -0,0 +1,191 @@
+"""Module for reconciling boxes with the ``models.User`` records that point at them.
+
+A pass runs in two phases, each over large batches with one Redis
+pipeline round trip per batch:
+
+1. ``users``: SCAN the User keys, read their ``ir_id`` and check that the
+   box exists (in parallel). Users whose box is gone are orphans; the
+   ``ir_id`` of every other user goes into a scratch set in Redis.
+2. ``boxes``: walk every box of the backend in listing order and look its
+   uid up in that set with SMISMEMBER. Boxes no user points at are orphans.
+
+Nothing is changed unless ``apply=True``: then orphan users are deleted
+and a User record is created for each orphan box, in bulk. The SCAN
+cursor, the last box key and the counts are saved to a checkpoint after
+every batch, so a pass over millions of users can be spread over several
+maintenance windows with ``max_seconds`` and ``resume=True``.
+
+Users created or boxes stored while a pass is running may be reported
+as orphans; run it while writes are paused, or review a dry run first.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from transfer import Checkpoint, TransferError
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# The scratch set outlives an interrupted pass long enough to resume it
+SCRATCH_TTL = 7 * 24 * 3600
+
+
+def _batches(items: Iterator[str], size: int) -> Iterator[List[str]]:
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Reconciler:
+    """One reconciliation pass between a backend's boxes and User records.
+
+    Args:
+        boxes: Backend from ``transfer.open_backend``
+        client: Redis client holding the User records; defaults to the model's database
+        user_model: The redis_om model to reconcile, ``models.User`` by default
+        batch_size (int): Keys per SCAN, pipeline and checkpoint
+        concurrency (int): Parallel box existence checks
+        apply (bool): Delete orphan users and create users for orphan boxes
+    """
+
+    def __init__(
+            self,
+            boxes: Any,
+            client: Any = None,
+            user_model: Any = None,
+            batch_size: int = BATCH_SIZE,
+            concurrency: int = 32,
+            apply: bool = False) \
+            -> None:
+        if user_model is None:
+            from models import User
+            user_model = User
+        self.boxes = boxes
+        self.user_model = user_model
+        self.client = client if client is not None else user_model.db()
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.apply = apply
+        prefix = user_model.make_key('')
+        self.user_pattern = f"{prefix}*"
+        self.scratch_key = f"{prefix.split(':', 1)[0]}:reconcile:ir_ids:{boxes.name}"
+        self._box_batches: Optional[Iterator[List[str]]] = None
+
+    def _initial_state(self) -> Dict[str, Any]:
+        return {
+            'operation': 'reconcile', 'backend': self.boxes.name, 'apply': self.apply,
+            'phase': 'users', 'cursor': 0, 'last_key': None,
+            'users': 0, 'boxes': 0, 'orphan_users': 0, 'orphan_boxes': 0,
+            'deleted': 0, 'created': 0,
+        }
+
+    def run(
+            self,
+            checkpoint: Optional[str] = None,
+            resume: bool = False,
+            max_seconds: Optional[float] = None,
+            on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) \
+            -> Dict[str, Any]:
+        """Run the pass, or continue the one recorded in ``checkpoint``.
+
+        Args:
+            checkpoint (Optional[str]): File recording progress after every batch
+            resume (bool): Continue the pass recorded in ``checkpoint``
+            max_seconds (Optional[float]): Stop after the batch that crosses this budget
+            on_progress: Called with the state after every batch
+
+        Raises:
+            TransferError: If the checkpoint belongs to another backend or mode
+
+        Returns:
+            Dict[str, Any]: Counts so far, the current ``phase`` ('done' once
+            complete) and the seconds taken by this run
+        """
+        tracker = Checkpoint(checkpoint)
+        state = self._initial_state()
+        previous = tracker.load() if resume else None
+        if previous is not None:
+            if any(previous.get(key) != state[key] for key in ('operation', 'backend', 'apply')):
+                raise TransferError(f"Checkpoint {checkpoint} belongs to another reconciliation")
+            state = previous
+        else:
+            self.client.delete(self.scratch_key)
+
+        started = time.perf_counter()
+        self._box_batches = None
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while state['phase'] != 'done':
+                if state['phase'] == 'users':
+                    self._users_batch(state, pool)
+                else:
+                    self._boxes_batch(state)
+                tracker.save(state)
+                if on_progress is not None:
+                    on_progress(state)
+                if deadline is not None and time.monotonic() >= deadline and state['phase'] != 'done':
+                    logger.info("[RECONCILE] Time budget used up in phase %s, resume from %s",
+                                state['phase'], checkpoint)
+                    break
+        if state['phase'] == 'done':
+            self.client.delete(self.scratch_key)
+        return dict(state, seconds=time.perf_counter() - started)
+
+    def _users_batch(self, state: Dict[str, Any], pool: ThreadPoolExecutor) -> None:
+        """Check one SCAN batch of users against the boxes"""
+        cursor, keys = self.client.scan(state['cursor'], match=self.user_pattern, count=self.batch_size)
+        if keys:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.json().get(key, '.ir_id')
+            ir_ids = pipe.execute(raise_on_error=False)
+            users = [(key, ir_id) for key, ir_id in zip(keys, ir_ids) if isinstance(ir_id, str)]
+            present = list(pool.map(self.boxes.exists, [ir_id for _, ir_id in users]))
+            orphans = [key for (key, _), exists in zip(users, present) if not exists]
+            known = [ir_id for (_, ir_id), exists in zip(users, present) if exists]
+
+            pipe = self.client.pipeline(transaction=False)
+            if known:
+                pipe.sadd(self.scratch_key, *known)
+            pipe.expire(self.scratch_key, SCRATCH_TTL)
+            if orphans and self.apply:
+                pipe.delete(*orphans)
+            pipe.execute()
+
+            state['users'] += len(users)
+            state['orphan_users'] += len(orphans)
+            if self.apply:
+                state['deleted'] += len(orphans)
+            for key in orphans:
+                logger.info("[RECONCILE] User %s points at a missing box", key)
+        state['cursor'] = int(cursor)
+        if state['cursor'] == 0:
+            state['phase'] = 'boxes'
+
+    def _boxes_batch(self, state: Dict[str, Any]) -> None:
+        """Check one batch of boxes against the users seen in the first phase"""
+        if self._box_batches is None:
+            self._box_batches = _batches(self.boxes.keys(state['last_key']), self.batch_size)
+        batch = next(self._box_batches, [])
+        if not batch:
+            state['phase'] = 'done'
+            return
+        members = self.client.smismember(self.scratch_key, batch)
+        orphans = [uid for uid, member in zip(batch, members) if not member]
+        if orphans and self.apply:
+            pipe = self.client.pipeline(transaction=False)
+            self.user_model.add([self.user_model(ir_id=uid) for uid in orphans], pipeline=pipe)
+            pipe.execute()
+            state['created'] += len(orphans)
+        for uid in orphans:
+            logger.info("[RECONCILE] Box %s has no user", uid)
+        state['boxes'] += len(batch)
+        state['orphan_boxes'] += len(orphans)
+        state['last_key'] = batch[-1]
+
@@ -0,0 +1,156 @@
+"""Module holding the in-process cache of decoded user records"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+
+from metrics import REGISTRY
+from settings import record_cache_size, record_cache_ttl
+
+# Invalidation counters are kept per stripe of keys so the table stays bounded
+EPOCH_STRIPES = 4096
+
+
+class CachedRecord(NamedTuple):
+    """A decoded record with the ETag it was read at"""
+    record: Dict[str, str]
+    etag: Optional[str]
+    stored_at: float
+    fresh: bool
+
+
+class RecordCache:
+    """Bounded LRU cache of decoded records with a freshness TTL.
+
+    Entries younger than ``ttl`` seconds are served without I/O. Older
+    entries are kept so the caller can revalidate them with a conditional
+    GET on the stored ETag instead of fetching and decoding the body again.
+
+    Each key has an epoch that moves on whenever it is invalidated. A
+    reader takes it with ``epoch_of`` before its fetch and hands it to
+    ``put``, which drops the record if a write or delete invalidated that key
+    meanwhile, so a read racing a write never caches the body the write
+    replaced. Keys share epochs by stripe, so a write to another key in the
+    same stripe at most costs a concurrent read its fill.
+
+    The cache is per process: a write in another worker is only seen once
+    the entry goes stale. Reads that authenticate or change a box
+    (verification, recovery, close) pass ``fresh`` entries to a conditional
+    GET instead of trusting them.
+    """
+
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: float,
+            clock: Callable[[], float] = time.monotonic) \
+            -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: 'OrderedDict[str, CachedRecord]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._epochs = [0] * EPOCH_STRIPES
+
+    def epoch_of(self, key: str) -> int:
+        """Current invalidation epoch of ``key``, taken before reading it"""
+        return self._epochs[hash(key) % EPOCH_STRIPES]
+
+    def get(self, key: str) -> Optional[CachedRecord]:
+        """Look up a record.
+
+        Args:
+            key (str): Cache key, the box file name
+
+        Returns:
+            Optional[CachedRecord]: The entry (``fresh`` tells whether it may be
+            served as is), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if self._clock() - entry.stored_at < self.ttl:
+                self.hits += 1
+                return entry._replace(record=dict(entry.record), fresh=True)
+            self.stale += 1
+            return entry._replace(record=dict(entry.record), fresh=False)
+
+    def put(self, key: str, record: Dict[str, str], etag: Optional[str], epoch: Optional[int] = None) -> None:
+        """Insert or replace a record, evicting the least recently used ones.
+
+        Args:
+            epoch (Optional[int]): ``epoch_of(key)`` taken before the record was
+                read; the record is not cached if the key was invalidated since
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if epoch is not None and epoch != self._epochs[hash(key) % EPOCH_STRIPES]:
+                return
+            self._entries[key] = CachedRecord(dict(record), etag, self._clock(), True)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revalidated(self, key: str) -> None:
+        """Mark an entry fresh again after a 304 Not Modified."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = entry._replace(stored_at=self._clock())
+                self.revalidations += 1
+
+    def invalidate(self, key: str) -> None:
+        """Drop a record after it was written or deleted."""
+        with self._lock:
+            self._epochs[hash(key) % EPOCH_STRIPES] += 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every record"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Counters used to size the cache"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+record_cache = RecordCache(record_cache_size, record_cache_ttl)
+
+
+def _collect_metrics():
+    """Expose the cache counters at scrape time"""
+    stats = record_cache.stats()
+    events = ('hits', 'misses', 'stale', 'revalidations', 'evictions', 'invalidations')
+    return [
+        ('susdb_record_cache_entries', 'gauge', 'Records held by the record cache',
+         [('susdb_record_cache_entries', {}, stats['size'])]),
+        ('susdb_record_cache_events_total', 'counter', 'Record cache lookups and maintenance by event',
+         [('susdb_record_cache_events_total', {'event': event}, stats[event]) for event in events]),
+    ]
+
+
+REGISTRY.register_collector(_collect_metrics)
@@ -0,0 +1,221 @@
+"""Module to encode user records in a compact, versioned binary form.
+
+A record is the four string fields of a box: ``_id``, ``hash_string``,
+``secured_user_string`` and ``created_on``. Version 1 lays them out as::
+
+    b'SU' | version (1 byte) | flags (1 byte)
+    _id                 16 raw UUID bytes, or a length-prefixed string
+    created_on          int64 microseconds since the epoch, or a length-prefixed string
+    hash_string         Argon2 type, version, m, t, p, raw salt and raw hash,
+                        or a length-prefixed string
+    secured_user_string length-prefixed string
+
+Each flag says whether its field was packed; fields that would not
+round-trip exactly (an empty box, a non-UUID uid, ...) keep their text
+form. Anything that is not a four-field record of strings is written as
+JSON, and ``decode_record`` reads legacy JSON objects as well.
+"""
+
+import binascii
+import datetime
+import json
+import re
+import struct
+from typing import Dict, Optional, Tuple
+
+from settings import record_format
+
+MAGIC = b'SU'
+VERSION = 1
+FIELDS = ('_id', 'hash_string', 'secured_user_string', 'created_on')
+
+FLAG_UUID = 0x01
+FLAG_TIMESTAMP = 0x02
+FLAG_ARGON2 = 0x04
+
+_HEADER = struct.Struct('>2sBB')
+_LENGTH = struct.Struct('>H')
+_TIMESTAMP = struct.Struct('>q')
+# type, version, memory cost, time cost, parallelism
+_ARGON2_PARAMS = struct.Struct('>BBIIB')
+
+_ARGON2_TYPES = ('argon2i', 'argon2d', 'argon2id')
+_ARGON2_HASH = re.compile(
+    r'^\$(argon2id|argon2i|argon2d)\$v=(\d+)\$m=(\d+),t=(\d+),p=(\d+)\$([A-Za-z0-9+/]+)\$([A-Za-z0-9+/]+)$'
+)
+_CANONICAL_UUID = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+_NAIVE_ISOFORMAT = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{6})?$')
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class RecordFormatError(ValueError):
+    """Raised when a stored record cannot be decoded"""
+
+
+def _b64decode(text: str) -> bytes:
+    return binascii.a2b_base64(text + '=' * (-len(text) % 4))
+
+
+def _b64encode(raw: bytes) -> str:
+    return binascii.b2a_base64(raw, newline=False).rstrip(b'=').decode('ascii')
+
+
+def _pack_text(text: str) -> bytes:
+    encoded = text.encode('utf-8')
+    return _LENGTH.pack(len(encoded)) + encoded
+
+
+def _unpack_text(data: bytes, position: int) -> Tuple[str, int]:
+    (length,) = _LENGTH.unpack_from(data, position)
+    position += _LENGTH.size
+    return data[position:position + length].decode('utf-8'), position + length
+
+
+def _pack_uid(uid: str) -> Optional[bytes]:
+    if _CANONICAL_UUID.match(uid) is None:
+        return None
+    return bytes.fromhex(uid.replace('-', ''))
+
+
+def _unpack_uid(raw: bytes) -> str:
+    text = raw.hex()
+    return f"{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}"
+
+
+def _pack_timestamp(created_on: str) -> Optional[bytes]:
+    # isoformat() writes six fraction digits unless they are all zero, so
+    # anything this pattern accepts comes back unchanged
+    if _NAIVE_ISOFORMAT.match(created_on) is None or created_on.endswith('.000000'):
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(created_on)
+    except ValueError:
+        return None
+    return _TIMESTAMP.pack((moment - _EPOCH) // _MICROSECOND)
+
+
+def _pack_argon2(hash_string: str) -> Optional[bytes]:
+    match = _ARGON2_HASH.match(hash_string)
+    if match is None:
+        return None
+    variant, version, memory_cost, time_cost, parallelism, salt, digest = match.groups()
+    salt_raw, digest_raw = _b64decode(salt), _b64decode(digest)
+    if _b64encode(salt_raw) != salt or _b64encode(digest_raw) != digest \
+            or version[0] == '0' or memory_cost[0] == '0' or time_cost[0] == '0' or parallelism[0] == '0':
+        # Not in the canonical form argon2 writes, so it would not round-trip
+        return None
+    try:
+        return (
+            _ARGON2_PARAMS.pack(_ARGON2_TYPES.index(variant), int(version), int(memory_cost),
+                                int(time_cost), int(parallelism))
+            + bytes((len(salt_raw),)) + salt_raw + bytes((len(digest_raw),)) + digest_raw
+        )
+    except (struct.error, ValueError):
+        return None
+
+
+def _unpack_argon2(data: bytes, position: int) -> Tuple[str, int]:
+    variant, version, memory_cost, time_cost, parallelism = _ARGON2_PARAMS.unpack_from(data, position)
+    position += _ARGON2_PARAMS.size
+    salt_len = data[position]
+    salt = data[position + 1:position + 1 + salt_len]
+    position += 1 + salt_len
+    digest_len = data[position]
+    digest = data[position + 1:position + 1 + digest_len]
+    position += 1 + digest_len
+    hash_string = (
+        f"${_ARGON2_TYPES[variant]}$v={version}$m={memory_cost},t={time_cost},p={parallelism}"
+        f"${_b64encode(salt)}${_b64encode(digest)}"
+    )
+    return hash_string, position
+
+
+def encode_record(record: Dict[str, str], fmt: Optional[str] = None) -> bytes:
+    """Encode a record for storage.
+
+    Args:
+        record (Dict[str, str]): The box to encode
+        fmt (Optional[str]): ``binary`` or ``json``, defaults to RECORD_FORMAT
+
+    Returns:
+        bytes: The stored representation
+    """
+    fmt = fmt or record_format
+    if fmt != 'binary' or set(record) != set(FIELDS) \
+            or not all(isinstance(value, str) for value in record.values()):
+        return json.dumps(record).encode('utf-8')
+
+    flags = 0
+    parts = []
+    uid = _pack_uid(record['_id'])
+    if uid is not None:
+        flags |= FLAG_UUID
+        parts.append(uid)
+    else:
+        parts.append(_pack_text(record['_id']))
+
+    created_on = _pack_timestamp(record['created_on'])
+    if created_on is not None:
+        flags |= FLAG_TIMESTAMP
+        parts.append(created_on)
+    else:
+        parts.append(_pack_text(record['created_on']))
+
+    hash_string = _pack_argon2(record['hash_string'])
+    if hash_string is not None:
+        flags |= FLAG_ARGON2
+        parts.append(hash_string)
+    else:
+        parts.append(_pack_text(record['hash_string']))
+
+    parts.append(_pack_text(record['secured_user_string']))
+    return _HEADER.pack(MAGIC, VERSION, flags) + b''.join(parts)
+
+
+def decode_record(data: bytes) -> Dict[str, str]:
+    """Decode a stored record, binary or legacy JSON.
+
+    Raises:
+        RecordFormatError: If the record has an unknown version or is truncated
+
+    Returns:
+        Dict[str, str]: The box
+    """
+    if data[:2] != MAGIC:
+        return json.loads(data)
+    try:
+        _, version, flags = _HEADER.unpack_from(data, 0)
+        if version != VERSION:
+            raise RecordFormatError(f"Unsupported record version {version}")
+        position = _HEADER.size
+
+        if flags & FLAG_UUID:
+            uid = _unpack_uid(data[position:position + 16])
+            position += 16
+        else:
+            uid, position = _unpack_text(data, position)
+
+        if flags & FLAG_TIMESTAMP:
+            (micros,) = _TIMESTAMP.unpack_from(data, position)
+            created_on = (_EPOCH + micros * _MICROSECOND).isoformat()
+            position += _TIMESTAMP.size
+        else:
+            created_on, position = _unpack_text(data, position)
+
+        if flags & FLAG_ARGON2:
+            hash_string, position = _unpack_argon2(data, position)
+        else:
+            hash_string, position = _unpack_text(data, position)
+
+        secured_user_string, position = _unpack_text(data, position)
+    except RecordFormatError:
+        raise
+    except (struct.error, IndexError, ValueError) as e:
+        raise RecordFormatError(f"Truncated or damaged record: {str(e)}") from e
+    return {
+        '_id': uid,
+        'hash_string': hash_string,
+        'secured_user_string': secured_user_string,
+        'created_on': created_on,
+    }
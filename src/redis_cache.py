@@ -0,0 +1,213 @@
+"""Module holding the Redis tier of the record cache.
+
+Unlike ``record_cache``, which lives in one process, this tier is shared
+by every worker process and node using the same Redis, so a box read or
+stored by one of them is served to the others without an S3 GET. Each
+record is kept with the ETag it was stored at, under a TTL, and the tier
+sits between the in-process cache and S3:
+
+    record_cache -> Redis -> S3
+
+Stores and recoveries write through and closes leave a short-lived
+tombstone. Records read from S3 are only added when the key is empty
+(``SET NX``): a reader that fetched a box before a write or close finished
+cannot replace the newer entry, or the tombstone, with what it read.
+
+When Redis is unreachable, lookups fall through to S3 and the tier is
+skipped for a few seconds instead of adding a timeout to every request.
+Writes, tombstones and deletes are retried instead, then raise
+SharedCacheError. Callers fail the store, recovery or close, because
+otherwise the previous record would be served for up to the TTL once Redis
+is back.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import REDIS_CACHE_EVENTS
+from settings import redis_cache_enabled, redis_cache_prefix, redis_cache_tombstone_ttl, redis_cache_ttl
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 5.0
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 0.05
+TOMBSTONE = json.dumps({'closed': True})
+
+
+class SharedCacheError(RuntimeError):
+    """Raised when a write, tombstone or delete did not reach Redis"""
+
+
+class RedisRecordCache:
+    """Records cached in Redis under ``prefix + key`` for ``ttl`` seconds.
+
+    Args:
+        client: Redis client; defaults to ``settings.redis``, resolved on first use
+        ttl (int): Seconds a record is kept
+        tombstone_ttl (int): Seconds a closed box stays marked as closed
+        prefix (str): Namespace of the cache keys
+        clock (Callable[[], float]): Monotonic clock, for tests
+    """
+
+    enabled = True
+
+    def __init__(
+            self,
+            client: Any = None,
+            ttl: int = redis_cache_ttl,
+            tombstone_ttl: int = redis_cache_tombstone_ttl,
+            prefix: str = redis_cache_prefix,
+            clock: Callable[[], float] = time.monotonic) \
+            -> None:
+        self._client = client
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.prefix = prefix
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        # Imported here so the redis package only loads when the tier is on
+        from redis.exceptions import RedisError
+        self._errors = RedisError
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from settings import redis
+                    self._client = redis
+        return self._client
+
+    def _available(self) -> bool:
+        return self._clock() >= self._down_until
+
+    def _failed(self, action: str, error: Exception) -> None:
+        REDIS_CACHE_EVENTS.labels('error').inc()
+        if self._available():
+            logger.warning("[REDIS] %s failed, skipping Redis for %ss: %s", action, RETRY_SECONDS, error)
+        self._down_until = self._clock() + RETRY_SECONDS
+
+    def _must(self, action: str, call: Callable[[], Any]) -> None:
+        """Run a call that invalidates, retrying it a few times.
+
+        Raises:
+            SharedCacheError: If every attempt failed
+        """
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                call()
+                return
+            except self._errors as e:
+                error = e
+            if attempt + 1 < WRITE_ATTEMPTS:
+                time.sleep(WRITE_RETRY_DELAY * (attempt + 1))
+        self._failed(action, error)
+        raise SharedCacheError(f"{action} of a Redis cache entry failed: {error}") from error
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, str], Optional[str]]]:
+        """Look up a record.
+
+        Returns:
+            Optional[Tuple[Dict[str, str], Optional[str]]]: The record and its ETag,
+            or None on a miss, for a closed box or while Redis is unreachable
+        """
+        if not self._available():
+            return None
+        try:
+            value = self.client.get(self.prefix + key)
+        except self._errors as e:
+            self._failed('Lookup', e)
+            return None
+        if value is None:
+            REDIS_CACHE_EVENTS.labels('miss').inc()
+            return None
+        try:
+            entry = json.loads(value)
+            if entry.get('closed'):
+                REDIS_CACHE_EVENTS.labels('miss').inc()
+                return None
+            record, etag = entry['record'], entry.get('etag')
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("[REDIS] Dropping unreadable entry for %s: %s", key, e)
+            try:
+                self.delete(key)
+            except SharedCacheError:
+                pass
+            return None
+        REDIS_CACHE_EVENTS.labels('hit').inc()
+        return record, etag
+
+    def put(self, key: str, record: Dict[str, str], etag: Optional[str] = None, fill: bool = False) -> None:
+        """Store a record with the ETag S3 gave it.
+
+        Args:
+            fill (bool): The record was read rather than written. Fills only
+                set an empty key, so they never replace a write or a
+                tombstone, and are skipped while Redis is unreachable;
+                writes always replace the entry and are always attempted
+
+        Raises:
+            SharedCacheError: If a write, not a fill, did not reach Redis
+        """
+        value = json.dumps({'record': record, 'etag': etag}, separators=(',', ':'))
+        if fill:
+            if not self._available():
+                return
+            try:
+                self.client.set(self.prefix + key, value, ex=self.ttl, nx=True)
+            except self._errors as e:
+                self._failed('Fill', e)
+                return
+        else:
+            self._must('Write', lambda: self.client.set(self.prefix + key, value, ex=self.ttl))
+        REDIS_CACHE_EVENTS.labels('write').inc()
+
+    def close(self, key: str) -> None:
+        """Replace the record of a closed box with a tombstone.
+
+        The tombstone reads as a miss and keeps fills out for
+        ``tombstone_ttl`` seconds, which outlasts any read that fetched the
+        box before it was deleted.
+
+        Raises:
+            SharedCacheError: If the tombstone did not reach Redis
+        """
+        self._must('Close', lambda: self.client.set(self.prefix + key, TOMBSTONE, ex=self.tombstone_ttl))
+        REDIS_CACHE_EVENTS.labels('delete').inc()
+
+    def delete(self, key: str) -> None:
+        """Drop a record, e.g. before its box is rewritten.
+
+        Deletes are attempted even while lookups skip Redis.
+
+        Raises:
+            SharedCacheError: If the delete did not reach Redis
+        """
+        self._must('Delete', lambda: self.client.delete(self.prefix + key))
+        REDIS_CACHE_EVENTS.labels('delete').inc()
+
+
+class DisabledCache:
+    """Stand-in used when REDIS_CACHE is off: every lookup misses"""
+
+    enabled = False
+
+    def get(self, key: str) -> None:
+        return None
+
+    def put(self, key: str, record: Dict[str, str], etag: Optional[str] = None, fill: bool = False) -> None:
+        pass
+
+    def close(self, key: str) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+
+shared_cache: Any = RedisRecordCache() if redis_cache_enabled else DisabledCache()
@@ -0,0 +1,229 @@
+"""Module to share pooled S3 clients across UserDBManager instances"""
+
+import asyncio
+import io
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from metrics import S3_BYTES, S3_REQUESTS, observe_stage
+from settings import (
+    metrics_enabled,
+    s3_connect_timeout,
+    s3_endpoint_url,
+    s3_max_attempts,
+    s3_max_pool_connections,
+    s3_read_timeout,
+    s3_tcp_keepalive,
+)
+
+logger = logging.getLogger(__name__)
+
+MISSING_CODES = frozenset({'NoSuchKey', '404', 'NotFound'})
+CONFLICT_CODES = frozenset({'PreconditionFailed', '412', 'ConditionalRequestConflict'})
+NOT_MODIFIED_CODES = frozenset({'304', 'NotModified'})
+
+_registry_lock = threading.Lock()
+_clients: Dict[Tuple[Optional[str], Optional[str]], Any] = {}
+_session: Optional[boto3.session.Session] = None
+_async_clients: Dict[Tuple[int, Optional[str], Optional[str]], Any] = {}
+_async_stacks: Dict[Tuple[int, Optional[str], Optional[str]], AsyncExitStack] = {}
+
+
+def s3_error_code(error: ClientError) -> str:
+    """Extract the S3 error code from a botocore ClientError"""
+    return str(error.response.get('Error', {}).get('Code', ''))
+
+
+def _stage_name(operation: str) -> str:
+    """GetObject -> s3_get_object"""
+    return 's3_' + re.sub(r'(?<!^)(?=[A-Z])', '_', operation).lower()
+
+
+def _before_call(params: Dict[str, Any], context: Dict[str, Any], model: Any, **kwargs: Any) -> None:
+    context['susdb_started'] = time.perf_counter()
+    context['susdb_operation'] = model.name
+    body = params.get('body')
+    if isinstance(body, (bytes, bytearray)):
+        S3_BYTES.labels('sent').inc(len(body))
+    elif isinstance(body, io.BytesIO):
+        # botocore wraps a bytes Body in BytesIO before this event
+        with body.getbuffer() as view:
+            S3_BYTES.labels('sent').inc(view.nbytes)
+
+
+def _after_call(http_response: Any, context: Dict[str, Any], model: Any, **kwargs: Any) -> None:
+    started = context.get('susdb_started')
+    if started is not None:
+        observe_stage(_stage_name(model.name), time.perf_counter() - started)
+    S3_REQUESTS.labels(model.name, str(http_response.status_code)).inc()
+    if model.name == 'GetObject' and http_response.status_code == 200:
+        S3_BYTES.labels('received').inc(int(http_response.headers.get('content-length', 0)))
+
+
+def _after_call_error(context: Dict[str, Any], **kwargs: Any) -> None:
+    operation = context.get('susdb_operation', 'unknown')
+    started = context.get('susdb_started')
+    if started is not None:
+        observe_stage(_stage_name(operation), time.perf_counter() - started)
+    S3_REQUESTS.labels(operation, 'error').inc()
+
+
+def instrument_client(client: Any) -> Any:
+    """Count and time every call of a (sync or async) S3 client through botocore events"""
+    if metrics_enabled:
+        client.meta.events.register('before-call.s3', _before_call)
+        client.meta.events.register('after-call.s3', _after_call)
+        client.meta.events.register('after-call-error.s3', _after_call_error)
+    return client
+
+
+def _config_options() -> Dict[str, Any]:
+    """Connection pool size, keep-alive, timeouts and retries from the S3 settings,
+    shared by the sync and async clients"""
+    return {
+        'max_pool_connections': s3_max_pool_connections,
+        'connect_timeout': s3_connect_timeout,
+        'read_timeout': s3_read_timeout,
+        'tcp_keepalive': s3_tcp_keepalive,
+        'retries': {'max_attempts': s3_max_attempts, 'mode': 'standard'},
+    }
+
+
+def build_s3_config() -> Config:
+    """Build the botocore client config from the S3 settings.
+
+    Returns:
+        Config: Connection pool size, keep-alive, timeouts and retries
+    """
+    return Config(**_config_options())
+
+
+def get_s3_client(
+        region_name: Optional[str] = None,
+        endpoint_url: Optional[str] = None) \
+        -> Any:
+    """Return the process-wide S3 client, creating it on first use.
+
+    boto3 clients are thread safe once built, but building one through the
+    default session is not, so creation happens under a lock and every
+    caller afterwards shares the same client and its connection pool.
+
+    Args:
+        region_name (Optional[str]): Region override, defaults to AWS_REGION
+        endpoint_url (Optional[str]): Endpoint override, defaults to S3_ENDPOINT_URL
+
+    Returns:
+        Any: A botocore S3 client
+    """
+    global _session
+    region_name = region_name or os.getenv('AWS_REGION')
+    endpoint_url = endpoint_url or s3_endpoint_url
+    key = (region_name, endpoint_url)
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                _session = boto3.session.Session()
+            client = instrument_client(_session.client(
+                's3',
+                region_name=region_name,
+                endpoint_url=endpoint_url,
+                config=build_s3_config(),
+            ))
+            _clients[key] = client
+            logger.info("[S3] Shared client created for region=%s endpoint=%s", region_name, endpoint_url)
+        return client
+
+
+def reset_s3_clients() -> None:
+    """Drop every cached client so the next call builds a fresh one.
+
+    The session is kept, so the loaded service models are reused.
+    """
+    with _registry_lock:
+        _clients.clear()
+
+
+async def get_async_s3_client(
+        region_name: Optional[str] = None,
+        endpoint_url: Optional[str] = None) \
+        -> Any:
+    """Return the aiobotocore S3 client shared by everything on the running event loop.
+
+    aiobotocore clients are bound to the loop they were opened on, so there
+    is one per loop, built from the same settings as the sync client.
+
+    Args:
+        region_name (Optional[str]): Region override, defaults to AWS_REGION
+        endpoint_url (Optional[str]): Endpoint override, defaults to S3_ENDPOINT_URL
+
+    Returns:
+        Any: An aiobotocore S3 client
+    """
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+
+    region_name = region_name or os.getenv('AWS_REGION')
+    endpoint_url = endpoint_url or s3_endpoint_url
+    key = (id(asyncio.get_running_loop()), region_name, endpoint_url)
+
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+
+    stack = AsyncExitStack()
+    client = await stack.enter_async_context(get_session().create_client(
+        's3',
+        region_name=region_name,
+        endpoint_url=endpoint_url,
+        config=AioConfig(**_config_options()),
+    ))
+    instrument_client(client)
+    existing = _async_clients.setdefault(key, client)
+    if existing is not client:
+        # Another coroutine won the race while this one was connecting
+        await stack.aclose()
+        return existing
+    _async_stacks[key] = stack
+    logger.info("[S3] Shared async client created for region=%s endpoint=%s", region_name, endpoint_url)
+    return client
+
+
+async def close_async_s3_clients() -> None:
+    """Close the async clients opened on the running event loop"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [key for key in _async_stacks if key[0] == loop_id]:
+        _async_clients.pop(key, None)
+        await _async_stacks.pop(key).aclose()
+
+
+def _reset_after_fork() -> None:
+    """Drop the clients inherited from the parent process.
+
+    Their connection pools belong to the parent, so the child builds its own
+    clients on first use. The session is kept: it holds no connections, and
+    its already loaded service models make that rebuild cheap (milliseconds
+    instead of the first client's start-up).
+    """
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    _clients.clear()
+    _async_clients.clear()
+    _async_stacks.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
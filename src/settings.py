@@ -1,8 +1,12 @@
-"""Module for user-defined configurations"""
+"""Module for user-defined configurations
+
+``redis`` is opened on first access rather than at import, so commands
+and processes that never talk to Redis do not pay for redis_om.
+"""
 import os
+from typing import Any
 
 from dotenv import load_dotenv
-from redis_om import get_redis_connection
 
 
 load_dotenv()
@@ -11,13 +15,129 @@ load_dotenv()
 db_file_name = 'user_db'
 get_path = os.getenv('GET_PATH')
 get_log_path = os.getenv('LOG_PATH')
+dbm_shard_count = int(os.getenv('DBM_SHARD_COUNT', '256'))
+dbm_sync_writes = os.getenv('DBM_SYNC_WRITES', 'true').lower() == 'true'
+
+
+# LOGGING CONFIGURATION
+log_queue = os.getenv('LOG_QUEUE', 'true').lower() == 'true'
+log_queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+log_batch_size = int(os.getenv('LOG_BATCH_SIZE', '500'))
+log_max_bytes = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+log_backup_count = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+log_info_sample_rate = float(os.getenv('LOG_INFO_SAMPLE_RATE', '1.0'))
+
+
+# LOG-STRUCTURED STORE CONFIGURATION
+logstore_segment_bytes = int(os.getenv('LOGSTORE_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+logstore_fsync = os.getenv('LOGSTORE_FSYNC', 'false').lower() == 'true'
+logstore_compact_interval = float(os.getenv('LOGSTORE_COMPACT_INTERVAL', '60'))
+logstore_compact_ratio = float(os.getenv('LOGSTORE_COMPACT_RATIO', '0.5'))
+
+
+# RECORD FORMAT: 'binary' (compact, version 1) or 'json' while older readers are still deployed
+record_format = os.getenv('RECORD_FORMAT', 'binary')
+
+
+# S3 CONFIGURATION
+s3_bucket_name = os.getenv('S3_BUCKET_NAME')
+s3_endpoint_url = os.getenv('S3_ENDPOINT_URL') or None
+s3_max_pool_connections = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '50'))
+s3_connect_timeout = float(os.getenv('S3_CONNECT_TIMEOUT', '5'))
+s3_read_timeout = float(os.getenv('S3_READ_TIMEOUT', '10'))
+s3_tcp_keepalive = os.getenv('S3_TCP_KEEPALIVE', 'true').lower() == 'true'
+s3_max_attempts = int(os.getenv('S3_MAX_ATTEMPTS', '3'))
+s3_lazy_init = os.getenv('S3_LAZY_INIT', 'false').lower() == 'true'
+
+
+# RECORD CACHE CONFIGURATION
+record_cache_size = int(os.getenv('RECORD_CACHE_SIZE', '10000'))
+record_cache_ttl = float(os.getenv('RECORD_CACHE_TTL', '5'))
+
+
+# REDIS CACHE CONFIGURATION (tier shared by every process and node, between the record cache and S3)
+redis_cache_enabled = os.getenv('REDIS_CACHE', 'false').lower() == 'true'
+redis_cache_ttl = int(os.getenv('REDIS_CACHE_TTL', '300'))
+redis_cache_prefix = os.getenv('REDIS_CACHE_PREFIX', 'susdb:record:')
+# Seconds a closed box stays marked as closed, so a read that started before the close cannot cache it again
+redis_cache_tombstone_ttl = int(os.getenv('REDIS_CACHE_TOMBSTONE_TTL', '60'))
+
+
+# REQUEST COALESCING: concurrent identical reads and verifications share one call
+coalesce_requests = os.getenv('COALESCE_REQUESTS', 'true').lower() == 'true'
+
+
+# UID FILTER CONFIGURATION (Bloom filter of known boxes, snapshot kept in UID_FILTER_DIR)
+uid_filter_enabled = os.getenv('UID_FILTER', 'false').lower() == 'true'
+uid_filter_dir = os.getenv('UID_FILTER_DIR') or get_path
+uid_filter_capacity = int(os.getenv('UID_FILTER_CAPACITY', '1000000'))
+uid_filter_error_rate = float(os.getenv('UID_FILTER_ERROR_RATE', '0.001'))
+
+
+# HASHING CONFIGURATION
+hash_executor_mode = os.getenv('HASH_EXECUTOR', 'process')
+hash_workers = int(os.getenv('HASH_WORKERS', '0')) or None
+hash_queue_size = int(os.environ['HASH_QUEUE_SIZE']) if os.getenv('HASH_QUEUE_SIZE') else None
+hash_queue_timeout = float(os.getenv('HASH_QUEUE_TIMEOUT', '30'))
+hash_start_method = os.getenv('HASH_START_METHOD', 'forkserver') or None
+hash_profile = os.getenv('HASH_PROFILE', 'default')
+hash_time_cost = int(os.getenv('HASH_TIME_COST', '0')) or None
+hash_memory_cost = int(os.getenv('HASH_MEMORY_COST', '0')) or None
+hash_parallelism = int(os.getenv('HASH_PARALLELISM', '0')) or None
+
+
+# METRICS CONFIGURATION
+metrics_enabled = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+# Directory where every worker saves its values, merged by /metrics (set by gunicorn.conf.py)
+metrics_dir = os.getenv('METRICS_DIR') or None
+metrics_flush_seconds = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+# Label samples with the pid of the process answering the scrape, for debugging only
+metrics_pid_label = os.getenv('METRICS_PID_LABEL', 'false').lower() == 'true'
+
+
+# BATCH CONFIGURATION
+batch_max_items = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+
+
+# ADMISSION CONTROL: per-route limits in front of the Argon2 routes of main.py (store, verify, recover)
+admission_control = os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true'
+admission_limit = int(os.getenv('ADMISSION_LIMIT') or '0') or None
+# Limit of each route across all gunicorn workers of the host, split between them; 0 means two per core
+admission_host_limit = int(os.getenv('ADMISSION_HOST_LIMIT') or '0') or None
+admission_limits = os.getenv('ADMISSION_LIMITS', '')
+admission_queue_size = int(os.environ['ADMISSION_QUEUE_SIZE']) if os.getenv('ADMISSION_QUEUE_SIZE') else None
+admission_queue_timeout = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '1'))
+admission_latency_target = float(os.getenv('ADMISSION_LATENCY_TARGET') or '0') or None
+
+
+# WEB SERVER CONFIGURATION: gunicorn, see src/gunicorn.conf.py
+web_bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+web_workers = int(os.getenv('WEB_WORKERS') or '0') or None
+web_threads = int(os.getenv('WEB_THREADS', '32'))
+web_keepalive = int(os.getenv('WEB_KEEPALIVE', '5'))
+web_timeout = int(os.getenv('WEB_TIMEOUT', '30'))
+web_graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+web_max_requests = int(os.getenv('WEB_MAX_REQUESTS', '0'))
+web_max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', '0'))
+web_pidfile = os.getenv('WEB_PIDFILE') or None
+
+
+# DAEMON CONFIGURATION: Unix socket of `susdb daemon`
+daemon_socket = os.getenv('DAEMON_SOCKET') or os.path.join(
+    os.getenv('XDG_RUNTIME_DIR') or '/tmp', f'susdb-{os.getuid()}.sock')
 
 
 # REDIS CLOUD CONN
 
-redis = get_redis_connection(
-    host=os.getenv('REDIS_MASTER_HOST'),
-    port=os.getenv('REDIS_PORT_NUMBER'),
-    password=os.getenv('REDIS_PASSWORD'),
-    decode_responses=True,
-)
\ No newline at end of file
+def __getattr__(name: str) -> Any:
+    """Create the Redis connection on first use of ``settings.redis``"""
+    if name == 'redis':
+        from redis_om import get_redis_connection
+        globals()['redis'] = get_redis_connection(
+            host=os.getenv('REDIS_MASTER_HOST'),
+            port=os.getenv('REDIS_PORT_NUMBER'),
+            password=os.getenv('REDIS_PASSWORD'),
+            decode_responses=True,
+        )
+        return globals()['redis']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
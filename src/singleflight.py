@@ -0,0 +1,99 @@
+"""Module for coalescing concurrent identical calls.
+
+When several threads ask for the same thing at once (e.g. the same box
+during a login storm), only the first one does the work; the others wait
+for and share its result or exception. Nothing is cached: once the call
+has finished, the next caller starts a new one.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+from metrics import COALESCED_CALLS
+from settings import coalesce_requests
+
+
+class SingleFlight:
+    """In-flight calls of one kind, keyed by what they compute.
+
+    Args:
+        name (str): Operation label of the coalesced-calls metric
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)``, or wait for the identical call already running.
+
+        Raises:
+            Exception: Whatever the shared call raised
+        """
+        if not coalesce_requests:
+            return fn(*args)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            COALESCED_CALLS.labels(self.name).inc()
+            return call.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._release(key, call)
+            call.set_exception(e)
+            raise
+        self._release(key, call)
+        call.set_result(result)
+        return result
+
+    def share(self, key: Hashable, submit: Callable[[], Future]) -> Future:
+        """Return the future of the identical call in flight, or the one ``submit()`` starts"""
+        if not coalesce_requests:
+            return submit()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                COALESCED_CALLS.labels(self.name).inc()
+                return call
+            call = self._calls[key] = Future()
+        try:
+            inner = submit()
+        except BaseException as e:
+            self._release(key, call)
+            call.set_exception(e)
+            raise
+
+        def relay(done: Future) -> None:
+            self._release(key, call)
+            if done.cancelled():
+                call.cancel()
+                return
+            error = done.exception()
+            if error is not None:
+                call.set_exception(error)
+            else:
+                call.set_result(done.result())
+
+        inner.add_done_callback(relay)
+        return call
+
+    def forget(self, key: Hashable) -> None:
+        """Make later callers start a new call instead of joining the running one,
+        e.g. once the data it reads has been written"""
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def _release(self, key: Hashable, call: Future) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._calls.clear()
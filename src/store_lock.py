@@ -0,0 +1,66 @@
+"""Module for the lock that makes one process the owner of a local store.
+
+The dbm shards and the log store keep open handles, file sizes and offsets
+in memory, so a second process writing the same files loses or corrupts
+records without any error. Each store takes an exclusive ``flock`` on a
+``.lock`` file in its directory when it is first opened and holds it until
+it is closed; any other process opening the same store fails at once.
+"""
+
+import fcntl
+import os
+from typing import Optional
+
+LOCK_NAME = '.lock'
+
+
+class StoreLocked(RuntimeError):
+    """Raised when another process already owns a local store"""
+
+
+class StoreLock:
+    """Exclusive, non-blocking lock on a store directory.
+
+    Args:
+        directory (str): Directory of the store, created if missing
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.path = os.path.join(directory, LOCK_NAME)
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> None:
+        """Take the lock, a no-op if this process already holds it.
+
+        Raises:
+            StoreLocked: If another process holds the lock
+        """
+        if self._fd is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            owner = os.pread(fd, 32, 0).decode('ascii', 'replace').strip() or 'unknown'
+            os.close(fd)
+            raise StoreLocked(f"{self.directory} is in use by another process (pid {owner})") from None
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(os.getpid()).encode('ascii'), 0)
+        self._fd = fd
+
+    def release(self) -> None:
+        """Give the lock up"""
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def forget(self) -> None:
+        """Close the descriptor inherited by a forked child without unlocking:
+        the parent still owns the store, and the child fails if it opens it"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
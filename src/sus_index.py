@@ -0,0 +1,131 @@
+"""Module for the secondary index from secured user string to uid.
+
+Entries are keyed by the SHA-256 digest of the secured user string, so the
+index never holds a usable credential, and a lookup is a single read:
+
+* ``dbm``: ``LocalSusIndex`` over a ``ShardStore`` of its own (``GET_PATH/sus_index``)
+* ``log``: ``LocalSusIndex`` over a ``LogStore`` of its own (``GET_PATH/sus_index``)
+* ``s3``:  ``S3SusIndex``, one ``sus_index/<digest>`` object holding the uid
+
+An entry and its box live in different files or objects, which cannot be
+written in one transaction. The managers order the writes so that a live
+secured string is always indexed: the entry for a new string is written
+before the box, and the entry of a replaced or closed string is removed
+after it. A failure in between can only leave an extra entry behind, so
+``UserDBManager.find_uid`` confirms every hit against the box itself.
+"""
+
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'sus_index/'
+
+
+def sus_digest(secured_user_string: str) -> str:
+    """Index key of a secured user string"""
+    return hashlib.sha256(secured_user_string.encode('utf-8')).hexdigest()
+
+
+class LocalSusIndex:
+    """Index kept in a local store with the ``ShardStore``/``LogStore`` interface"""
+
+    def __init__(self, store: Any) -> None:
+        self.store = store
+
+    def add(self, secured_user_string: str, uid: str) -> None:
+        self.store.put(sus_digest(secured_user_string), {'uid': uid})
+
+    def lookup(self, secured_user_string: str) -> Optional[str]:
+        """uid indexed for the string, None if there is none"""
+        entry = self.store.get(sus_digest(secured_user_string))
+        return None if entry is None else entry.get('uid')
+
+    def remove(self, secured_user_string: str) -> None:
+        self.store.delete(sus_digest(secured_user_string))
+
+
+class S3SusIndex:
+    """Index kept as one small object per entry next to the boxes"""
+
+    def __init__(self, bucket: Optional[str] = None, client: Any = None) -> None:
+        from settings import s3_bucket_name
+        self.bucket = bucket or s3_bucket_name
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            from s3_client import get_s3_client
+            self._client = get_s3_client()
+        return self._client
+
+    def add(self, secured_user_string: str, uid: str) -> None:
+        """Write an entry.
+
+        Raises:
+            ClientError: If S3 refused the write
+        """
+        self.client.put_object(Bucket=self.bucket, Key=KEY_PREFIX + sus_digest(secured_user_string),
+                               Body=uid.encode('utf-8'))
+
+    def lookup(self, secured_user_string: str) -> Optional[str]:
+        """uid indexed for the string, None if there is none"""
+        from botocore.exceptions import ClientError
+        from s3_client import MISSING_CODES, s3_error_code
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=KEY_PREFIX + sus_digest(secured_user_string))
+        except ClientError as e:
+            if s3_error_code(e) in MISSING_CODES:
+                return None
+            raise
+        return response['Body'].read().decode('utf-8')
+
+    def remove(self, secured_user_string: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=KEY_PREFIX + sus_digest(secured_user_string))
+
+
+def open_index(name: str, bucket: Optional[str] = None) -> Any:
+    """Index of a backend by name"""
+    if name == 's3':
+        return S3SusIndex(bucket)
+    if name == 'dbm':
+        import dbm_engine
+        return dbm_engine.UserDBManager.sus_index
+    if name == 'log':
+        import log_engine
+        return log_engine.UserDBManager.sus_index
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def rebuild(boxes: Any, index: Any, concurrency: int = 32) -> Dict[str, int]:
+    """Index every box of a backend, e.g. boxes stored before the index existed.
+
+    Args:
+        boxes: Backend from ``transfer.open_backend``
+        index: Index of the same backend, from ``open_index``
+        concurrency (int): Parallel box reads and index writes
+
+    Returns:
+        Dict[str, int]: Boxes ``indexed``, and ``skipped`` ones (closed
+        meanwhile, or never stored a string)
+    """
+    from transfer import _ordered
+
+    def index_box(uid: str) -> bool:
+        record = boxes.read(uid)
+        secured_user_string = record.get('secured_user_string') if record else None
+        if not secured_user_string:
+            return False
+        index.add(secured_user_string, uid)
+        return True
+
+    stats = {'indexed': 0, 'skipped': 0}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _, indexed in _ordered(pool, index_box, boxes.keys(), concurrency * 4):
+            stats['indexed' if indexed else 'skipped'] += 1
+    logger.info("[SUS INDEX] Rebuilt for %s: %s", boxes.name, stats)
+    return stats
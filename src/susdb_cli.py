@@ -6,11 +6,22 @@ Currently, support is provided for the following commands
 @deserialize_data_command
 @verify_user_command
 @display_user_db_command
+@remove_user_account
+@calibrate_command
+@migrate_shards_command
+@bench_command
+@export_command
+@import_command
+@reconcile_command
+@daemon_command
+@lookup_command
+@index_sus_command
 
 """
-import argparse, argon2
-from user_db_manager import UserDBManager
-from main import parse_accept_init  # Import the new function
+import argparse, os, sys
+
+# Commands import what they need (boto3, redis_om, ...) when they run, so
+# that --help and the local commands start without loading the S3 stack
 
 
 parser = argparse.ArgumentParser(
@@ -25,6 +36,8 @@ parser = argparse.ArgumentParser(
         https://github.com/Terre8055/sus-db :)'
 )
 
+parser.add_argument("--no-daemon", action="store_true", help="Run in this process even if a daemon is listening")
+
 subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
 store_parser = subparsers.add_parser("store", help="Store a user string")
@@ -51,21 +64,91 @@ account_removal.add_argument("--uid", required=True, help="Unique user id to loc
 account_removal.add_argument("--sus", required=True, help="Secure User String to verify integrity")
 account_removal.add_argument("--accept-init", action="store_true", help="Accept initialization if needed")
 
+lookup_parser = subparsers.add_parser("lookup", help="Find the uid of a Secure User String")
+lookup_parser.add_argument("--sus", required=True, help="Secure User String to look up")
+
+calibrate_parser = subparsers.add_parser("calibrate", help="Pick Argon2 cost parameters for this machine")
+calibrate_parser.add_argument("--target-ms", type=float, default=250.0, help="Target p99 hash latency in milliseconds")
+calibrate_parser.add_argument("--memory-kib", type=int, default=65536, help="Starting memory cost in KiB")
+calibrate_parser.add_argument("--parallelism", type=int, default=4, help="Argon2 lanes")
+calibrate_parser.add_argument("--samples", type=int, default=20, help="Hashes timed per candidate")
+
+migrate_shards_parser = subparsers.add_parser("migrate-shards", help="Move per-user dbm files into shard files")
+migrate_shards_parser.add_argument("--path", default=None, help="Directory holding the legacy files, defaults to GET_PATH")
+
+bench_parser = subparsers.add_parser("bench", help="Generate load and report latencies")
+bench_parser.add_argument("--url", default=None, help="Base URL of a running server, e.g. http://localhost:8000; in-process if omitted")
+bench_parser.add_argument("--backend", choices=["s3", "dbm", "log"], default="s3", help="Backend for in-process runs")
+bench_parser.add_argument("--mix", default=None, help="Operation weights, e.g. verify=50,view=20,store=10,close=5")
+bench_parser.add_argument("--concurrency", type=int, default=8, help="Worker threads")
+bench_parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+bench_parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+bench_parser.add_argument("--rate", type=float, default=None, help="Total operations per second, unlimited if omitted")
+bench_parser.add_argument("--accounts", type=int, default=100, help="Boxes created up front for reads and verifies")
+bench_parser.add_argument("--distribution", choices=["uniform", "zipfian"], default="uniform", help="How uids are picked")
+bench_parser.add_argument("--zipf-s", type=float, default=1.0, help="Zipf exponent for --distribution zipfian")
+bench_parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible runs")
+
+export_parser = subparsers.add_parser("export", help="Stream every box of a backend to a file")
+export_parser.add_argument("--backend", choices=["s3", "dbm", "log"], default="s3", help="Backend to read")
+export_parser.add_argument("--output", required=True, help="File to write, - for stdout")
+export_parser.add_argument("--format", choices=["ndjson", "binary"], default="ndjson", help="Entry format")
+export_parser.add_argument("--bucket", default=None, help="Bucket for --backend s3, defaults to S3_BUCKET_NAME")
+export_parser.add_argument("--concurrency", type=int, default=32, help="Parallel reads")
+export_parser.add_argument("--checkpoint", default=None, help="Progress file, defaults to OUTPUT.checkpoint")
+export_parser.add_argument("--resume", action="store_true", help="Continue the export recorded in the checkpoint")
+
+import_parser = subparsers.add_parser("import", help="Load boxes from an export file into a backend")
+import_parser.add_argument("--backend", choices=["s3", "dbm", "log"], default="s3", help="Backend to write")
+import_parser.add_argument("--input", required=True, help="Export file, NDJSON or binary")
+import_parser.add_argument("--bucket", default=None, help="Bucket for --backend s3, defaults to S3_BUCKET_NAME")
+import_parser.add_argument("--concurrency", type=int, default=32, help="Parallel writes")
+import_parser.add_argument("--overwrite", action="store_true", help="Replace boxes that already exist")
+import_parser.add_argument("--checkpoint", default=None, help="Progress file, defaults to INPUT.checkpoint")
+import_parser.add_argument("--resume", action="store_true", help="Continue the import recorded in the checkpoint")
+
+reconcile_parser = subparsers.add_parser("reconcile", help="Find boxes without users and users without boxes")
+reconcile_parser.add_argument("--backend", choices=["s3", "dbm", "log"], default="s3", help="Backend holding the boxes")
+reconcile_parser.add_argument("--bucket", default=None, help="Bucket for --backend s3, defaults to S3_BUCKET_NAME")
+reconcile_parser.add_argument("--apply", action="store_true", help="Delete orphan users and create users for orphan boxes")
+reconcile_parser.add_argument("--batch-size", type=int, default=1000, help="Keys per Redis pipeline and checkpoint")
+reconcile_parser.add_argument("--concurrency", type=int, default=32, help="Parallel box existence checks")
+reconcile_parser.add_argument("--checkpoint", default=None, help="Progress file, defaults to reconcile-BACKEND.checkpoint")
+reconcile_parser.add_argument("--resume", action="store_true", help="Continue the pass recorded in the checkpoint")
+reconcile_parser.add_argument("--max-seconds", type=float, default=None, help="Stop after this long, to resume later")
+
+index_sus_parser = subparsers.add_parser("index-sus", help="Index existing boxes by Secure User String")
+index_sus_parser.add_argument("--backend", choices=["s3", "dbm", "log"], default="s3", help="Backend holding the boxes")
+index_sus_parser.add_argument("--bucket", default=None, help="Bucket for --backend s3, defaults to S3_BUCKET_NAME")
+index_sus_parser.add_argument("--concurrency", type=int, default=32, help="Parallel box reads and index writes")
+
+daemon_parser = subparsers.add_parser("daemon", help="Keep S3 and hashing state warm for store/verify/view/retrieve/close/lookup")
+daemon_parser.add_argument("--socket", default=None, help="Unix socket to listen on, defaults to DAEMON_SOCKET")
+daemon_parser.add_argument("--status", action="store_true", help="Report whether a daemon is running and exit")
+
 
 ###########################################################
 ###############         METHODS     #######################
 ###########################################################
 
+def _run(args, op, **params):
+    """Run a storage operation on the daemon when one is listening, else in this process"""
+    import susdb_daemon
+    params['accept_init'] = getattr(args, 'accept_init', False)
+    try:
+        return susdb_daemon.run(op, params, use_daemon=not args.no_daemon)
+    except susdb_daemon.DaemonError as e:
+        print(f"Daemon error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
 def store_user_string_command(args):
     """Store User Strings in db
 
     Args:
         args (_type_): Positional Arguments/subcommands - u_str
     """
-    user_string = args.string
-    req = {'request_string': user_string}
-    uid = UserDBManager(accept_init=args.accept_init).store_user_string(req).get('id')
-    print(uid)
+    print(_run(args, 'store', string=args.string))
 
 
 def deserialize_data_command(args):
@@ -74,10 +157,7 @@ def deserialize_data_command(args):
     Args:
         args (_type_): Positional Arguments/subcommands - uid
     """
-    user_id = args.uid
-    user_key = args.key
-    user_data = UserDBManager(user_id, accept_init=args.accept_init).deserialize_data(user_id, user_key)
-    print(user_data)
+    print(_run(args, 'retrieve', uid=args.uid, key=args.key))
     
 
 def verify_user_command(args):
@@ -86,14 +166,7 @@ def verify_user_command(args):
     Args:
         args (_type_): Positional Arguments/subcommands - u_str
     """
-    user_string = args.string
-    user_id = args.uid
-    req = {'request_string': user_string, 'uid': user_id}
-    try:
-        msg = UserDBManager(user_id, accept_init=args.accept_init).verify_user(req)
-        print(msg)
-    except argon2.exceptions.InvalidHashError:
-        print('Invalid parameters passed to CLI, Check uid or string')
+    print(_run(args, 'verify', uid=args.uid, string=args.string))
     
 
 def display_user_db_command(args):
@@ -102,9 +175,7 @@ def display_user_db_command(args):
     Args:
         args (_type_): Positional Arguments/subcommands - uid
     """
-    user_id = args.uid
-    user_db_view = UserDBManager(user_id, accept_init=args.accept_init).display_user_db(user_id)
-    print(user_db_view)
+    print(_run(args, 'view', uid=args.uid))
     
     
 def remove_user_account(args):
@@ -113,15 +184,199 @@ def remove_user_account(args):
     Args:
         args (_type_): Positional Arguments/subcommands - uid / sus
     """
-    user_id = args.uid
-    secured_user_string = args.sus
-    req = {'uid': user_id, 'sus': secured_user_string}
-    response = UserDBManager(user_id, accept_init=args.accept_init).close_account(req)
-    print(response)
+    print(_run(args, 'close', uid=args.uid, sus=args.sus))
     
 
+def lookup_command(args):
+    """Find the uid of a Secure User String
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - sus
+    """
+    uid = _run(args, 'lookup', sus=args.sus)
+    if uid is None:
+        print("No box holds this Secure User String")
+        sys.exit(1)
+    print(uid)
+
+
+def calibrate_command(args):
+    """Measure Argon2 on this machine and print matching settings
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - target_ms / memory_kib / parallelism / samples
+    """
+    from hashing import calibrate
+    params = calibrate(
+        args.target_ms,
+        memory_cost=args.memory_kib,
+        parallelism=args.parallelism,
+        samples=args.samples,
+    )
+    print(f"p99 hash latency: {params['p99_ms']} ms (target {args.target_ms} ms)")
+    print(f"HASH_TIME_COST={params['time_cost']}")
+    print(f"HASH_MEMORY_COST={params['memory_cost']}")
+    print(f"HASH_PARALLELISM={params['parallelism']}")
+
+
+def migrate_shards_command(args):
+    """Copy legacy per-user dbm files into the local shard store
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - path
+    """
+    from dbm_engine import migrate_legacy_files
+    counts = migrate_legacy_files(args.path)
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+
+
+def bench_command(args):
+    """Run a load test and print per-operation latencies and a histogram
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - url / backend / mix / concurrency / duration / ...
+    """
+    import loadgen
+    target = loadgen.HttpTarget(args.url) if args.url else loadgen.InProcessTarget(args.backend)
+    mix = loadgen.parse_mix(args.mix or loadgen.DEFAULT_MIX)
+    print(f"Creating {args.accounts} boxes on {target.name}...")
+    accounts = loadgen.create_accounts(target, args.accounts, args.concurrency)
+    print(f"Running {args.warmup:g}s warmup + {args.duration:g}s with {args.concurrency} workers"
+          f"{f' at {args.rate:g} ops/s' if args.rate else ''}, {args.distribution} keys")
+    report = loadgen.run(
+        target, mix, accounts,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        warmup=args.warmup,
+        rate=args.rate,
+        distribution=args.distribution,
+        zipf_s=args.zipf_s,
+        seed=args.seed,
+    )
+    print(f"{'operation':>10} {'count':>8} {'errors':>7} {'ops/s':>9} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'p99 ms':>9} {'p99.9 ms':>9} {'max ms':>9}")
+    for row in report.summary():
+        print(f"{row['operation']:>10} {row['count']:>8} {row['errors']:>7} {row['ops_per_s']:>9.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p90_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['p999_ms']:>9.2f} "
+              f"{row['max_ms']:>9.2f}")
+    if report.skipped:
+        print(f"{report.skipped} close calls skipped while no stored box was left to close")
+    print()
+    for line in report.histogram():
+        print(line)
+
+
+def _print_progress(state):
+    done = state.get('exported', state.get('imported', 0))
+    print(f"... {done} boxes", file=sys.stderr, flush=True)
+
+
+def export_command(args):
+    """Stream every box of a backend to an NDJSON or binary file
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - backend / output / format / concurrency / checkpoint / resume
+    """
+    import transfer
+    checkpoint = None if args.output == '-' else args.checkpoint or f"{args.output}.checkpoint"
+    stats = transfer.export_boxes(
+        transfer.open_backend(args.backend, args.bucket),
+        args.output,
+        fmt=args.format,
+        concurrency=args.concurrency,
+        checkpoint=checkpoint,
+        resume=args.resume,
+        on_progress=_print_progress,
+    )
+    print(f"Exported {stats['exported']} boxes ({stats['missing']} closed meanwhile) "
+          f"in {stats['seconds']:.1f}s", file=sys.stderr)
+
+
+def import_command(args):
+    """Load the boxes of an export file into a backend
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - backend / input / concurrency / overwrite / checkpoint / resume
+    """
+    import transfer
+    stats = transfer.import_boxes(
+        transfer.open_backend(args.backend, args.bucket),
+        args.input,
+        concurrency=args.concurrency,
+        overwrite=args.overwrite,
+        checkpoint=args.checkpoint or f"{args.input}.checkpoint",
+        resume=args.resume,
+        on_progress=_print_progress,
+    )
+    print(f"Imported {stats['imported']} boxes ({stats['existing']} already present) "
+          f"in {stats['seconds']:.1f}s")
+
+
+def reconcile_command(args):
+    """Check that every box has a User record and every User record a box
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - backend / apply / batch_size / checkpoint / resume / max_seconds
+    """
+    import transfer
+    from reconcile import Reconciler
+    reconciler = Reconciler(
+        transfer.open_backend(args.backend, args.bucket),
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        apply=args.apply,
+    )
+    checkpoint = args.checkpoint or f"reconcile-{args.backend}.checkpoint"
+    stats = reconciler.run(checkpoint, resume=args.resume, max_seconds=args.max_seconds)
+    print(f"Users: {stats['users']} checked, {stats['orphan_users']} without a box, {stats['deleted']} deleted")
+    print(f"Boxes: {stats['boxes']} checked, {stats['orphan_boxes']} without a user, {stats['created']} users created")
+    if stats['phase'] != 'done':
+        print(f"Stopped in the {stats['phase']} phase after {stats['seconds']:.1f}s, "
+              f"continue with --resume --checkpoint {checkpoint}")
+
+
+def index_sus_command(args):
+    """Index the boxes of a backend by Secure User String, e.g. after an upgrade
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - backend / bucket / concurrency
+    """
+    import sus_index
+    import transfer
+    stats = sus_index.rebuild(
+        transfer.open_backend(args.backend, args.bucket),
+        sus_index.open_index(args.backend, args.bucket),
+        concurrency=args.concurrency,
+    )
+    print(f"Indexed {stats['indexed']} boxes ({stats['skipped']} without a Secure User String)")
+
+
+def daemon_command(args):
+    """Serve storage commands from one warm process until stopped
+
+    Args:
+        args (_type_): Positional Arguments/subcommands - socket / status
+    """
+    import logging
+    import susdb_daemon
+    path = args.socket or susdb_daemon.socket_path()
+    if args.status:
+        try:
+            info = susdb_daemon.call('ping', {}, path)
+        except susdb_daemon.DaemonUnavailable:
+            print(f"No daemon on {path}")
+            sys.exit(1)
+        print(f"Daemon pid {info['pid']} on {path}, up {info['uptime']:.0f}s, {info['requests']} requests")
+        return
+    logging.basicConfig(level=logging.INFO)
+    susdb_daemon.serve(path)
+
+
 if __name__ == "__main__":
     args = parser.parse_args()
+    if args.command != "daemon":
+        # One-shot invocations gain nothing from a process pool, hash on this thread
+        os.environ.setdefault('HASH_EXECUTOR', 'inline')
     match args.command:
         case "store":
             store_user_string_command(args)
@@ -133,3 +388,21 @@ if __name__ == "__main__":
             verify_user_command(args)
         case "close":
             remove_user_account(args)
+        case "lookup":
+            lookup_command(args)
+        case "calibrate":
+            calibrate_command(args)
+        case "migrate-shards":
+            migrate_shards_command(args)
+        case "bench":
+            bench_command(args)
+        case "export":
+            export_command(args)
+        case "import":
+            import_command(args)
+        case "reconcile":
+            reconcile_command(args)
+        case "index-sus":
+            index_sus_command(args)
+        case "daemon":
+            daemon_command(args)
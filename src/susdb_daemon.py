@@ -0,0 +1,303 @@
+"""Module for the long-lived local SusDB daemon and its client.
+
+``susdb daemon`` keeps one process warm: S3 client and connection pool,
+resolved credentials, record cache and hashing pool. It listens on a Unix
+domain socket (``DAEMON_SOCKET``, owner-only permissions). The storage
+subcommands of the CLI (store, verify, view, retrieve, close, lookup) send their
+request there when the daemon is running and run in-process otherwise.
+
+The protocol is one JSON object per line in each direction:
+
+    {"op": "verify", "params": {"uid": ..., "string": ..., "accept_init": false},
+     "settings": {"backend": "s3", "bucket": ..., ...}}
+    {"ok": true, "result": "Successful"}
+
+The daemon runs every request with its own environment. Each request
+carries the client's ``storage_settings`` (backend, bucket, endpoint,
+region, profile, a digest of the access key, GET_PATH); the daemon refuses
+one whose settings differ from its own without running it, and the client
+then runs the command in-process, so a CLI pointed at another bucket never
+lands in the daemon's.
+
+This module only imports the standard library at the top, so the client
+side adds nothing to the CLI's start-up time.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 300.0
+# The storage operations run on the S3 manager
+BACKEND = 's3'
+
+
+class DaemonUnavailable(ConnectionError):
+    """Raised when no daemon is listening on the socket; the caller runs the command itself"""
+
+
+class DaemonError(RuntimeError):
+    """Raised when the daemon failed a request, or went away while handling it"""
+
+
+class DaemonMismatch(DaemonUnavailable):
+    """Raised when the daemon runs with other storage settings and refused the request unrun"""
+
+
+def socket_path() -> str:
+    """Socket of the daemon, from DAEMON_SOCKET"""
+    from settings import daemon_socket
+    return os.path.expanduser(daemon_socket)
+
+
+def storage_settings() -> Dict[str, Optional[str]]:
+    """Settings deciding where this process's operations land; the access key is sent as a digest"""
+    from settings import get_path, s3_bucket_name, s3_endpoint_url
+    access_key = os.getenv('AWS_ACCESS_KEY_ID')
+    return {
+        'backend': BACKEND,
+        'bucket': s3_bucket_name,
+        'endpoint_url': s3_endpoint_url,
+        'region': os.getenv('AWS_REGION'),
+        'profile': os.getenv('AWS_PROFILE'),
+        'access_key': hashlib.sha256(access_key.encode('utf-8')).hexdigest()[:16] if access_key else None,
+        'get_path': get_path,
+    }
+
+
+###########################################################
+###############       OPERATIONS    #######################
+###########################################################
+
+def store(params: Dict[str, Any]) -> Optional[str]:
+    from user_db_manager import UserDBManager
+    req = {'request_string': params['string']}
+    return UserDBManager(accept_init=params.get('accept_init', False)).store_user_string(req).get('id')
+
+
+def verify(params: Dict[str, Any]) -> Optional[str]:
+    import argon2
+    from user_db_manager import UserDBManager
+    req = {'request_string': params['string'], 'uid': params['uid']}
+    try:
+        return UserDBManager(params['uid'], accept_init=params.get('accept_init', False)).verify_user(req)
+    except argon2.exceptions.InvalidHashError:
+        return 'Invalid parameters passed to CLI, Check uid or string'
+
+
+def view(params: Dict[str, Any]) -> Any:
+    from user_db_manager import UserDBManager
+    user_id = params['uid']
+    return UserDBManager(user_id, accept_init=params.get('accept_init', False)).display_user_db(user_id)
+
+
+def retrieve(params: Dict[str, Any]) -> Any:
+    from user_db_manager import UserDBManager
+    user_id = params['uid']
+    return UserDBManager(user_id, accept_init=params.get('accept_init', False)).deserialize_data(user_id, params['key'])
+
+
+def close(params: Dict[str, Any]) -> str:
+    from user_db_manager import UserDBManager
+    req = {'uid': params['uid'], 'sus': params['sus']}
+    return UserDBManager(params['uid'], accept_init=params.get('accept_init', False)).close_account(req)
+
+
+def lookup(params: Dict[str, Any]) -> Optional[str]:
+    from user_db_manager import UserDBManager
+    return UserDBManager.find_uid(params['sus'])
+
+
+OPERATIONS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'store': store,
+    'verify': verify,
+    'view': view,
+    'retrieve': retrieve,
+    'close': close,
+    'lookup': lookup,
+}
+
+
+###########################################################
+###############         CLIENT      #######################
+###########################################################
+
+def call(
+        op: str,
+        params: Dict[str, Any],
+        path: Optional[str] = None,
+        settings: Optional[Dict[str, Optional[str]]] = None) \
+        -> Any:
+    """Run an operation on the daemon.
+
+    Args:
+        settings (Optional[Dict[str, Optional[str]]]): Storage settings the
+            daemon must share, defaults to this process's ``storage_settings``
+
+    Raises:
+        DaemonUnavailable: If no daemon listens on the socket (nothing was sent)
+        DaemonMismatch: If the daemon runs with other storage settings (nothing was run)
+        DaemonError: If the daemon reported an error or dropped the connection;
+            the operation may have run, so it must not simply be retried locally
+
+    Returns:
+        Any: The operation's result
+    """
+    path = path or socket_path()
+    settings = storage_settings() if settings is None else settings
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(CONNECT_TIMEOUT)
+        try:
+            client.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError, socket.timeout) as e:
+            raise DaemonUnavailable(f"No daemon on {path}: {e}") from e
+        client.settimeout(REQUEST_TIMEOUT)
+        try:
+            with client.makefile('rwb') as stream:
+                request = {'op': op, 'params': params, 'settings': settings}
+                stream.write(json.dumps(request).encode('utf-8') + b'\n')
+                stream.flush()
+                line = stream.readline()
+        except OSError as e:
+            raise DaemonError(f"Lost the daemon on {path}: {e}") from e
+    finally:
+        client.close()
+    if not line:
+        raise DaemonError(f"The daemon on {path} closed the connection")
+    response = json.loads(line)
+    if response.get('mismatch'):
+        raise DaemonMismatch(response.get('error', 'The daemon runs with other settings'))
+    if not response.get('ok'):
+        raise DaemonError(response.get('error', 'Unknown daemon error'))
+    return response.get('result')
+
+
+def run(op: str, params: Dict[str, Any], use_daemon: bool = True) -> Any:
+    """Run an operation through the daemon if one is listening, else in this process"""
+    if use_daemon:
+        try:
+            return call(op, params)
+        except DaemonMismatch as e:
+            logger.warning("[DAEMON] %s, running in this process", e)
+        except DaemonUnavailable:
+            pass
+    return OPERATIONS[op](params)
+
+
+###########################################################
+###############         SERVER      #######################
+###########################################################
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers every request line of one client connection"""
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            self.wfile.write(json.dumps(self.server.dispatch(line)).encode('utf-8') + b'\n')  # type: ignore[attr-defined]
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server running OPERATIONS in this process.
+
+    Args:
+        path (str): Socket to listen on; a stale one left by a crashed daemon is replaced
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.started = time.time()
+        self.requests = 0
+        self.settings = storage_settings()
+        self._count_lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                call('ping', {}, path)
+            except DaemonUnavailable:
+                os.unlink(path)
+            else:
+                raise RuntimeError(f"A daemon is already listening on {path}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def dispatch(self, line: bytes) -> Dict[str, Any]:
+        """Run one request line and build its response"""
+        with self._count_lock:
+            self.requests += 1
+        try:
+            request = json.loads(line)
+            op, params = request['op'], request.get('params', {})
+        except (ValueError, KeyError, TypeError) as e:
+            return {'ok': False, 'error': f"Malformed request: {e}"}
+        if op == 'ping':
+            return {'ok': True, 'result': {'pid': os.getpid(), 'uptime': time.time() - self.started,
+                                           'requests': self.requests}}
+        operation = OPERATIONS.get(op)
+        if operation is None:
+            return {'ok': False, 'error': f"Unknown operation: {op}"}
+        settings = request.get('settings') or {}
+        differing = sorted(key for key in set(settings) | set(self.settings)
+                           if settings.get(key) != self.settings.get(key))
+        if differing:
+            return {'ok': False, 'mismatch': differing,
+                    'error': f"The daemon runs with other settings ({', '.join(differing)})"}
+        try:
+            return {'ok': True, 'result': operation(params)}
+        except Exception as e:
+            logger.error("[DAEMON] %s failed: %s", op, e, exc_info=True)
+            return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def warm_up() -> None:
+    """Build the S3 client and start the hashing pool before the first request"""
+    from hashing import get_hash_executor
+    from s3_client import get_s3_client
+    get_s3_client()
+    executor = get_hash_executor()
+    executor.verify(executor.hash('warm-up'), 'warm-up')
+
+
+def serve(path: Optional[str] = None) -> None:
+    """Warm up and answer requests until SIGTERM or SIGINT"""
+    path = path or socket_path()
+    server = DaemonServer(path)
+    warm_up()
+
+    def stop(signum: int, frame: Any) -> None:
+        # shutdown() waits for serve_forever, which runs on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("[DAEMON] Listening on %s (pid %s)", path, os.getpid())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        logger.info("[DAEMON] Stopped after %s requests", server.requests)
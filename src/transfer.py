@@ -0,0 +1,476 @@
+"""Module for streaming every box out of one backend and into another.
+
+``export_boxes`` walks the boxes of a backend in a stable order and writes
+one entry per box, either as NDJSON (``{"uid": ..., "record": {...}}`` per
+line) or as binary frames of the compact record format. ``import_boxes``
+reads such a file back into any backend. Reads and writes run on a bounded
+thread pool, and results are consumed in order through a fixed window, so
+memory stays constant whatever the number of boxes.
+
+Imported boxes go through the same upkeep as a store by the managers: the
+secured user string is indexed before the box is written, and on S3 the
+record cache and Redis entries of the box are replaced, so lookups and
+recoveries find imported boxes and no cache serves what they replaced.
+
+A checkpoint file records how far a run got (the last exported key, or the
+input offset of the last imported entry), so an interrupted run can be
+resumed with ``resume=True`` instead of starting over.
+
+Backends are ``s3`` (the configured bucket), ``dbm`` (the shard store) and
+``log`` (the log-structured store).
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from record_format import RecordFormatError, decode_record, encode_record
+
+FORMATS = ('ndjson', 'binary')
+BACKENDS = ('s3', 'dbm', 'log')
+KEY_PREFIX = 'user_db_'
+# Binary exports: this header, then per box a frame header, the uid and the encoded record
+BINARY_MAGIC = b'SUSX\x01'
+FRAME = struct.Struct('>HI')
+CHECKPOINT_RECORDS = 1000
+CHECKPOINT_SECONDS = 5.0
+
+Record = Dict[str, str]
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class TransferError(RuntimeError):
+    """Raised for unreadable input or a checkpoint that does not match the run"""
+
+
+def _index(sus_index: Any, uid: str, record: Record) -> None:
+    """Index the secured user string of a box about to be written"""
+    secured_user_string = record.get('secured_user_string')
+    if sus_index is not None and secured_user_string:
+        sus_index.add(secured_user_string, uid)
+
+
+class S3Boxes:
+    """Boxes of an S3 bucket, listed in key order"""
+
+    name = 's3'
+
+    def __init__(self, bucket: Optional[str] = None, client: Any = None, sus_index: Any = None) -> None:
+        from s3_client import get_s3_client
+        from settings import s3_bucket_name
+        from sus_index import S3SusIndex
+        self.bucket = bucket or s3_bucket_name
+        self.client = client or get_s3_client()
+        self.sus_index = sus_index or S3SusIndex(self.bucket, self.client)
+
+    def keys(self, after: Optional[str] = None) -> Iterator[str]:
+        """Every uid in the bucket after ``after``, one listing page at a time"""
+        params = {'Bucket': self.bucket, 'Prefix': KEY_PREFIX}
+        if after is not None:
+            params['StartAfter'] = KEY_PREFIX + after
+        for page in self.client.get_paginator('list_objects_v2').paginate(**params):
+            for item in page.get('Contents', ()):
+                yield item['Key'][len(KEY_PREFIX):]
+
+    def read(self, uid: str) -> Optional[Record]:
+        """The record of a box, None if it was closed since it was listed"""
+        from botocore.exceptions import ClientError
+        from s3_client import MISSING_CODES, s3_error_code
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=KEY_PREFIX + uid)
+        except ClientError as e:
+            if s3_error_code(e) in MISSING_CODES:
+                return None
+            raise
+        return decode_record(response['Body'].read())
+
+    def exists(self, uid: str) -> bool:
+        """Whether the box exists, with a HEAD request"""
+        from botocore.exceptions import ClientError
+        from s3_client import MISSING_CODES, s3_error_code
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=KEY_PREFIX + uid)
+        except ClientError as e:
+            if s3_error_code(e) in MISSING_CODES:
+                return False
+            raise
+        return True
+
+    def write(self, uid: str, record: Record, overwrite: bool = False) -> bool:
+        """Store a record; unless ``overwrite``, an existing box is kept.
+
+        Its secured user string is indexed first and, once written, the
+        record replaces any cached copy, as UserDBManager._write_to_s3 does.
+
+        Raises:
+            ClientError: If S3 refused a write
+            SharedCacheError: If the Redis entry of the box could not be replaced
+
+        Returns:
+            bool: True if the record was written
+        """
+        from botocore.exceptions import ClientError
+        from record_cache import record_cache
+        from redis_cache import shared_cache
+        from s3_client import CONFLICT_CODES, s3_error_code
+        key = KEY_PREFIX + uid
+        _index(self.sus_index, uid, record)
+        params = {'Bucket': self.bucket, 'Key': key, 'Body': encode_record(record)}
+        if overwrite:
+            shared_cache.delete(key)
+        else:
+            params['IfNoneMatch'] = '*'
+        try:
+            response = self.client.put_object(**params)
+        except ClientError as e:
+            if not overwrite and s3_error_code(e) in CONFLICT_CODES:
+                return False
+            raise
+        record_cache.invalidate(key)
+        shared_cache.put(key, record, response.get('ETag'))
+        return True
+
+
+class LocalBoxes:
+    """Boxes of a local store (``dbm_engine.ShardStore`` or ``log_store.LogStore``).
+
+    Sharded stores are walked shard by shard with each shard's uids sorted,
+    other stores in uid order, so a run can resume after any uid. Writes
+    update ``uid_filter`` and ``sus_index`` when they are given.
+    """
+
+    def __init__(self, name: str, store: Any, uid_filter: Any = None, sus_index: Any = None) -> None:
+        self.name = name
+        self.store = store
+        self.uid_filter = uid_filter
+        self.sus_index = sus_index
+
+    def keys(self, after: Optional[str] = None) -> Iterator[str]:
+        """Every uid after ``after`` in the store's walk order"""
+        if hasattr(self.store, 'shard_uids'):
+            start = self.store.shard_for(after) if after is not None else 0
+            for index in range(start, self.store.shard_count):
+                for uid in sorted(self.store.shard_uids(index)):
+                    if index == start and after is not None and uid <= after:
+                        continue
+                    yield uid
+        else:
+            for uid in sorted(self.store.uids()):
+                if after is None or uid > after:
+                    yield uid
+
+    def read(self, uid: str) -> Optional[Record]:
+        """The record of a box, None if it was closed since it was listed"""
+        return self.store.get(uid)
+
+    def exists(self, uid: str) -> bool:
+        """Whether the box exists"""
+        return self.store.contains(uid)
+
+    def write(self, uid: str, record: Record, overwrite: bool = False) -> bool:
+        """Store a record; unless ``overwrite``, an existing box is kept.
+
+        Returns:
+            bool: True if the record was written
+        """
+        if self.uid_filter is not None:
+            self.uid_filter.add(uid)
+        _index(self.sus_index, uid, record)
+        if overwrite:
+            self.store.put(uid, record)
+            return True
+        return self.store.create(uid, record)
+
+
+def open_backend(name: str, bucket: Optional[str] = None) -> Any:
+    """Source or destination for a transfer by backend name"""
+    if name == 's3':
+        return S3Boxes(bucket)
+    if name == 'dbm':
+        import dbm_engine
+        return LocalBoxes('dbm', dbm_engine.shard_store, dbm_engine.shard_filter, dbm_engine.UserDBManager.sus_index)
+    if name == 'log':
+        import log_engine
+        return LocalBoxes('log', log_engine.log_store, sus_index=log_engine.UserDBManager.sus_index)
+    raise ValueError(f"Unknown backend: {name}")
+
+
+class Checkpoint:
+    """Progress of a run, rewritten atomically so a crash leaves the previous state"""
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        with open(self.path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def save(self, state: Dict[str, Any]) -> None:
+        if self.path is None:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.path)
+
+
+def encode_entry(fmt: str, uid: str, record: Record) -> bytes:
+    """One box as it is written to an export"""
+    if fmt == 'ndjson':
+        return (json.dumps({'uid': uid, 'record': record}, separators=(',', ':')) + '\n').encode('utf-8')
+    uid_bytes = uid.encode('utf-8')
+    record_bytes = encode_record(record, 'binary')
+    return FRAME.pack(len(uid_bytes), len(record_bytes)) + uid_bytes + record_bytes
+
+
+def read_entries(path: str, offset: int = 0) -> Iterator[Tuple[str, Record, int]]:
+    """Boxes of the export at ``path`` from ``offset`` on, with the offset just past each one.
+
+    The format is recognised from the head of the file; ``offset`` is 0 or
+    an offset reported by a previous call.
+
+    Raises:
+        TransferError: If an entry is truncated or not valid
+    """
+    with open(path, 'rb') as stream:
+        binary = stream.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+        if offset == 0 and binary:
+            offset = len(BINARY_MAGIC)
+        stream.seek(offset)
+        if binary:
+            yield from _binary_entries(stream, offset)
+            return
+        for line in stream:
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                uid, record = entry['uid'], entry['record']
+            except (ValueError, KeyError, TypeError) as e:
+                raise TransferError(f"Invalid entry ending at offset {offset}: {e}") from e
+            yield uid, record, offset
+
+
+def _binary_entries(stream: BinaryIO, offset: int) -> Iterator[Tuple[str, Record, int]]:
+    while True:
+        header = stream.read(FRAME.size)
+        if not header:
+            return
+        if len(header) < FRAME.size:
+            raise TransferError(f"Truncated entry at offset {offset}")
+        uid_length, record_length = FRAME.unpack(header)
+        body = stream.read(uid_length + record_length)
+        if len(body) < uid_length + record_length:
+            raise TransferError(f"Truncated entry at offset {offset}")
+        offset += FRAME.size + len(body)
+        try:
+            record = decode_record(body[uid_length:])
+        except RecordFormatError as e:
+            raise TransferError(f"Invalid entry ending at offset {offset}: {e}") from e
+        yield body[:uid_length].decode('utf-8'), record, offset
+
+
+def _ordered(
+        pool: ThreadPoolExecutor,
+        fn: Callable[[T], R],
+        items: Iterable[T],
+        window: int) \
+        -> Iterator[Tuple[T, R]]:
+    """Run ``fn`` over ``items`` on the pool, yielding results in input order
+    with at most ``window`` calls in flight"""
+    pending: deque = deque()
+    for item in items:
+        pending.append((item, pool.submit(fn, item)))
+        if len(pending) >= window:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+    while pending:
+        done_item, future = pending.popleft()
+        yield done_item, future.result()
+
+
+class _Progress:
+    """Decides when to write a checkpoint and report progress"""
+
+    def __init__(self, every: int, seconds: float) -> None:
+        self.every = every
+        self.seconds = seconds
+        self._count = 0
+        self._last = time.monotonic()
+
+    def due(self) -> bool:
+        self._count += 1
+        if self._count >= self.every or time.monotonic() - self._last >= self.seconds:
+            self._count = 0
+            self._last = time.monotonic()
+            return True
+        return False
+
+
+def export_boxes(
+        source: Any,
+        output: str,
+        fmt: str = 'ndjson',
+        concurrency: int = 32,
+        checkpoint: Optional[str] = None,
+        resume: bool = False,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        checkpoint_every: int = CHECKPOINT_RECORDS) \
+        -> Dict[str, Any]:
+    """Write every box of ``source`` to ``output`` (``-`` for stdout).
+
+    Args:
+        source: Backend from ``open_backend``
+        output (str): File to write
+        fmt (str): ``ndjson`` or ``binary``
+        concurrency (int): Parallel reads
+        checkpoint (Optional[str]): File recording progress, needed to resume
+        resume (bool): Continue the run recorded in ``checkpoint``
+        on_progress: Called with the progress state at every checkpoint
+
+    Raises:
+        TransferError: If the checkpoint belongs to another export
+
+    Returns:
+        Dict[str, Any]: Boxes exported, boxes closed while exporting, seconds taken
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    to_stdout = output == '-'
+    if to_stdout and (checkpoint or resume):
+        raise TransferError("Checkpoints need an output file")
+    tracker = Checkpoint(checkpoint)
+    state = {'operation': 'export', 'source': source.name, 'output': os.path.abspath(output) if not to_stdout else '-',
+             'format': fmt, 'last_key': None, 'offset': 0, 'exported': 0, 'missing': 0, 'complete': False}
+    previous = tracker.load() if resume else None
+    if previous is not None:
+        if any(previous.get(key) != state[key] for key in ('operation', 'source', 'output', 'format')):
+            raise TransferError(f"Checkpoint {checkpoint} belongs to another export")
+        state = previous
+        if state['complete']:
+            return {'exported': state['exported'], 'missing': state['missing'], 'seconds': 0.0}
+
+    started = time.perf_counter()
+    if to_stdout:
+        stream: BinaryIO = sys.stdout.buffer
+    elif previous is not None:
+        stream = open(output, 'r+b')
+        stream.truncate(state['offset'])
+        stream.seek(state['offset'])
+    else:
+        stream = open(output, 'wb')
+    try:
+        if previous is None and fmt == 'binary':
+            stream.write(BINARY_MAGIC)
+        progress = _Progress(checkpoint_every, CHECKPOINT_SECONDS)
+        offset = 0 if to_stdout else stream.tell()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for uid, record in _ordered(pool, source.read, source.keys(state['last_key']), concurrency * 4):
+                if record is None:
+                    state['missing'] += 1
+                else:
+                    entry = encode_entry(fmt, uid, record)
+                    stream.write(entry)
+                    offset += len(entry)
+                    state['exported'] += 1
+                state['last_key'] = uid
+                if progress.due():
+                    _commit(stream, to_stdout, tracker, state, offset, on_progress)
+        state['complete'] = True
+        _commit(stream, to_stdout, tracker, state, offset, on_progress)
+    finally:
+        if not to_stdout:
+            stream.close()
+    return {'exported': state['exported'], 'missing': state['missing'], 'seconds': time.perf_counter() - started}
+
+
+def _commit(
+        stream: BinaryIO,
+        to_stdout: bool,
+        tracker: Checkpoint,
+        state: Dict[str, Any],
+        offset: int,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]]) \
+        -> None:
+    """Make the output durable up to ``offset`` and then record it"""
+    stream.flush()
+    if not to_stdout:
+        os.fsync(stream.fileno())
+    state['offset'] = offset
+    tracker.save(state)
+    if on_progress is not None:
+        on_progress(state)
+
+
+def import_boxes(
+        destination: Any,
+        input_path: str,
+        concurrency: int = 32,
+        overwrite: bool = False,
+        checkpoint: Optional[str] = None,
+        resume: bool = False,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        checkpoint_every: int = CHECKPOINT_RECORDS) \
+        -> Dict[str, Any]:
+    """Write every box of an export into ``destination``.
+
+    Existing boxes are kept unless ``overwrite``, so an import can safely
+    be run again.
+
+    Args:
+        destination: Backend from ``open_backend``
+        input_path (str): Export to read, NDJSON or binary (recognised automatically)
+        concurrency (int): Parallel writes
+        overwrite (bool): Replace boxes that already exist
+        checkpoint (Optional[str]): File recording progress, needed to resume
+        resume (bool): Continue the run recorded in ``checkpoint``
+        on_progress: Called with the progress state at every checkpoint
+
+    Raises:
+        TransferError: If the input is damaged or the checkpoint belongs to another import
+
+    Returns:
+        Dict[str, Any]: Boxes written, boxes kept because they existed, seconds taken
+    """
+    tracker = Checkpoint(checkpoint)
+    state = {'operation': 'import', 'destination': destination.name, 'input': os.path.abspath(input_path),
+             'offset': 0, 'imported': 0, 'existing': 0, 'complete': False}
+    previous = tracker.load() if resume else None
+    if previous is not None:
+        if any(previous.get(key) != state[key] for key in ('operation', 'destination', 'input')):
+            raise TransferError(f"Checkpoint {checkpoint} belongs to another import")
+        state = previous
+        if state['complete']:
+            return {'imported': state['imported'], 'existing': state['existing'], 'seconds': 0.0}
+
+    started = time.perf_counter()
+    progress = _Progress(checkpoint_every, CHECKPOINT_SECONDS)
+
+    def write(entry: Tuple[str, Record, int]) -> bool:
+        return destination.write(entry[0], entry[1], overwrite)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        entries = read_entries(input_path, state['offset'])
+        for (_, _, end), written in _ordered(pool, write, entries, concurrency * 4):
+            state['imported' if written else 'existing'] += 1
+            state['offset'] = end
+            if progress.due():
+                tracker.save(state)
+                if on_progress is not None:
+                    on_progress(state)
+    state['complete'] = True
+    tracker.save(state)
+    if on_progress is not None:
+        on_progress(state)
+    return {'imported': state['imported'], 'existing': state['existing'], 'seconds': time.perf_counter() - started}
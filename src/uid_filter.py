@@ -0,0 +1,278 @@
+"""Module for the Bloom filter of known box keys.
+
+A lookup the filter answers with "definitely absent" needs no shard read.
+The filter lives in a memory-mapped snapshot file shared by every process
+on the host, so a box stored by one worker is visible to the others at
+once, and a restart reuses the snapshot instead of reading every box again.
+
+Until the first build has finished every key is reported as possibly
+present. A Bloom filter cannot forget keys: closed boxes keep their bits
+and are looked up in storage as before. Boxes written without going
+through a filter-enabled manager (e.g. while UID_FILTER was off) are not
+seen; delete the snapshot to have it rebuilt.
+
+Only stores owned by a single host may use a filter. Boxes created in a
+shared store by another host would be reported as certainly absent, so the
+S3 backend runs without one.
+"""
+
+import atexit
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from metrics import UID_FILTER_REJECTIONS
+from settings import uid_filter_capacity, uid_filter_dir, uid_filter_enabled, uid_filter_error_rate
+
+logger = logging.getLogger(__name__)
+
+# magic, version, hash count, ready flag, bit count, build time
+HEADER = struct.Struct('>4sBBBxQd')
+MAGIC = b'SUBF'
+VERSION = 1
+READY_OFFSET = 6
+BUILT_AT_OFFSET = 16
+BITS_OFFSET = 32
+BUILD_BATCH = 1024
+RETRY_SECONDS = 60.0
+
+
+def filter_size(capacity: int, error_rate: float) -> Tuple[int, int]:
+    """Bit and hash counts for ``capacity`` keys at ``error_rate`` false positives"""
+    bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    bits = (bits + 7) // 8 * 8
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+class UidFilter:
+    """Bloom filter of box keys backed by a shared snapshot file.
+
+    Args:
+        name (str): Label of the filter in logs and metrics
+        path (str): Snapshot file
+        source (Callable[[], Iterable[str]]): Streams every existing key, used to build the filter
+        capacity (int): Expected number of keys
+        error_rate (float): False positive rate at ``capacity`` keys
+    """
+
+    enabled = True
+
+    def __init__(
+            self,
+            name: str,
+            path: str,
+            source: Callable[[], Iterable[str]],
+            capacity: int = uid_filter_capacity,
+            error_rate: float = uid_filter_error_rate) \
+            -> None:
+        self.name = name
+        self.path = path
+        self.source = source
+        self.bits, self.hashes = filter_size(capacity, error_rate)
+        self._lock = threading.Lock()
+        self._building = False
+        self._next_attempt = 0.0
+        self._fd, self._map = self._open()
+
+    def _open(self) -> Tuple[int, mmap.mmap]:
+        size = BITS_OFFSET + self.bits // 8
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            current = HEADER.unpack(header) if len(header) == HEADER.size else None
+            if (current is None or current[:3] != (MAGIC, VERSION, self.hashes)
+                    or current[4] != self.bits or os.fstat(fd).st_size != size):
+                # Missing, damaged or sized for other settings: start empty and unbuilt
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, HEADER.pack(MAGIC, VERSION, self.hashes, 0, self.bits, 0.0), 0)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        return fd, mmap.mmap(fd, size)
+
+    @property
+    def ready(self) -> bool:
+        """Whether a complete build has been recorded in the snapshot"""
+        return bool(self._map[READY_OFFSET])
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.bits for i in range(self.hashes)]
+
+    def might_contain(self, key: str) -> bool:
+        """False only if ``key`` was certainly never added; starts a build if there is none yet"""
+        if not self._map[READY_OFFSET]:
+            self._start_build()
+            return True
+        bitmap = self._map
+        for position in self._positions(key):
+            if not bitmap[BITS_OFFSET + (position >> 3)] & (1 << (position & 7)):
+                UID_FILTER_REJECTIONS.labels(self.name).inc()
+                return False
+        return True
+
+    def add(self, key: str) -> None:
+        """Record a stored box"""
+        self.add_many((key,))
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        """Record several stored boxes under one lock"""
+        positions = [position for key in keys for position in self._positions(key)]
+        if not positions:
+            return
+        length = self.bits // 8
+        with self._lock:
+            # Other processes set bits in the same bytes, so updates are serialised across them too
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, BITS_OFFSET)
+            try:
+                bitmap = self._map
+                for position in positions:
+                    bitmap[BITS_OFFSET + (position >> 3)] |= 1 << (position & 7)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, BITS_OFFSET)
+
+    def build(self) -> bool:
+        """Stream every key from the source into the filter and mark it ready.
+
+        Only one process builds at a time; stores made meanwhile are added
+        to the same bits, so none are missed.
+
+        Returns:
+            bool: Whether the filter is ready afterwards
+        """
+        lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return self.ready
+            if self.ready:
+                return True
+            started = time.perf_counter()
+            count = 0
+            batch: List[str] = []
+            for key in self.source():
+                batch.append(key)
+                if len(batch) >= BUILD_BATCH:
+                    self.add_many(batch)
+                    count += len(batch)
+                    batch = []
+            self.add_many(batch)
+            count += len(batch)
+            struct.pack_into('>d', self._map, BUILT_AT_OFFSET, time.time())
+            self._map[READY_OFFSET] = 1
+            self._map.flush()
+            logger.info("[UIDFILTER] Built the %s filter from %s keys in %.1fs",
+                        self.name, count, time.perf_counter() - started)
+            return True
+        finally:
+            os.close(lock_fd)
+
+    def _start_build(self) -> None:
+        if self._building or time.monotonic() < self._next_attempt:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build_in_background, name=f'susdb-uid-filter-{self.name}', daemon=True).start()
+
+    def _build_in_background(self) -> None:
+        try:
+            self.build()
+        except Exception as e:
+            logger.error("[UIDFILTER] Building the %s filter failed: %s", self.name, e)
+        finally:
+            self._next_attempt = time.monotonic() + RETRY_SECONDS
+            self._building = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, readiness and build time of the filter"""
+        return {
+            'name': self.name,
+            'bits': self.bits,
+            'hashes': self.hashes,
+            'ready': self.ready,
+            'built_at': struct.unpack_from('>d', self._map, BUILT_AT_OFFSET)[0],
+        }
+
+    def flush(self) -> None:
+        """Write the snapshot to disk"""
+        self._map.flush()
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._building = False
+
+
+class DisabledFilter:
+    """Stand-in used when UID_FILTER is off: every key may exist"""
+
+    enabled = False
+    ready = False
+
+    def might_contain(self, key: str) -> bool:
+        return True
+
+    def add(self, key: str) -> None:
+        pass
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        pass
+
+    def build(self) -> bool:
+        return False
+
+
+DISABLED = DisabledFilter()
+
+_filters: Dict[str, UidFilter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_uid_filter(name: str, source: Callable[[], Iterable[str]]) -> Any:
+    """The filter named ``name``, or DISABLED when UID_FILTER is off or there is nowhere to keep it.
+
+    Args:
+        name (str): Backend name, also used for the snapshot file name
+        source (Callable[[], Iterable[str]]): Streams every existing key of the backend
+    """
+    if not uid_filter_enabled:
+        return DISABLED
+    if not uid_filter_dir:
+        logger.warning("[UIDFILTER] UID_FILTER is on but neither UID_FILTER_DIR nor GET_PATH is set, filter disabled")
+        return DISABLED
+    with _registry_lock:
+        uid_filter = _filters.get(name)
+        if uid_filter is None:
+            directory = os.path.expanduser(uid_filter_dir)
+            os.makedirs(directory, exist_ok=True)
+            uid_filter = UidFilter(name, os.path.join(directory, f'uid_filter_{name}.bloom'), source)
+            _filters[name] = uid_filter
+        return uid_filter
+
+
+def _flush_all() -> None:
+    for uid_filter in list(_filters.values()):
+        uid_filter.flush()
+
+
+def _reset_after_fork() -> None:
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    for uid_filter in _filters.values():
+        uid_filter._reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_flush_all)
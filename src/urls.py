@@ -2,7 +2,7 @@
 Module for storing local URLs for authentication-related endpoints.
 """
 
-__all__ = ['VIEW', 'STORE', 'RETRIEVE', 'CLOSE', 'VERIFY', 'RECOVER']
+__all__ = ['VIEW', 'STORE', 'RETRIEVE', 'CLOSE', 'VERIFY', 'RECOVER', 'STORE_BATCH', 'VERIFY_BATCH', 'METRICS']
 
 VIEW = '/view'
 STORE = '/store'
@@ -10,3 +10,6 @@ RETRIEVE = '/retrieve'
 CLOSE = '/close'
 VERIFY = '/verify'
 RECOVER = '/recover'
+STORE_BATCH = '/store/batch'
+VERIFY_BATCH = '/verify/batch'
+METRICS = '/metrics'
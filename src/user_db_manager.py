@@ -1,27 +1,41 @@
 """Module to store hashed user strings in database"""
 
-import base64
 import datetime
-import dbm
+import hashlib
 import json
 import logging
 import os
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import (
     Dict,
+    List,
+    Tuple,
     Union,
     Optional
 )
-from logging.handlers import RotatingFileHandler
 import argon2
 import shortuuid
-from argon2 import PasswordHasher
 from dotenv import load_dotenv
-import boto3
-import io
 from botocore.exceptions import ClientError
 
-from settings import get_log_path, get_path
+from hashing import HashQueueFull, get_hash_executor
+from log_pipeline import file_handler
+from metrics import stage, timed_operation
+from settings import get_log_path, get_path, s3_bucket_name, s3_lazy_init, s3_max_pool_connections
+from s3_client import (
+    CONFLICT_CODES,
+    MISSING_CODES,
+    NOT_MODIFIED_CODES,
+    get_s3_client,
+    s3_error_code,
+)
+from record_cache import CachedRecord, record_cache
+from record_format import decode_record, encode_record
+from redis_cache import SharedCacheError, shared_cache
+from singleflight import SingleFlight
+from sus_index import S3SusIndex
+from uid_filter import DISABLED
 
 load_dotenv()
 
@@ -32,6 +46,43 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
+if get_log_path is not None:
+    logger.addHandler(file_handler(get_log_path))
+
+
+# The bucket is shared by every host and replica, and a host-local filter
+# would answer "absent" for boxes they created; only the local engines use one
+uid_filter = DISABLED
+sus_index = S3SusIndex()
+
+# Statuses of verify_user, shared by verify_many so both answer alike
+UID_NOT_PROVIDED = "UID not provided in the request."
+STRING_NOT_PROVIDED = "User string not provided in the request."
+HASH_NOT_FOUND = "User hash not found in the database."
+STRING_MISMATCH = "User string does not match the stored hash."
+VERIFIED = "Successful"
+
+# Concurrent reads of one box, and identical verifications, share one call
+_record_reads = SingleFlight('read')
+_verifications = SingleFlight('verify')
+os.register_at_fork(after_in_child=_record_reads._reset_after_fork)
+os.register_at_fork(after_in_child=_verifications._reset_after_fork)
+
+
+def _submit_verify(user_id: str, user_hash: str, user_string: str) -> Future:
+    """Queue a verification, reporting a full queue through the future instead of raising.
+    An identical verification already in flight is shared rather than run twice.
+    """
+    def submit() -> Future:
+        try:
+            return get_hash_executor().submit_verify(user_hash, user_string)
+        except HashQueueFull as e:
+            failed: Future = Future()
+            failed.set_exception(e)
+            return failed
+
+    digest = hashlib.sha256(user_string.encode()).digest()
+    return _verifications.share((user_id, user_hash, digest), submit)
 
 
 class UserDBManager:
@@ -40,32 +91,53 @@ class UserDBManager:
     This class manages user-specific databases, allowing for the storage and retrieval
     of hashed and secured user strings.
     """
-    
+
+    metrics_backend = 's3'
+
     def db_file_exists(self) -> bool:
         """Check if a DBM file already exists with the given file path and name."""
+        if not uid_filter.might_contain(self.__file_name):
+            return False
         try:
             self.s3_client.head_object(Bucket=self.bucket_name, Key=self.__file_name)
             return True
         except ClientError:
             return False
 
-    def __init__(self, uid: Optional[str] = None, accept_init: bool = True) -> None:
+    def __init__(
+            self,
+            uid: Optional[str] = None,
+            accept_init: bool = True,
+            lazy: Optional[bool] = None) \
+            -> None:
         """Initialize the user storage instance
-        with a unique identifier attached to file name."""
+        with a unique identifier attached to file name.
+
+        In lazy mode (``lazy=True`` or ``S3_LAZY_INIT=true``) no storage call
+        is made here: the first read doubles as the existence check and a new
+        box is created by a conditional write when it is first stored.
+        """
         self.__get_path = os.path.expanduser(get_path) if get_path else ''
         self.__unique_identifier = uid if uid else str(uuid.uuid4()) #Except for storing strings, always pass in the uid
         self.__file_name = f"user_db_{self.__unique_identifier}"
-        self.s3_client = boto3.client('s3')
-        self.bucket_name = os.getenv('S3_BUCKET_NAME')
+        self.__is_new = uid is None
+        self.__accept_init = accept_init
+        self.__lazy = s3_lazy_init if lazy is None else lazy
+        self.s3_client = get_s3_client()
+        self.bucket_name = s3_bucket_name
+
+        if self.__lazy:
+            logger.info("[INIT] Lazy UserDBManager instance for %s, existence checked on first read.", self.get_file_name)
+            return
 
         if not self.db_file_exists():
             if not accept_init:
-                logger.info(f"[INIT] Initialization not accepted for {self.get_file_name}")
+                logger.info("[INIT] Initialization not accepted for %s", self.get_file_name)
                 raise ValueError("Initialization not accepted")
             self.initialize_db()
-            logger.info(f"[INIT] UserDBManager instance initialized for {self.get_file_name}.")
+            logger.info("[INIT] UserDBManager instance initialized for %s.", self.get_file_name)
         else:
-            logger.info(f"[INIT] UserDBManager instance already exists for {self.get_file_name}, skipping initialisation.")
+            logger.info("[INIT] UserDBManager instance already exists for %s, skipping initialisation.", self.get_file_name)
 
     @property
     def get_file_path(self) -> Union[str, os.PathLike]:
@@ -81,41 +153,186 @@ class UserDBManager:
     def pk(self) -> str:
         """Retrieve store id"""
         return self.__unique_identifier
+
+    @staticmethod
+    def cache_stats() -> Dict[str, int]:
+        """Retrieve record cache counters (hits, misses, evictions, ...)"""
+        return record_cache.stats()
     
-    def initialize_db(self, accept_init: bool = True) -> None:
-        """Initialize the user-specific database if it doesn't exist.
-        Ensure the directory exists or create it
-        Creates an empty file named 'user_db<uid>' inside the directory
-        """
-        
-        initial_data = {
+    @staticmethod
+    def _initial_data() -> Dict[str, str]:
+        """Record written for a freshly initialised box"""
+        return {
             '_id': '',
             'hash_string': '',
             'secured_user_string': '',
             'created_on': ''
         }
 
-        self._write_to_s3(initial_data)
-        logger.info(f"[INIT] UserDBManager instance initialised for {self.get_file_name}.")
+    def initialize_db(self, accept_init: bool = True) -> None:
+        """Initialize the user-specific database if it doesn't exist.
+        The empty record is written with a conditional create, so a box
+        that already exists is left untouched.
+        """
+        if self._create_in_s3(self._initial_data()):
+            logger.info("[INIT] UserDBManager instance initialised for %s.", self.get_file_name)
+
+    def _get_record(self, file_name: str, revalidate: bool = False) -> Optional[Dict[str, str]]:
+        """Fetch and decode a box with a single GET.
+
+        Fresh entries of the record cache are served without I/O. Otherwise
+        the Redis tier is tried next, and stale entries it does not hold are
+        revalidated with a conditional GET on their ETag.
+
+        Args:
+            file_name (str): Object key of the box
+            revalidate (bool): Skip the caches and confirm any cached entry with
+                a conditional GET, for reads that authenticate or change the box:
+                the record cache is per process and does not see writes made by
+                other workers
+
+        Raises:
+            ClientError: For any S3 failure other than a missing object
+
+        Returns:
+            Optional[Dict[str, str]]: The record, or None if the box does not exist
+        """
+        cached = record_cache.get(file_name)
+        if cached is not None and cached.fresh and not revalidate:
+            return cached.record
+        if cached is None and not uid_filter.might_contain(file_name):
+            return self._on_missing_record(file_name)
+        epoch = record_cache.epoch_of(file_name)
+        shared = None if revalidate else shared_cache.get(file_name)
+        if shared is not None:
+            record_cache.put(file_name, *shared, epoch)
+            return shared[0]
+
+        found, data = _record_reads.do((self.bucket_name, file_name), self._fetch_record, file_name, cached)
+        if not found:
+            return self._on_missing_record(file_name)
+        # Callers that shared the fetch each get their own copy
+        return dict(data)
+
+    def _fetch_record(
+            self,
+            file_name: str,
+            cached: Optional[CachedRecord]) \
+            -> Tuple[bool, Optional[Dict[str, str]]]:
+        """GET and decode a box, revalidating ``cached`` by ETag if given.
+        Concurrent readers of the same box share one call.
+
+        Returns:
+            Tuple[bool, Optional[Dict[str, str]]]: Whether the box exists, and its record
+        """
+        epoch = record_cache.epoch_of(file_name)
+        params = {'Bucket': self.bucket_name, 'Key': file_name}
+        if cached is not None and cached.etag:
+            params['IfNoneMatch'] = cached.etag
+        try:
+            response = self.s3_client.get_object(**params)
+        except ClientError as e:
+            code = s3_error_code(e)
+            if cached is not None and code in NOT_MODIFIED_CODES:
+                record_cache.revalidated(file_name)
+                shared_cache.put(file_name, cached.record, cached.etag, fill=True)
+                return True, cached.record
+            if code in MISSING_CODES:
+                record_cache.invalidate(file_name)
+                return False, None
+            raise
+        body = response['Body'].read()
+        with stage('record_decode'):
+            data = decode_record(body)
+        record_cache.put(file_name, data, response.get('ETag'), epoch)
+        shared_cache.put(file_name, data, response.get('ETag'), fill=True)
+        return True, data
+
+    def _on_missing_record(self, file_name: str) -> Optional[Dict[str, str]]:
+        """Handle a read miss; in lazy mode this is where initialisation happens."""
+        if self.__lazy and self.__accept_init and file_name == self.__file_name:
+            data = self._initial_data()
+            self._create_in_s3(data)
+            return data
+        return None
 
     def _read_from_s3(self) -> Dict[str, str]:
+        """Read this box for an operation that checks or rewrites it, revalidating any cached copy"""
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.__file_name)
-            content = response['Body'].read().decode('utf-8')
-            return json.loads(content)
+            data = self._get_record(self.__file_name, revalidate=True)
         except ClientError as e:
-            logger.error(f"Error reading from S3: {str(e)}")
+            logger.error("Error reading from S3: %s", e)
+            return {}
+        if data is None:
+            logger.error("Error reading from S3: %s does not exist", self.__file_name)
             return {}
+        return data
+
+    def _write_to_s3(self, data: Dict[str, str]) -> bool:
+        """Write the box, replacing any existing one.
+
+        The Redis entry is dropped before the PUT and written through after
+        it; if Redis cannot be reached the write fails rather than leave the
+        previous record to be served until it expires.
 
-    def _write_to_s3(self, data: Dict[str, str]) -> None:
+        Returns:
+            bool: True if the object was written and the Redis tier updated
+        """
+        record_cache.invalidate(self.__file_name)
+        uid_filter.add(self.__file_name)
         try:
-            self.s3_client.put_object(
+            shared_cache.delete(self.__file_name)
+        except SharedCacheError as e:
+            logger.error("Error writing to S3, %s not written: %s", self.__file_name, e)
+            return False
+        written = False
+        try:
+            response = self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=self.__file_name,
-                Body=json.dumps(data).encode('utf-8')
+                Body=encode_record(data)
             )
+            shared_cache.put(self.__file_name, data, response.get('ETag'))
+            written = True
         except ClientError as e:
-            logger.error(f"Error writing to S3: {str(e)}")
+            logger.error("Error writing to S3: %s", e)
+        except SharedCacheError as e:
+            logger.error("Error writing to S3, %s written but not updated in Redis: %s", self.__file_name, e)
+        # Again once written: a read between the first invalidation and the PUT may have cached the old box
+        record_cache.invalidate(self.__file_name)
+        _record_reads.forget((self.bucket_name, self.__file_name))
+        return written
+
+    def _create_in_s3(self, data: Dict[str, str]) -> bool:
+        """Write the box only if it does not exist yet (If-None-Match: *).
+
+        Returns:
+            bool: True if the object was created, False if it already existed or the write failed
+        """
+        record_cache.invalidate(self.__file_name)
+        # Recorded before the write so no reader sees the box but not the bit
+        uid_filter.add(self.__file_name)
+        try:
+            response = self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.__file_name,
+                Body=encode_record(data),
+                IfNoneMatch='*'
+            )
+        except ClientError as e:
+            if s3_error_code(e) in CONFLICT_CODES:
+                logger.info("[INIT] %s already exists, skipping creation.", self.get_file_name)
+            else:
+                logger.error("Error writing to S3: %s", e)
+            return False
+        try:
+            shared_cache.put(self.__file_name, data, response.get('ETag'))
+        except SharedCacheError as e:
+            # A box that did not exist has no older record in Redis to serve
+            logger.warning("[INIT] %s not written through to Redis: %s", self.get_file_name, e)
+        record_cache.invalidate(self.__file_name)
+        _record_reads.forget((self.bucket_name, self.__file_name))
+        return True
 
     def serialize_data(
             self,
@@ -134,27 +351,33 @@ class UserDBManager:
         raise KeyError("Error parsing key")
 
     def _fetch_user_data(self, uid: str, key: str) -> Optional[Union[str, bytes]]:
-        """Fetch specific user data from the database.
+        """Fetch one field of a box from its S3 record, through the record cache.
 
         Args:
+            uid: user id
             key (str): The key to fetch the data.
 
         Returns:
-            Optional[Union[str, bytes]]: The data associated with the key, or None
+            Optional[Union[str, bytes]]: The data associated with the key, or
+            a message if the key or the box is missing
         """
         file_name = f"user_db_{uid}"
-        file_path = os.path.join(self.__get_path, file_name)
-        if os.path.exists(file_path):
-            with dbm.open(file_path, 'r') as individual_store:
-                user_data_bytes = individual_store.get(key.encode('utf-8'))
-                if user_data_bytes is not None:
-                    logger.info(f"[FETCH] Data fetched from file: {file_name} ")
-                    return user_data_bytes.decode('utf-8')
-                logger.warning(f'[FETCH] Associated key not found in file: {file_name}')
-                return f"Associated key not found"
+        try:
+            record = self._get_record(file_name)
+        except ClientError as e:
+            logger.error("Error reading from S3: %s", e)
+            record = None
+        if record is not None:
+            user_data = record.get(key)
+            if user_data is not None:
+                logger.info("[FETCH] Data fetched from file: %s ", file_name)
+                return user_data
+            logger.warning('[FETCH] Associated key not found in file: %s', file_name)
+            return f"Associated key not found"
         logger.error("[FETCH] System Error while key lookup")
         return f'System Error while fetching'
 
+    @timed_operation('retrieve')
     def deserialize_data(self, uid: str, key: str) -> Optional[Union[str, bytes]]:
         """Fetch and deserialize user data from the database using a specific key.
 
@@ -178,9 +401,7 @@ class UserDBManager:
         Returns:
             str: The hashed user string.
         """
-        user_string_bytes = user_string.encode('utf-8')
-        passwd_hash = PasswordHasher()
-        hashed_user_string = passwd_hash.hash(user_string_bytes)
+        hashed_user_string = get_hash_executor().hash(user_string)
         return hashed_user_string
 
     def generate_secured_string(self) -> str:
@@ -192,6 +413,7 @@ class UserDBManager:
         return secure_user_string
 
 
+    @timed_operation('store')
     def store_user_string(self, req: Dict[str, str]) -> Optional[Dict[str, str]]:
         """
         Store user string after encryption and generate secure user string.
@@ -209,18 +431,42 @@ class UserDBManager:
 
         serialised_data = self.serialize_data(req)
         user_hash = self.hash_user_string(serialised_data)
+        return self._store_hash(user_hash)
+
+    def _store_hash(self, user_hash: str) -> Optional[Dict[str, str]]:
+        """Write an already computed hash with a fresh secured user string.
 
+        Returns:
+            Optional[Dict[str, str]]: A dictionary containing the user ID if successful, None otherwise.
+        """
         current_datetime = datetime.datetime.now().isoformat()
         secured_user_string = self.generate_secured_string()
 
-        data = self._read_from_s3()
+        # A lazily created box has nothing to merge with, one conditional PUT creates it
+        create_only = self.__lazy and self.__is_new
+        data = {} if create_only else self._read_from_s3()
+        replaced = data.get('secured_user_string')
+        # Indexed before the box is written, unindexed once it is replaced
+        try:
+            sus_index.add(secured_user_string, self.__unique_identifier)
+        except ClientError as e:
+            logger.error("[STORAGE] Unable to index %s. Error: %s", self.get_file_name, e)
+            return None
         data.update({
             'hash_string': user_hash,
             'secured_user_string': secured_user_string,
             '_id': self.__unique_identifier,
             'created_on': current_datetime
         })
-        self._write_to_s3(data)
+        if create_only:
+            if not self._create_in_s3(data):
+                logger.error("[STORAGE] Unable to create %s", self.get_file_name)
+                return None
+        elif not self._write_to_s3(data):
+            logger.error("[STORAGE] Unable to store %s", self.get_file_name)
+            return None
+        elif replaced:
+            self._unindex(replaced)
 
         if self.__unique_identifier:
             logger.info("[STORAGE] UserID successfully assigned")
@@ -229,6 +475,50 @@ class UserDBManager:
             logger.error("[STORAGE] User ID is None. Unable to assign to uid")
             return None
 
+    @classmethod
+    @timed_operation('store_many')
+    def store_many(cls, user_strings: List[str]) -> List[Dict[str, str]]:
+        """Store a batch of user strings, each in a new box.
+
+        Each item queues its own hash on the hashing executor and writes its
+        box as soon as that hash is ready, so the first boxes are created
+        over the shared S3 connection pool while later items still hash.
+
+        Args:
+            user_strings (List[str]): The user strings to store
+
+        Returns:
+            List[Dict[str, str]]: One entry per input, in input order, either
+            ``{"id": uid}`` or ``{"error": message}``
+        """
+        executor = get_hash_executor()
+        results: List[Dict[str, str]] = [{} for _ in user_strings]
+
+        def store(position: int) -> None:
+            user_string = user_strings[position]
+            if not isinstance(user_string, str) or not user_string:
+                results[position] = {'error': 'Empty request received'}
+                return
+            try:
+                user_hash = executor.submit_hash(json.dumps(user_string)).result()
+                stored = cls(lazy=True)._store_hash(user_hash)
+            except HashQueueFull as e:
+                results[position] = {'error': str(e)}
+                return
+            except Exception as e:
+                logger.error("[STORAGE] Batch item %s failed. Error: %s", position, e)
+                results[position] = {'error': str(e)}
+                return
+            results[position] = stored if stored else {'error': 'Unable to store user string'}
+
+        writers = max(1, min(s3_max_pool_connections, len(user_strings)))
+        with ThreadPoolExecutor(max_workers=writers) as pool:
+            list(pool.map(store, range(len(user_strings))))
+
+        logger.info("[STORAGE] Batch of %s user strings processed", len(user_strings))
+        return results
+
+    @timed_operation('verify')
     def verify_user(
             self,
             req: Dict[str, str]) \
@@ -238,48 +528,148 @@ class UserDBManager:
         Returns:
             Optional[str]: A success message or None if verification fails.
         """
-        passwd_hash = PasswordHasher()
         user_id = req.get('uid')
 
         if not user_id:
-            return "UID not provided in the request."
+            return UID_NOT_PROVIDED
+        if 'request_string' not in req:
+            return STRING_NOT_PROVIDED
 
         user_string = self.serialize_data(req)
 
         # Use display_user_db to get the user data
-        user_data = self.display_user_db(user_id)
+        user_data = self.display_user_db(user_id, revalidate=True)
 
         if isinstance(user_data, dict):
-            try:
-                user_hash = user_data.get("hash_string")
-                if user_hash is None:
-                    return "User hash not found in the database."
-
-                try:
-                    check_validity = passwd_hash.verify(user_hash, user_string)
-                except argon2.exceptions.VerifyMismatchError:
-                    logger.error(f"[VERIF] User string does not match the stored hash for UID: {user_id}.")
-                    return "User string does not match the stored hash."
-
-                if check_validity:
-                    logger.info(f"[VERIF] User verification successful for UID: {user_id}.")
-                    return "Successful"
-                
-                logger.warning(f"[VERIF] User verification failed for UID: {user_id}.")
-                return None
-            except Exception as e:
-                logger.error(f"[VERIF] Error during verification for UID: {user_id}. Error: {str(e)}")
-                return f"Error during verification: {str(e)}"
+            user_hash = user_data.get("hash_string")
+            if user_hash is None:
+                return HASH_NOT_FOUND
+            outcome = _submit_verify(user_id, user_hash, user_string)
+            return self._verification_status(user_id, user_hash, user_string, outcome)
         else:
             # If user_data is a string, it means no database was found
-            logger.error(f"[VERIF] {user_data}")
+            logger.error("[VERIF] %s", user_data)
             return user_data
 
-    def display_user_db(self, user_id: str) -> Union[str, Dict[str, str]]:
+    def _verification_status(
+            self,
+            user_id: str,
+            user_hash: str,
+            user_string: str,
+            outcome: Future) \
+            -> Optional[str]:
+        """Wait for an Argon2 verification and turn it into a verify_user status.
+
+        Returns:
+            Optional[str]: A success message or None if verification fails.
+        """
+        try:
+            try:
+                check_validity = outcome.result()
+            except argon2.exceptions.VerifyMismatchError:
+                logger.error("[VERIF] User string does not match the stored hash for UID: %s.", user_id)
+                return STRING_MISMATCH
+
+            if check_validity:
+                logger.info("[VERIF] User verification successful for UID: %s.", user_id)
+                if user_id == self.__unique_identifier and get_hash_executor().needs_rehash(user_hash):
+                    get_hash_executor().schedule_rehash(
+                        user_string, lambda new_hash: self._upgrade_hash(user_hash, new_hash))
+                return VERIFIED
+
+            logger.warning("[VERIF] User verification failed for UID: %s.", user_id)
+            return None
+        except Exception as e:
+            logger.error("[VERIF] Error during verification for UID: %s. Error: %s", user_id, e)
+            return f"Error during verification: {str(e)}"
+
+    @classmethod
+    @timed_operation('verify_many')
+    def verify_many(cls, reqs: List[Dict[str, str]]) -> List[Optional[str]]:
+        """Verify a batch of (uid, user string) pairs.
+
+        All referenced boxes are fetched concurrently, then every Argon2
+        verification is queued on the hashing executor at once.
+
+        Args:
+            reqs (List[Dict[str, str]]): Requests shaped like verify_user's,
+                each with 'uid' and 'request_string'
+
+        Returns:
+            List[Optional[str]]: The verify_user status for each request, in input order
+        """
+        statuses: List[Optional[str]] = [None] * len(reqs)
+        pending: Dict[int, Tuple[str, str]] = {}
+        managers: Dict[str, 'UserDBManager'] = {}
+        for position, req in enumerate(reqs):
+            user_id = req.get('uid')
+            if not user_id:
+                statuses[position] = UID_NOT_PROVIDED
+                continue
+            if 'request_string' not in req:
+                statuses[position] = STRING_NOT_PROVIDED
+                continue
+            if user_id not in managers:
+                managers[user_id] = cls(user_id, accept_init=False, lazy=True)
+            pending[position] = (user_id, managers[user_id].serialize_data(req))
+
+        fetchers = max(1, min(s3_max_pool_connections, len(managers)))
+        with ThreadPoolExecutor(max_workers=fetchers) as pool:
+            records = dict(zip(managers, pool.map(
+                lambda user_id: managers[user_id].display_user_db(user_id, revalidate=True), managers)))
+
+        outcomes: Dict[int, Future] = {}
+        for position, (user_id, user_string) in pending.items():
+            user_data = records[user_id]
+            if not isinstance(user_data, dict):
+                logger.error("[VERIF] %s", user_data)
+                statuses[position] = user_data
+            elif user_data.get("hash_string") is None:
+                statuses[position] = HASH_NOT_FOUND
+            else:
+                outcomes[position] = _submit_verify(user_id, user_data["hash_string"], user_string)
+
+        for position, outcome in outcomes.items():
+            user_id, user_string = pending[position]
+            statuses[position] = managers[user_id]._verification_status(
+                user_id, records[user_id]["hash_string"], user_string, outcome)
+
+        logger.info("[VERIF] Batch of %s verifications processed", len(reqs))
+        return statuses
+
+    def _upgrade_hash(self, old_hash: str, new_hash: str) -> None:
+        """Replace a hash made with an outdated cost profile.
+
+        The write is conditional on the ETag that was read, so a record
+        changed in the meantime (e.g. by recover_account) is left alone.
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.__file_name)
+            data = decode_record(response['Body'].read())
+            if data.get('hash_string') != old_hash:
+                return
+            data['hash_string'] = new_hash
+            record_cache.invalidate(self.__file_name)
+            written = self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.__file_name,
+                Body=encode_record(data),
+                IfMatch=response['ETag']
+            )
+            _record_reads.forget((self.bucket_name, self.__file_name))
+            # The previous hash left in Redis still verifies the same string
+            shared_cache.put(self.__file_name, data, written.get('ETag'))
+            logger.info("[REHASH] Hash upgraded to current profile for UID: %s", self.__unique_identifier)
+        except (ClientError, SharedCacheError) as e:
+            logger.warning("[REHASH] Hash upgrade skipped for UID: %s. Error: %s", self.__unique_identifier, e)
+
+    @timed_operation('view')
+    def display_user_db(self, user_id: str, revalidate: bool = False) -> Union[str, Dict[str, str]]:
         """Display the contents of the user-specific database
 
         Args:
             user_id (str): The user ID to look up the database for.
+            revalidate (bool): Confirm a cached record with S3 first, see _get_record
 
         Returns:
             Union[str, Dict[str, str]]: A dictionary containing the database contents,
@@ -287,14 +677,16 @@ class UserDBManager:
         """
         file_name = f"user_db_{user_id}"
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=file_name)
-            content = response['Body'].read().decode('utf-8')
-            logger.info(f"[DISPLAY] Database contents retrieved for UID: {user_id}")
-            return json.loads(content)
+            data = self._get_record(file_name, revalidate)
         except ClientError:
-            logger.error(f"[DISPLAY] No database found for UID: {user_id}")
+            data = None
+        if data is None:
+            logger.error("[DISPLAY] No database found for UID: %s", user_id)
             return f"No database found for UID: {user_id}"
+        logger.info("[DISPLAY] Database contents retrieved for UID: %s", user_id)
+        return data
 
+    @timed_operation('check_integrity')
     def check_sus_integrity(self, req: Dict[str, str]) -> str:
         """Check secured user strings integrity before restoring dbm
 
@@ -316,24 +708,71 @@ class UserDBManager:
         try:
             data = self._read_from_s3()
             if not data:
-                logger.error(f'[RESTORE] File for user: {get_user_id} does not exist.')
+                logger.error('[RESTORE] File for user: %s does not exist.', get_user_id)
                 return "DBM not found"
             
             stored_secured_user_string = data.get("secured_user_string")
             if stored_secured_user_string is None:
-                logger.warning(f"[RESTORE] Secured user string not found for user:{get_user_id}")
+                logger.warning("[RESTORE] Secured user string not found for user:%s", get_user_id)
                 return "User string not found in the database."
             
             if stored_secured_user_string == get_secured_user_string:
-                logger.info(f"[RESTORE] Integrity check passed for user:{get_user_id}")
+                logger.info("[RESTORE] Integrity check passed for user:%s", get_user_id)
                 return "Success"
             else:
-                logger.warning(f"[RESTORE] Integrity check failed for user:{get_user_id}")
+                logger.warning("[RESTORE] Integrity check failed for user:%s", get_user_id)
                 return "Error, Integrity check failed"
         except Exception as e:
-            logger.error(f"[RESTORE] Error during integrity check for user: {get_user_id}. Error: {str(e)}")
+            logger.error("[RESTORE] Error during integrity check for user: %s. Error: %s", get_user_id, e)
             return f"Error during integrity check: {str(e)}"
 
+    @staticmethod
+    def _unindex(secured_user_string: str) -> None:
+        """Drop a replaced or closed string from ``sus_index``; if that fails,
+        the entry is left for find_uid to ignore"""
+        try:
+            sus_index.remove(secured_user_string)
+        except ClientError as e:
+            logger.warning("[STORAGE] Unable to unindex a secured user string. Error: %s", e)
+
+    @classmethod
+    @timed_operation('lookup')
+    def find_uid(cls, secured_user_string: str) -> Optional[str]:
+        """Find the box a secured user string belongs to.
+
+        One GET of its ``sus_index`` entry and one of the box it points at,
+        bypassing the caches, which confirms the match.
+
+        Args:
+            secured_user_string (str): The secured user string handed out by store or recover
+
+        Raises:
+            ClientError: For any S3 failure other than a missing object
+
+        Returns:
+            Optional[str]: The uid, or None if no box holds this secured user string
+        """
+        if not secured_user_string:
+            return None
+        uid = sus_index.lookup(secured_user_string)
+        if uid is None:
+            logger.info("[LOOKUP] No box indexed for the secured user string")
+            return None
+        try:
+            response = get_s3_client().get_object(Bucket=s3_bucket_name, Key=f"user_db_{uid}")
+        except ClientError as e:
+            if s3_error_code(e) not in MISSING_CODES:
+                raise
+            record = None
+        else:
+            record = decode_record(response['Body'].read())
+        if record is None or record.get('secured_user_string') != secured_user_string:
+            logger.warning("[LOOKUP] Index entry for UID: %s no longer matches its box", uid)
+            return None
+        logger.info("[LOOKUP] Secured user string belongs to UID: %s", uid)
+        return uid
+
+    @timed_operation('recover')
     def recover_account(self, req: Dict[str, str]) -> Optional[Dict[str, str]]:
         """
         Recover an account with id and user string.
@@ -356,7 +795,7 @@ class UserDBManager:
         try:
             data = self._read_from_s3()
             if not data:
-                logger.error(f"[RECOVER] DBM not found for user: {get_uid}")
+                logger.error("[RECOVER] DBM not found for user: %s", get_uid)
                 return None
 
             serialized_data = self.serialize_data({'request_string': user_string})
@@ -364,6 +803,8 @@ class UserDBManager:
             
             current_datetime = datetime.datetime.now().isoformat()
             secured_user_string = self.generate_secured_string()
+            replaced = data.get('secured_user_string')
+            sus_index.add(secured_user_string, get_uid)
 
             data.update({
                 'hash_string': user_hash,
@@ -372,18 +813,23 @@ class UserDBManager:
                 'created_on': current_datetime
             })
             
-            self._write_to_s3(data)
+            if not self._write_to_s3(data):
+                logger.error("[RECOVER] Unable to write the recovered box for user: %s", get_uid)
+                return None
+            if replaced:
+                self._unindex(replaced)
 
-            logger.info(f"[RECOVER] Account recovered successfully for user: {get_uid}")
+            logger.info("[RECOVER] Account recovered successfully for user: %s", get_uid)
             return {
                 "id": get_uid,
                 "sus": secured_user_string
             }
         except Exception as e:
-            logger.error(f"[RECOVER] Error recovering account for user: {get_uid}. Error: {str(e)}")
+            logger.error("[RECOVER] Error recovering account for user: %s. Error: %s", get_uid, e)
             return None
     
     
+    @timed_operation('close')
     def close_account(self, req: Dict[str, str]) -> str:
         """Method to support permanent account deletion
 
@@ -406,28 +852,26 @@ class UserDBManager:
         try:
             data = self._read_from_s3()
             if not data:
-                logger.error(f"[CLOSE ACCOUNT] DBM not found for user: {user_id}")
+                logger.error("[CLOSE ACCOUNT] DBM not found for user: %s", user_id)
                 return 'DBM not found'
 
             db_secured = data.get('secured_user_string')
             if db_secured is None:
-                logger.error(f"[CLOSE ACCOUNT] Account does not exist for UID: {user_id}")
+                logger.error("[CLOSE ACCOUNT] Account does not exist for UID: %s", user_id)
                 return 'User not found'
             if db_secured != secured_user_string:
-                logger.warning(f"[CLOSE ACCOUNT] Provided Secured User String does not match for UID: {user_id}")
+                logger.warning("[CLOSE ACCOUNT] Provided Secured User String does not match for UID: %s", user_id)
                 return 'Provided Secured User String does not match for UID'
             
+            # Marked closed first: if Redis cannot be reached, the box is left as it is
+            shared_cache.close(file_name)
             self.s3_client.delete_object(Bucket=self.bucket_name, Key=file_name)
+            record_cache.invalidate(file_name)
+            _record_reads.forget((self.bucket_name, file_name))
+            self._unindex(secured_user_string)
             
-            logger.info(f"[CLOSE ACCOUNT] Account deleted successfully for UID: {user_id}")
+            logger.info("[CLOSE ACCOUNT] Account deleted successfully for UID: %s", user_id)
             return 'Success'
-        except ClientError as e:
-            logger.error(f"[CLOSE ACCOUNT] Error deleting account for UID: {user_id}. Error: {str(e)}", exc_info=True)
+        except (ClientError, SharedCacheError) as e:
+            logger.error("[CLOSE ACCOUNT] Error deleting account for UID: %s. Error: %s", user_id, e, exc_info=True)
             return 'Error deleting account'
-
-
-
-
-
-
-
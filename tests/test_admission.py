@@ -0,0 +1,123 @@
+"""Test cases for admission control"""
+import inspect
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src import admission, main
+from src.admission import AdmissionLimiter, Overloaded, parse_limits
+
+
+class TestAdmission(unittest.TestCase):
+    """Test cases for AdmissionLimiter and parse_limits"""
+
+    def hold(self, limiter, release):
+        """Occupy a slot from another thread until ``release`` is set"""
+        admitted = threading.Event()
+
+        def run():
+            with limiter.admit():
+                admitted.set()
+                release.wait()
+        thread = threading.Thread(target=run)
+        thread.start()
+        admitted.wait()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        return thread
+
+    def test_full_queue_is_rejected_at_once(self):
+        """Test a request finding the slots and the queue taken gets 429 without waiting"""
+        limiter = AdmissionLimiter('verify', limit=1, queue_size=0, queue_timeout=10)
+        self.hold(limiter, threading.Event())
+        started = time.monotonic()
+        with self.assertRaises(Overloaded) as caught:
+            limiter.acquire()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(caught.exception.status, 429)
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+
+    def test_queued_request_gets_freed_slot_or_times_out(self):
+        """Test a queued request runs once a slot frees up, and gets 503 if none does in time"""
+        limiter = AdmissionLimiter('store', limit=1, queue_size=1, queue_timeout=0.05)
+        release = threading.Event()
+        self.hold(limiter, release)
+        with self.assertRaises(Overloaded) as caught:
+            limiter.acquire()
+        self.assertEqual(caught.exception.status, 503)
+        self.assertEqual(limiter.stats()['waiting'], 0)
+
+        limiter.queue_timeout = 10
+        threading.Timer(0.05, release.set).start()
+        with limiter.admit():
+            self.assertEqual(limiter.stats()['in_flight'], 1)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+    def test_adaptive_limit_follows_latency(self):
+        """Test a slow route's limit shrinks and a fast, saturated one grows back to its ceiling"""
+        limiter = AdmissionLimiter('verify', limit=10, queue_size=10, queue_timeout=1, latency_target=0.1)
+        for _ in range(30):
+            limiter.acquire()
+            limiter.release(0.5)
+        self.assertLess(limiter.limit, 10)
+        while limiter.latency > 0.1:
+            limiter.acquire()
+            limiter.release(0.01)
+        for _ in range(200):
+            for _ in range(limiter.limit):
+                limiter.acquire()
+            for _ in range(limiter.limit):
+                limiter.release(0.01)
+        self.assertEqual(limiter.limit, 10)
+
+    def test_batch_takes_a_slot_per_item(self):
+        """Test a batch holds one slot per item up to the limit, and is shed when they are not free"""
+        limiter = AdmissionLimiter('verify', limit=4, queue_size=0, queue_timeout=10)
+        with limiter.admit(2):
+            self.assertEqual(limiter.stats()['in_flight'], 2)
+        with limiter.admit(1000):
+            self.assertEqual(limiter.stats()['in_flight'], 4)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+        self.hold(limiter, threading.Event())
+        with self.assertRaises(Overloaded) as caught:
+            limiter.acquire(4)
+        self.assertEqual(caught.exception.status, 429)
+
+    def test_batch_route_is_shed(self):
+        """Test /store/batch answers 429 with Retry-After, without storing, while its slots are taken"""
+        # The app's limiters and error handler, imported by main as top-level modules
+        served = inspect.getmodule(main.admission)
+        limiter = served.AdmissionLimiter('store', limit=2, queue_size=0, queue_timeout=10)
+        self.hold(limiter, threading.Event())
+        with mock.patch.dict(served.limiters, {'store': limiter}), \
+                mock.patch.object(main.UserDBManager, 'store_many') as store_many:
+            response = main.app.test_client().post(main.STORE_BATCH, json={'reqs': ['a', 'b', 'c']})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        store_many.assert_not_called()
+
+    def test_inline_limit_is_split_between_workers(self):
+        """Test hashing on request threads gives each worker its share of the host limit"""
+        inline = mock.Mock(mode='inline')
+        # _default_limit imports the top-level hashing module, as the app does
+        with mock.patch('hashing.get_hash_executor', return_value=inline), \
+                mock.patch('hashing.default_worker_count', return_value=8):
+            for host_limit, workers, limit in ((None, None, 2), (None, 2, 8), (6, 4, 2), (2, 8, 1)):
+                with self.subTest(host_limit=host_limit, workers=workers), \
+                        mock.patch.object(admission, 'admission_host_limit', host_limit), \
+                        mock.patch.object(admission, 'web_workers', workers):
+                    self.assertEqual(admission._default_limit(), limit)
+
+    def test_parse_limits(self):
+        """Test per-route limits are parsed and bad ones refused"""
+        self.assertEqual(parse_limits('store=2, verify=8'), {'store': 2, 'verify': 8})
+        self.assertEqual(parse_limits(''), {})
+        with self.assertRaises(ValueError):
+            parse_limits('view=2')
+        with self.assertRaises(ValueError):
+            parse_limits('store=0')
+
+
+if __name__ == '__main__':
+    unittest.main()
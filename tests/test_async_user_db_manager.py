@@ -0,0 +1,148 @@
+"""Test cases for the asyncio manager and the Quart app on a stubbed aiobotocore client"""
+import asyncio
+import hashlib
+import inspect
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from src import async_main, async_user_db_manager
+
+
+class FakeBody:
+    """Streaming body of an aiobotocore response"""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def read(self):
+        return self.data
+
+
+class FakeAsyncS3:
+    """In-memory stand-in for the aiobotocore S3 client calls the manager makes"""
+
+    def __init__(self):
+        self.objects = {}
+
+    async def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({'Error': {'Code': '304'}}, 'GetObject')
+        return {'Body': FakeBody(body), 'ETag': etag}
+
+    async def put_object(self, Bucket, Key, Body, IfNoneMatch=None):
+        if IfNoneMatch == '*' and Key in self.objects:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        self.objects[Key] = (Body, etag)
+        return {'ETag': etag}
+
+    async def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+        return {}
+
+
+def stub_storage(test, manager_module):
+    """Point ``manager_module`` (and the hashing it uses) at an in-memory client for the test"""
+    client = FakeAsyncS3()
+
+    async def get_client():
+        return client
+
+    hashing = inspect.getmodule(manager_module.get_hash_executor)
+    for target, name, value in (
+            (manager_module, 'get_async_s3_client', get_client),
+            (hashing, '_executor', hashing.HashingExecutor(workers=1, queue_size=4, mode='inline'))):
+        patcher = mock.patch.object(target, name, value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    manager_module.record_cache.clear()
+    test.addCleanup(manager_module.record_cache.clear)
+    return client
+
+
+class TestAsyncUserDBManager(unittest.TestCase):
+    """Test cases for store, verify, recover and close on AsyncUserDBManager"""
+
+    def setUp(self):
+        self.client = stub_storage(self, async_user_db_manager)
+
+    def run_async(self, call):
+        return asyncio.run(call)
+
+    def manager(self, uid=None, accept_init=False):
+        return async_user_db_manager.AsyncUserDBManager(uid, accept_init=accept_init)
+
+    def store(self, string):
+        uid = self.run_async(self.manager(accept_init=True).store_user_string({'request_string': string}))['id']
+        return uid, self.run_async(self.manager(uid).display_user_db(uid))['secured_user_string']
+
+    def verify(self, uid, string):
+        return self.run_async(self.manager(uid).verify_user({'uid': uid, 'request_string': string}))
+
+    def test_store_then_verify(self):
+        """Test a stored string verifies, a different one does not, and the box is indexed"""
+        uid, sus = self.store('hello')
+        self.assertIn(f'user_db_{uid}', self.client.objects)
+        self.assertIn(async_user_db_manager.SUS_INDEX_PREFIX + async_user_db_manager.sus_digest(sus),
+                      self.client.objects)
+        self.assertEqual(self.verify(uid, 'hello'), 'Successful')
+        self.assertEqual(self.verify(uid, 'goodbye'), "User string does not match the stored hash.")
+        self.assertEqual(self.verify('missing', 'hello'), "No database found for UID: missing")
+
+    def test_recover_replaces_credential(self):
+        """Test recovery sets a new string and secured user string and unindexes the old one"""
+        uid, old_sus = self.store('hello')
+        recovered = self.run_async(self.manager(uid).recover_account({'_id': uid, 'user_string': 'again'}))
+        self.assertEqual(recovered['id'], uid)
+        self.assertNotEqual(recovered['sus'], old_sus)
+        self.assertEqual(self.verify(uid, 'again'), 'Successful')
+        self.assertEqual(self.verify(uid, 'hello'), "User string does not match the stored hash.")
+        self.assertNotIn(async_user_db_manager.SUS_INDEX_PREFIX + async_user_db_manager.sus_digest(old_sus),
+                         self.client.objects)
+
+    def test_close_needs_current_secured_string(self):
+        """Test a close with a wrong secured user string is refused and a correct one deletes the box"""
+        uid, sus = self.store('hello')
+        close = self.manager(uid).close_account
+        self.assertEqual(self.run_async(close({'uid': uid, 'sus': 'wrong'})),
+                         'Provided Secured User String does not match for UID')
+        self.assertEqual(self.run_async(close({'uid': uid, 'sus': sus})), 'Success')
+        self.assertNotIn(f'user_db_{uid}', self.client.objects)
+        self.assertEqual(self.verify(uid, 'hello'), f"No database found for UID: {uid}")
+
+
+class TestAsyncRoutes(unittest.TestCase):
+    """Test cases for the Quart routes"""
+
+    def setUp(self):
+        # The app imported its own copy of the manager module
+        self.client = stub_storage(self, inspect.getmodule(async_main.AsyncUserDBManager))
+
+    def test_store_and_verify_routes(self):
+        """Test a string stored through the app verifies through the app"""
+        async def exchange():
+            client = async_main.app.test_client()
+            stored = await client.post(async_main.STORE, json={'req': 'hello'})
+            uid = (await stored.get_json())['uid']
+            verified = await client.post(async_main.VERIFY, json={'uid': uid, 'string': 'hello'})
+            return uid, stored.status_code, verified.status_code, await verified.get_json()
+
+        uid, stored, verified, body = asyncio.run(exchange())
+        self.assertEqual((stored, verified), (200, 200))
+        self.assertIn(f'user_db_{uid}', self.client.objects)
+        self.assertEqual(body, {'status': 'Successful'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Test cases for the batch store and verify operations of the S3 manager"""
+import inspect
+import io
+import threading
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from src import user_db_manager
+
+
+class InMemoryS3:
+    """S3 client keeping objects in a dict and signalling each write"""
+
+    def __init__(self):
+        self.objects = {}
+        self.written = threading.Event()
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key]), 'ETag': None}
+
+    def put_object(self, Bucket, Key, Body, IfNoneMatch=None):
+        if IfNoneMatch == '*' and Key in self.objects:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        self.objects[Key] = Body
+        self.written.set()
+        return {'ETag': None}
+
+
+class GatedHashing:
+    """Hashing executor whose hash of ``gated`` waits until a box has been written"""
+
+    def __init__(self, written, gated):
+        self.written = written
+        self.gated = gated
+        self.waited = None
+
+    def submit_hash(self, user_string):
+        if user_string == self.gated:
+            self.waited = self.written.wait(timeout=5)
+        future = Future()
+        future.set_result(f'hash-{user_string}')
+        return future
+
+
+class TestStoreMany(unittest.TestCase):
+    """Test cases for UserDBManager.store_many"""
+
+    def setUp(self):
+        self.client = InMemoryS3()
+        for name, value in (('get_s3_client', lambda: self.client), ('sus_index', mock.Mock())):
+            patcher = mock.patch.object(user_db_manager, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        user_db_manager.record_cache.clear()
+        self.addCleanup(user_db_manager.record_cache.clear)
+
+    def test_writes_overlap_hashing(self):
+        """Test the first box is written while a later item is still hashing"""
+        hashing = GatedHashing(self.client.written, '"second"')
+        with mock.patch.object(user_db_manager, 'get_hash_executor', lambda: hashing):
+            results = user_db_manager.UserDBManager.store_many(['first', 'second', ''])
+        self.assertTrue(hashing.waited)
+        self.assertEqual(results[2], {'error': 'Empty request received'})
+        self.assertEqual({f'user_db_{result["id"]}' for result in results[:2]}, set(self.client.objects))
+
+
+class TestVerifyMany(unittest.TestCase):
+    """Test cases for UserDBManager.verify_many"""
+
+    def setUp(self):
+        self.client = InMemoryS3()
+        hashing = inspect.getmodule(user_db_manager.get_hash_executor)
+        for target, name, value in (
+                (user_db_manager, 'get_s3_client', lambda: self.client),
+                (user_db_manager, 'sus_index', mock.Mock()),
+                (hashing, '_executor', hashing.HashingExecutor(workers=1, queue_size=4, mode='inline'))):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        user_db_manager.record_cache.clear()
+        self.addCleanup(user_db_manager.record_cache.clear)
+
+    def test_statuses_match_verify_user(self):
+        """Test every request gets the status verify_user returns for it, missing and empty fields included"""
+        uid = user_db_manager.UserDBManager.store_many(['hello'])[0]['id']
+        reqs = [
+            {'uid': uid, 'request_string': 'hello'},
+            {'uid': uid, 'request_string': 'goodbye'},
+            {'uid': uid, 'request_string': ''},
+            {'uid': uid, 'request_string': None},
+            {'uid': uid},
+            {'uid': '', 'request_string': 'hello'},
+            {'request_string': 'hello'},
+            {'uid': 'missing', 'request_string': 'hello'},
+        ]
+        statuses = user_db_manager.UserDBManager.verify_many(reqs)
+        for req, status in zip(reqs, statuses):
+            with self.subTest(req=req):
+                manager = user_db_manager.UserDBManager(req.get('uid'), accept_init=False, lazy=True)
+                self.assertEqual(status, manager.verify_user(req))
+        self.assertEqual(statuses[0], user_db_manager.VERIFIED)
+        self.assertEqual(statuses[4], user_db_manager.STRING_NOT_PROVIDED)
+        self.assertEqual(statuses[5], user_db_manager.UID_NOT_PROVIDED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Test cases for the cold-start import cost of the CLI"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Modules each subcommand imports when it runs, and their cold import budget in ms.
+# IMPORT_BUDGET_SCALE stretches every budget on slow machines.
+COMMANDS = {
+    '--help': (('susdb_cli',), 100),
+    'calibrate': (('susdb_cli', 'hashing'), 300),
+    'migrate-shards': (('susdb_cli', 'dbm_engine'), 400),
+    'bench': (('susdb_cli', 'loadgen'), 300),
+    'export/import': (('susdb_cli', 'transfer'), 300),
+    'index-sus': (('susdb_cli', 'sus_index', 'transfer'), 300),
+    'store/verify/view/retrieve/close': (('susdb_cli', 'user_db_manager'), 800),
+    'storage commands via daemon': (('susdb_cli', 'susdb_daemon', 'settings'), 100),
+    'reconcile': (('susdb_cli', 'reconcile', 'models'), 1000),
+}
+# Only the commands that talk to S3 or Redis may load these
+HEAVY = ('boto3', 'botocore', 'flask', 'redis', 'redis_om')
+LOCAL = ('--help', 'calibrate', 'migrate-shards', 'bench', 'export/import', 'index-sus',
+         'storage commands via daemon')
+
+
+class TestCliStartup(unittest.TestCase):
+    """Test cases for the modules and import time of each subcommand"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.env = dict(os.environ, GET_PATH=cls.root, LOG_PATH=os.path.join(cls.root, 'susdb.log'),
+                       PYTHONDONTWRITEBYTECODE='1')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def cold_import(self, modules):
+        """Import ``modules`` in a fresh interpreter.
+
+        Returns:
+            Tuple[float, Set[str]]: Import time in ms, and the top-level packages loaded
+        """
+        script = (f"import {', '.join(modules)}, sys\n"
+                  "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))")
+        done = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=SRC, env=self.env,
+                              capture_output=True, text=True, check=True)
+        total_us = 0
+        for line in done.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() in modules and not fields[2].startswith('  '):
+                total_us += int(fields[1])
+        return total_us / 1000, set(done.stdout.split())
+
+    def test_local_commands_skip_heavy_dependencies(self):
+        """Test --help and the local commands load neither the S3 nor the Redis stack"""
+        for command in LOCAL:
+            with self.subTest(command=command):
+                _, loaded = self.cold_import(COMMANDS[command][0])
+                self.assertEqual(loaded.intersection(HEAVY), set())
+
+    def test_settings_do_not_connect_to_redis(self):
+        """Test importing settings leaves redis_om unloaded until settings.redis is used"""
+        _, loaded = self.cold_import(('settings',))
+        self.assertNotIn('redis_om', loaded)
+
+    def test_import_time_within_budget(self):
+        """Test the cold import of each subcommand stays within its budget"""
+        scale = float(os.getenv('IMPORT_BUDGET_SCALE', '1'))
+        for command, (modules, budget_ms) in COMMANDS.items():
+            with self.subTest(command=command):
+                # Best of three, to keep a busy machine from failing the build
+                elapsed = min(self.cold_import(modules)[0] for _ in range(3))
+                self.assertLessEqual(elapsed, budget_ms * scale, f"{command} took {elapsed:.0f} ms to import")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Test cases for HashingExecutor"""
+import threading
+import time
+import unittest
+
+import argon2
+from src.hashing import HashingExecutor, HashQueueFull, calibrate, get_profile
+
+
+class TestHashingExecutor(unittest.TestCase):
+    """Test cases for HashingExecutor"""
+
+    def test_inline_hash_and_verify(self):
+        """Test inline mode hashes and verifies on the calling thread"""
+        executor = HashingExecutor(mode='inline')
+        user_hash = executor.hash('"password"')
+        self.assertTrue(user_hash.startswith('$argon2'))
+        self.assertTrue(executor.verify(user_hash, '"password"'))
+        with self.assertRaises(argon2.exceptions.VerifyMismatchError):
+            executor.verify(user_hash, '"other"')
+
+    def test_process_hash_and_verify(self):
+        """Test hashes computed on the pool verify inline"""
+        executor = HashingExecutor(workers=1, mode='process')
+        try:
+            user_hash = executor.hash('"password"')
+            self.assertTrue(HashingExecutor(mode='inline').verify(user_hash, '"password"'))
+        finally:
+            executor.shutdown()
+
+    def test_queue_full(self):
+        """Test submissions beyond the bounded queue are rejected"""
+        executor = HashingExecutor(workers=1, queue_size=0, mode='process', queue_timeout=0)
+        try:
+            running = executor.submit(time.sleep, 1)
+            with self.assertRaises(HashQueueFull):
+                executor.submit(time.sleep, 0)
+            running.result()
+            executor.queue_timeout = 5
+            executor.submit(time.sleep, 0).result()
+        finally:
+            executor.shutdown()
+
+    def test_unknown_mode(self):
+        """Test an unknown mode is refused"""
+        with self.assertRaises(ValueError):
+            HashingExecutor(mode='threads')
+
+
+class TestHashProfiles(unittest.TestCase):
+    """Test cases for cost profiles and rehashing"""
+
+    def test_unknown_profile(self):
+        """Test an unknown profile name is refused"""
+        with self.assertRaises(KeyError):
+            get_profile('does-not-exist')
+
+    def test_needs_rehash_on_profile_change(self):
+        """Test hashes from another profile are flagged for rehash"""
+        minimal = HashingExecutor(mode='inline', params=get_profile('minimal'))
+        default = HashingExecutor(mode='inline', params=get_profile('default'))
+        user_hash = minimal.hash('"password"')
+        self.assertFalse(minimal.needs_rehash(user_hash))
+        self.assertTrue(default.needs_rehash(user_hash))
+        self.assertTrue(default.verify(user_hash, '"password"'))
+
+    def test_schedule_rehash(self):
+        """Test the background rehash hands back a hash with current parameters"""
+        executor = HashingExecutor(mode='inline', params=get_profile('minimal'))
+        done = threading.Event()
+        upgraded = []
+
+        def on_done(new_hash):
+            upgraded.append(new_hash)
+            done.set()
+
+        executor.schedule_rehash('"password"', on_done)
+        self.assertTrue(done.wait(10))
+        self.assertFalse(executor.needs_rehash(upgraded[0]))
+        executor.shutdown()
+
+    def test_calibrate_respects_target(self):
+        """Test calibration returns parameters with a measured p99"""
+        params = calibrate(10_000, memory_cost=1024, parallelism=1, samples=2, max_time_cost=2)
+        self.assertEqual(params['time_cost'], 2)
+        self.assertEqual(params['memory_cost'], 1024)
+        self.assertIn('p99_ms', params)
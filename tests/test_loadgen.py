@@ -0,0 +1,82 @@
+"""Test cases for the load generator"""
+import random
+import threading
+import unittest
+import uuid
+
+from src.loadgen import KeyChooser, create_accounts, parse_mix, run
+
+
+class MemoryTarget:
+    """Target keeping boxes in a dict"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.boxes = {}
+        self.lock = threading.Lock()
+
+    def store(self, user_string):
+        uid = str(uuid.uuid4())
+        with self.lock:
+            self.boxes[uid] = {'string': user_string, 'secured_user_string': uuid.uuid4().hex}
+        return uid
+
+    def view(self, uid):
+        return self.boxes.get(uid)
+
+    def verify(self, uid, user_string):
+        return self.boxes[uid]['string'] == user_string
+
+    def retrieve(self, uid, key):
+        return uid in self.boxes
+
+    def recover(self, uid, user_string):
+        return self.boxes[uid]['secured_user_string']
+
+    def close(self, uid, sus):
+        with self.lock:
+            return self.boxes.pop(uid)['secured_user_string'] == sus
+
+
+class TestLoadgen(unittest.TestCase):
+    """Test cases for parse_mix, KeyChooser and run"""
+
+    def test_parse_mix(self):
+        """Test weights are parsed and unknown operations rejected"""
+        self.assertEqual(parse_mix('verify=3, view'), {'verify': 3.0, 'view': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix('delete=1')
+        with self.assertRaises(ValueError):
+            parse_mix('verify=0')
+
+    def test_zipfian_is_skewed(self):
+        """Test the zipfian chooser favours low ranks and stays in range"""
+        chooser = KeyChooser(100, 'zipfian', 1.2)
+        rng = random.Random(7)
+        draws = [chooser.choose(rng) for _ in range(5000)]
+        self.assertTrue(all(0 <= draw < 100 for draw in draws))
+        self.assertGreater(draws.count(0), draws.count(50) * 10)
+
+    def test_run_collects_samples_after_warmup(self):
+        """Test every operation in the mix runs without errors"""
+        target = MemoryTarget()
+        accounts = create_accounts(target, 10, 2)
+        report = run(target, parse_mix('verify=4,view=2,retrieve=2,store=2,recover=1,close=1'),
+                     accounts, concurrency=2, duration=0.3, warmup=0.1, seed=1)
+        rows = {row['operation']: row for row in report.summary()}
+        self.assertGreater(rows['total']['count'], 0)
+        self.assertEqual(rows['total']['errors'], 0)
+        self.assertIn('verify', rows)
+        self.assertTrue(report.histogram())
+
+    def test_rate_limit(self):
+        """Test the scheduled rate bounds the number of calls"""
+        target = MemoryTarget()
+        accounts = create_accounts(target, 5, 1)
+        report = run(target, {'view': 1.0}, accounts, concurrency=4, duration=0.5, warmup=0, rate=40)
+        self.assertLessEqual(len(report.latencies['view']), 21)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Test cases for the queued logging pipeline"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from src import log_pipeline
+from src.log_pipeline import BatchedRotatingFileHandler, InfoSampler, QueuedHandler
+
+
+class TestLogPipeline(unittest.TestCase):
+    """Test cases for BatchedRotatingFileHandler, QueuedHandler and InfoSampler"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'susdb.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def logger(self, name, handler):
+        logger = logging.getLogger(name)
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_queued_records_are_written_by_the_listener(self):
+        """Test records reach the file, formatted lazily, once the queue is drained"""
+        target = BatchedRotatingFileHandler(self.path, maxBytes=1 << 20)
+        target.setFormatter(logging.Formatter('%(message)s'))
+        self.addCleanup(target.close)
+        logger = self.logger('test.queued', QueuedHandler(target))
+        for i in range(100):
+            logger.info("[STORAGE] box %s stored", i)
+        log_pipeline.shutdown()
+        with open(self.path) as log_file:
+            lines = log_file.read().splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(lines[-1], '[STORAGE] box 99 stored')
+
+    def test_rotation(self):
+        """Test the file is rolled over at maxBytes"""
+        target = BatchedRotatingFileHandler(self.path, maxBytes=200, backupCount=2)
+        self.addCleanup(target.close)
+        logger = self.logger('test.rotation', target)
+        for i in range(20):
+            logger.info("line %s of the rotation test", i)
+        target.flush()
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.assertLessEqual(os.path.getsize(self.path), 200)
+
+    def test_rotation_counts_bytes(self):
+        """Test multi-byte characters count as the bytes they take in the file"""
+        target = BatchedRotatingFileHandler(self.path, maxBytes=200, backupCount=2)
+        self.addCleanup(target.close)
+        logger = self.logger('test.rotation_bytes', target)
+        for i in range(20):
+            logger.info("ligne %s du test de rotation: é à ü ø", i)
+        target.flush()
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.assertLessEqual(os.path.getsize(self.path), 200)
+        self.assertLessEqual(os.path.getsize(self.path + '.1'), 200)
+
+    def test_info_sampler(self):
+        """Test INFO records are sampled while warnings always pass"""
+        sampler = InfoSampler(0.0)
+        info = logging.LogRecord('test', logging.INFO, __file__, 1, 'routine', None, None)
+        warning = logging.LogRecord('test', logging.WARNING, __file__, 1, 'problem', None, None)
+        self.assertFalse(sampler.filter(info))
+        self.assertTrue(sampler.filter(warning))
+
+
+if __name__ == '__main__':
+    unittest.main()
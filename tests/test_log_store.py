@@ -0,0 +1,126 @@
+"""Test cases for LogStore"""
+import os
+import shutil
+import tempfile
+import unittest
+from src.log_store import LogStore, RecordFormatError
+
+
+class TestLogStore(unittest.TestCase):
+    """Test cases for LogStore"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = self.open_store()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def open_store(self, segment_bytes=1024):
+        return LogStore(self.root, segment_bytes=segment_bytes, compact_interval=0)
+
+    def reopen(self):
+        self.store.close()
+        self.store = self.open_store()
+
+    def test_put_get_overwrite_delete(self):
+        """Test the latest entry for a uid wins and tombstones hide it"""
+        self.assertTrue(self.store.create('a', {'_id': 'a', 'n': '1'}))
+        self.assertFalse(self.store.create('a', {'_id': 'a', 'n': '2'}))
+        self.store.put('a', {'_id': 'a', 'n': '3'})
+        self.assertEqual(self.store.get('a'), {'_id': 'a', 'n': '3'})
+        self.assertTrue(self.store.delete('a'))
+        self.assertFalse(self.store.delete('a'))
+        self.assertIsNone(self.store.get('a'))
+
+    def test_update_only_writes_when_changed(self):
+        """Test update skips the write when the change returns None"""
+        self.store.put('a', {'n': '1'})
+        self.assertIsNone(self.store.update('a', lambda record: None))
+        self.assertEqual(self.store.update('a', lambda record: dict(record, n='2')), {'n': '2'})
+        self.assertIsNone(self.store.update('missing', lambda record: record))
+
+    def test_restart_rebuilds_index(self):
+        """Test records survive a restart across several segments"""
+        for i in range(50):
+            self.store.put(f"uid-{i}", {'_id': f"uid-{i}", 'pad': 'x' * 40})
+        self.store.delete('uid-7')
+        self.assertGreater(self.store.stats()['segments'], 1)
+        self.reopen()
+        self.assertEqual(self.store.get('uid-49'), {'_id': 'uid-49', 'pad': 'x' * 40})
+        self.assertIsNone(self.store.get('uid-7'))
+        self.assertEqual(len(list(self.store.uids())), 49)
+
+    def test_restart_without_hints(self):
+        """Test segments are scanned when their hint files are missing"""
+        for i in range(30):
+            self.store.put(f"uid-{i}", {'pad': 'x' * 40})
+        self.store.close()
+        for name in os.listdir(os.path.join(self.root, 'logstore')):
+            if name.endswith('.hint'):
+                os.remove(os.path.join(self.root, 'logstore', name))
+        self.store = self.open_store()
+        self.assertEqual(len(list(self.store.uids())), 30)
+
+    def test_torn_tail_is_truncated(self):
+        """Test a partially written last entry is dropped on restart"""
+        self.store.put('a', {'n': '1'})
+        self.store.put('b', {'n': '2'})
+        path = self.store.path_for('b')
+        self.store.close()
+        os.truncate(path, os.path.getsize(path) - 3)
+        self.store = self.open_store()
+        self.assertEqual(self.store.get('a'), {'n': '1'})
+        self.assertIsNone(self.store.get('b'))
+        self.store.put('c', {'n': '3'})
+        self.reopen()
+        self.assertEqual(self.store.get('c'), {'n': '3'})
+
+    def test_damaged_entry_is_not_returned(self):
+        """Test a read whose bytes fail the CRC raises instead of returning a corrupt record"""
+        self.store.put('a', {'n': '1', 'pad': 'x' * 40})
+        path = self.store.path_for('a')
+        with open(path, 'r+b') as log_file:
+            log_file.seek(os.path.getsize(path) - 5)
+            log_file.write(b'y')
+        with self.assertRaises(RecordFormatError):
+            self.store.get('a')
+
+    def test_compaction_keeps_only_live_records(self):
+        """Test compaction drops overwritten and closed boxes"""
+        for round_ in range(5):
+            for i in range(20):
+                self.store.put(f"uid-{i}", {'round': str(round_), 'pad': 'x' * 20})
+        for i in range(10):
+            self.store.delete(f"uid-{i}")
+        before = self.store.stats()
+        self.assertTrue(self.store.compact())
+        after = self.store.stats()
+        self.assertLess(after['bytes'], before['bytes'])
+        self.assertEqual(after['boxes'], 10)
+        self.reopen()
+        self.assertIsNone(self.store.get('uid-3'))
+        self.assertEqual(self.store.get('uid-15'), {'round': '4', 'pad': 'x' * 20})
+
+    def test_superseded_segments_are_discarded(self):
+        """Test files left behind by an interrupted compaction are ignored"""
+        for i in range(40):
+            self.store.put(f"uid-{i % 5}", {'i': str(i), 'pad': 'x' * 40})
+        self.store.delete('uid-0')
+        log_dir = os.path.join(self.root, 'logstore')
+        saved = {name: open(os.path.join(log_dir, name), 'rb').read()
+                 for name in os.listdir(log_dir) if name.endswith('.log')}
+        self.store.compact()
+        self.store.close()
+        for name, data in saved.items():
+            if not os.path.exists(os.path.join(log_dir, name)):
+                with open(os.path.join(log_dir, name), 'wb') as restored:
+                    restored.write(data)
+        self.store = self.open_store()
+        self.assertIsNone(self.store.get('uid-0'))
+        self.assertEqual(self.store.get('uid-4')['i'], '39')
+
+
+if __name__ == '__main__':
+    unittest.main()
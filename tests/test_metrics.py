@@ -0,0 +1,117 @@
+"""Test cases for the metrics registry and exposition format"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.metrics import SNAPSHOT_PREFIX, Counter, Histogram, Registry, _Metric, timed_operation
+
+
+class Backend:
+    """Object carrying the backend label read by timed_operation"""
+
+    metrics_backend = 'test'
+
+    @timed_operation('fail')
+    def fail(self):
+        raise RuntimeError("boom")
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for Counter, Histogram and Registry.render"""
+
+    def test_counter_render(self):
+        """Test labelled counters are rendered with HELP and TYPE lines"""
+        counter = Counter('test_requests_total', 'Requests', ['status'])
+        counter.labels('200').inc()
+        counter.labels('200').inc(2)
+        registry = Registry()
+        registry.register(counter)
+        text = registry.render()
+        self.assertIn('# TYPE test_requests_total counter', text)
+        self.assertIn('test_requests_total{status="200"} 3', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram buckets, sum and count"""
+        histogram = Histogram('test_seconds', 'Latency', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.labels().observe(value)
+        registry = Registry()
+        registry.register(histogram)
+        registry.register_collector(lambda: [('test_size', 'gauge', 'Size', [('test_size', {}, 7)])])
+        lines = registry.render().splitlines()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count 3', lines)
+        self.assertIn('test_size 7', lines)
+
+    def test_timed_operation_counts_errors(self):
+        """Test a raising operation is timed and counted as an error"""
+        from src.metrics import OPERATION_ERRORS, OPERATION_SECONDS
+        with self.assertRaises(RuntimeError):
+            Backend().fail()
+        self.assertEqual(OPERATION_ERRORS.labels('test', 'fail').value, 1)
+        self.assertEqual(sum(OPERATION_SECONDS.labels('test', 'fail').counts), 1)
+
+    def test_pid_label(self):
+        """Test every sample, collected ones included, carries the pid of the rendering process"""
+        counter = Counter('test_pid_total', 'Requests')
+        counter.inc()
+        registry = Registry(pid_label=True)
+        registry.register(counter)
+        registry.register_collector(lambda: [('test_size', 'gauge', 'Size', [('test_size', {'kind': 'a'}, 7)])])
+        lines = registry.render().splitlines()
+        self.assertIn(f'test_pid_total{{pid="{os.getpid()}"}} 1', lines)
+        self.assertIn(f'test_size{{kind="a",pid="{os.getpid()}"}} 7', lines)
+
+    def test_directory_merges_processes(self):
+        """Test a scrape sums the counters of every process and keeps an exited one's counters but not its gauges"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        registry = Registry(pid_label=True, directory=directory)
+        counter = Counter('test_merged_total', 'Requests', ['route'])
+        registry.register(counter)
+        gauge = {'value': 3}
+        registry.register_collector(lambda: [('test_busy', 'gauge', 'Busy', [('test_busy', {}, gauge['value'])])])
+        counter.labels('store').inc()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                counter.labels('store').inc(2)
+                gauge['value'] = 4
+                registry.write_snapshot()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        lines = registry.render().splitlines()
+        self.assertIn('test_merged_total{route="store"} 4', lines)
+        self.assertIn('test_busy 3', lines)
+        self.assertNotIn(f'{SNAPSHOT_PREFIX}{pid}.json', os.listdir(directory))
+        counter.labels('store').inc()
+        self.assertIn('test_merged_total{route="store"} 5', registry.render().splitlines())
+
+    def test_reset_forgets_inherited_values(self):
+        """Test reset drops the recorded values but keeps the metrics registered"""
+        counter = Counter('test_reset_total', 'Requests')
+        registry = Registry()
+        registry.register(counter)
+        counter.inc()
+        registry.reset()
+        counter.inc()
+        self.assertIn('test_reset_total 1', registry.render().splitlines())
+
+    def test_incomplete_metric_fails_on_creation(self):
+        """Test a metric type missing samples cannot be instantiated"""
+        class Gauge(_Metric):
+            kind = 'gauge'
+
+            def _new_child(self):
+                return None
+
+        with self.assertRaises(TypeError):
+            Gauge('test_gauge', 'Gauge')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""Test cases for reconciling boxes with User records"""
+import fnmatch
+import os
+import shutil
+import tempfile
+import unittest
+from typing import Optional
+from unittest import mock
+
+from redis_om import JsonModel
+
+from src.log_store import LogStore
+from src.reconcile import Reconciler
+from src.transfer import LocalBoxes
+
+
+class Member(JsonModel, index=True):
+    """Stand-in for models.User with the same ir_id link"""
+    ir_id: str
+    title: Optional[str] = None
+
+    class Meta:
+        global_key_prefix = 'test'
+        model_key_prefix = 'member'
+
+
+class FakeJson:
+    def __init__(self, queue):
+        self.queue = queue
+
+    def get(self, key, path):
+        self.queue.append(('json_get', key, path.lstrip('.')))
+
+    def set(self, key, path, data, nx=False, xx=False):
+        self.queue.append(('json_set', key, data))
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = []
+
+    def json(self):
+        return FakeJson(self.queue)
+
+    def sadd(self, key, *members):
+        self.queue.append(('sadd', key, members))
+
+    def expire(self, key, seconds):
+        self.queue.append(('expire', key, seconds))
+
+    def delete(self, *keys):
+        self.queue.append(('delete', keys))
+
+    def execute(self, raise_on_error=True):
+        self.redis.round_trips += 1
+        results = []
+        for command, *args in self.queue:
+            if command == 'json_get':
+                document = self.redis.values.get(args[0])
+                results.append(document.get(args[1]) if document is not None else None)
+            elif command == 'json_set':
+                self.redis.values[args[0]] = dict(args[1])
+                results.append(True)
+            elif command == 'sadd':
+                self.redis.values.setdefault(args[0], set()).update(args[1])
+                results.append(len(args[1]))
+            elif command == 'expire':
+                results.append(True)
+            else:
+                results.append(self.redis.delete(*args[0]))
+        self.queue = []
+        return results
+
+
+class FakeRedis:
+    """In-memory stand-in for the commands the reconciler uses"""
+
+    def __init__(self):
+        self.values = {}
+        self.cursors = {}
+        self.round_trips = 0
+
+    def scan(self, cursor, match, count):
+        # Like Redis, keys deleted behind the cursor do not make it skip others
+        after = self.cursors.get(cursor, '')
+        keys = sorted(key for key in self.values if fnmatch.fnmatchcase(key, match) and key > after)
+        if len(keys) <= count:
+            return 0, keys
+        self.cursors[len(self.cursors) + 1] = keys[count - 1]
+        return len(self.cursors), keys[:count]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def execute_command(self, *args):
+        # COMMAND INFO, used by redis_om to check for RedisJSON
+        return [[args[-1]]]
+
+    def smismember(self, key, members):
+        known = self.values.get(key, set())
+        return [int(member in known) for member in members]
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+
+class TestReconcile(unittest.TestCase):
+    """Test cases for Reconciler"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = LogStore(self.root, compact_interval=0)
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(Member._meta, 'database', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Boxes 00-29; users for boxes 10-39, so 00-09 lack a user and 30-39 lack a box
+        for i in range(30):
+            self.store.put(f'uid-{i:02d}', {'_id': f'uid-{i:02d}'})
+        for i in range(10, 40):
+            self.redis.values[Member.make_key(f'pk-{i:02d}')] = {'pk': f'pk-{i:02d}', 'ir_id': f'uid-{i:02d}'}
+        self.boxes = LocalBoxes('log', self.store)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root)
+
+    def reconciler(self, **options):
+        return Reconciler(self.boxes, user_model=Member, batch_size=8, **options)
+
+    def linked(self):
+        return sorted(value['ir_id'] for key, value in self.redis.values.items() if key.startswith('test:member:'))
+
+    def test_dry_run_reports_orphans_without_changes(self):
+        """Test both kinds of orphans are counted and nothing is written"""
+        before = dict(self.redis.values)
+        stats = self.reconciler().run()
+        self.assertEqual(stats['phase'], 'done')
+        self.assertEqual((stats['users'], stats['boxes']), (30, 30))
+        self.assertEqual((stats['orphan_users'], stats['orphan_boxes']), (10, 10))
+        self.assertEqual((stats['deleted'], stats['created']), (0, 0))
+        self.assertEqual(self.redis.values, before)
+
+    def test_apply_deletes_and_creates_in_bulk(self):
+        """Test orphan users are deleted and users created for orphan boxes, one pipeline per batch"""
+        stats = self.reconciler(apply=True).run()
+        self.assertEqual((stats['deleted'], stats['created']), (10, 10))
+        self.assertEqual(self.linked(), sorted(self.store.uids()))
+        # 4 user batches with 2 round trips each, 1 create pipeline per box batch holding orphans
+        self.assertEqual(self.redis.round_trips, 8 + 2)
+        self.assertEqual(self.reconciler().run()['orphan_boxes'], 0)
+
+    def test_resume_continues_from_checkpoint(self):
+        """Test a pass stopped by its time budget finishes on resume with the same totals"""
+        checkpoint = os.path.join(self.root, 'reconcile.checkpoint')
+        stats = self.reconciler(apply=True).run(checkpoint, max_seconds=0)
+        self.assertEqual(stats['phase'], 'users')
+        self.assertEqual(stats['users'], 8)
+        while stats['phase'] != 'done':
+            stats = self.reconciler(apply=True).run(checkpoint, resume=True, max_seconds=0)
+        self.assertEqual((stats['users'], stats['boxes']), (30, 30))
+        self.assertEqual((stats['deleted'], stats['created']), (10, 10))
+        self.assertEqual(self.linked(), sorted(self.store.uids()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+"""Test cases for RecordCache"""
+import hashlib
+import io
+import unittest
+
+from botocore.exceptions import ClientError
+
+from src import user_db_manager
+from src.record_cache import EPOCH_STRIPES, RecordCache
+from src.record_format import encode_record
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRecordCache(unittest.TestCase):
+    """Test cases for RecordCache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = RecordCache(maxsize=2, ttl=5, clock=self.clock)
+
+    def test_miss_then_hit(self):
+        """Test a stored record is served fresh within the ttl"""
+        self.assertIsNone(self.cache.get('user_db_a'))
+        self.cache.put('user_db_a', {'_id': 'a'}, '"etag-a"')
+        entry = self.cache.get('user_db_a')
+        self.assertTrue(entry.fresh)
+        self.assertEqual(entry.record, {'_id': 'a'})
+        self.assertEqual(entry.etag, '"etag-a"')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_returned_record_is_a_copy(self):
+        """Test callers cannot mutate the cached record"""
+        self.cache.put('user_db_a', {'_id': 'a'}, None)
+        self.cache.get('user_db_a').record['_id'] = 'changed'
+        self.assertEqual(self.cache.get('user_db_a').record, {'_id': 'a'})
+
+    def test_stale_entry_and_revalidation(self):
+        """Test expired entries are returned stale until revalidated"""
+        self.cache.put('user_db_a', {'_id': 'a'}, '"etag-a"')
+        self.clock.now = 6
+        self.assertFalse(self.cache.get('user_db_a').fresh)
+        self.cache.revalidated('user_db_a')
+        self.assertTrue(self.cache.get('user_db_a').fresh)
+        self.assertEqual(self.cache.stats()['revalidations'], 1)
+
+    def test_lru_eviction(self):
+        """Test the least recently used record is evicted"""
+        self.cache.put('user_db_a', {'_id': 'a'}, None)
+        self.cache.put('user_db_b', {'_id': 'b'}, None)
+        self.cache.get('user_db_a')
+        self.cache.put('user_db_c', {'_id': 'c'}, None)
+        self.assertIsNone(self.cache.get('user_db_b'))
+        self.assertIsNotNone(self.cache.get('user_db_a'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        """Test invalidated records are dropped"""
+        self.cache.put('user_db_a', {'_id': 'a'}, None)
+        self.cache.invalidate('user_db_a')
+        self.assertIsNone(self.cache.get('user_db_a'))
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+    def test_put_after_invalidation_is_dropped(self):
+        """Test a record read before its key was invalidated is not cached after it"""
+        epoch = self.cache.epoch_of('user_db_a')
+        self.cache.invalidate('user_db_a')
+        self.cache.put('user_db_a', {'_id': 'a'}, None, epoch)
+        self.assertIsNone(self.cache.get('user_db_a'))
+        self.cache.put('user_db_a', {'_id': 'a'}, None, self.cache.epoch_of('user_db_a'))
+        self.assertIsNotNone(self.cache.get('user_db_a'))
+
+    def test_invalidating_other_keys_keeps_fill(self):
+        """Test writes to other records do not drop a concurrent fill"""
+        key = 'user_db_a'
+        others = [f'user_db_{i}' for i in range(64)
+                  if hash(f'user_db_{i}') % EPOCH_STRIPES != hash(key) % EPOCH_STRIPES]
+        epoch = self.cache.epoch_of(key)
+        for other in others:
+            self.cache.invalidate(other)
+        self.cache.put(key, {'_id': 'a'}, None, epoch)
+        self.assertIsNotNone(self.cache.get(key))
+
+    def test_disabled_cache(self):
+        """Test a zero sized cache never stores anything"""
+        cache = RecordCache(maxsize=0, ttl=5)
+        cache.put('user_db_a', {'_id': 'a'}, None)
+        self.assertIsNone(cache.get('user_db_a'))
+
+
+class InterleavingS3:
+    """In-memory S3 client that runs a callback in the middle of its next GET or PUT"""
+
+    def __init__(self):
+        self.objects = {}
+        self.during_get = None
+        self.during_put = None
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({'Error': {'Code': '304'}}, 'GetObject')
+        callback, self.during_get = self.during_get, None
+        if callback:
+            callback()
+        return {'Body': io.BytesIO(body), 'ETag': etag}
+
+    def put_object(self, Bucket, Key, Body, IfNoneMatch=None):
+        callback, self.during_put = self.during_put, None
+        if callback:
+            callback()
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        self.objects[Key] = (Body, etag)
+        return {'ETag': etag}
+
+
+class TestRecordCacheWrites(unittest.TestCase):
+    """Test cases for reads of the S3 manager racing its writes"""
+
+    def setUp(self):
+        user_db_manager.record_cache.clear()
+        self.addCleanup(user_db_manager.record_cache.clear)
+        self.client = InterleavingS3()
+        self.writer = self.manager()
+        self.reader = self.manager()
+        self.writer._write_to_s3({'_id': 'race', 'hash_string': 'old'})
+
+    def manager(self):
+        manager = user_db_manager.UserDBManager('race', lazy=True)
+        manager.s3_client = self.client
+        return manager
+
+    def read(self):
+        return self.reader._get_record('user_db_race')['hash_string']
+
+    def test_read_between_invalidation_and_put(self):
+        """Test a read landing while the PUT is in flight does not keep the old box cached"""
+        self.client.during_put = self.read
+        self.writer._write_to_s3({'_id': 'race', 'hash_string': 'new'})
+        self.assertEqual(self.read(), 'new')
+
+    def test_read_fetched_before_put_cached_after(self):
+        """Test a GET that returned the old box before the write is not cached once the write is done"""
+        self.client.during_get = lambda: self.writer._write_to_s3({'_id': 'race', 'hash_string': 'new'})
+        user_db_manager.record_cache.invalidate('user_db_race')
+        self.assertEqual(self.read(), 'old')
+        self.assertEqual(self.read(), 'new')
+
+    def rewrite_elsewhere(self, hash_string):
+        """Replace the box as another process would, without touching this one's cache"""
+        body = encode_record({'_id': 'race', 'hash_string': hash_string})
+        self.client.objects['user_db_race'] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+
+    def test_authenticating_reads_revalidate(self):
+        """Test a box rewritten by another worker is seen at once by reads that check or change it"""
+        self.assertEqual(self.read(), 'old')
+        self.rewrite_elsewhere('new')
+        self.assertEqual(self.read(), 'old')
+        self.assertEqual(self.manager()._read_from_s3()['hash_string'], 'new')
+        self.rewrite_elsewhere('newer')
+        self.assertEqual(self.read(), 'new')
+        self.assertEqual(self.reader.display_user_db('race', revalidate=True)['hash_string'], 'newer')
@@ -0,0 +1,64 @@
+"""Test cases for the binary record format"""
+import datetime
+import json
+import unittest
+import uuid
+
+from argon2 import PasswordHasher
+from src.record_format import MAGIC, RecordFormatError, decode_record, encode_record
+
+
+def make_record():
+    uid = str(uuid.uuid4())
+    return {
+        '_id': uid,
+        'hash_string': PasswordHasher(time_cost=1, memory_cost=8, parallelism=1).hash('"secret"'),
+        'secured_user_string': 'Ba7tqBHq8y7Ne3LuAuTzH2',
+        'created_on': datetime.datetime.now().isoformat(),
+    }
+
+
+class TestRecordFormat(unittest.TestCase):
+    """Test cases for encode_record and decode_record"""
+
+    def test_round_trip_is_smaller_than_json(self):
+        """Test a stored box decodes to the same record in fewer bytes"""
+        record = make_record()
+        encoded = encode_record(record, 'binary')
+        self.assertTrue(encoded.startswith(MAGIC))
+        self.assertEqual(decode_record(encoded), record)
+        self.assertLess(len(encoded), len(json.dumps(record).encode('utf-8')) // 2)
+
+    def test_unpackable_fields_keep_their_text(self):
+        """Test empty and unusual values round-trip unchanged"""
+        for record in (
+            {'_id': '', 'hash_string': '', 'secured_user_string': '', 'created_on': ''},
+            dict(make_record(), _id='not-a-uuid', created_on='2024-01-01T00:00:00+00:00'),
+            dict(make_record(), _id=str(uuid.uuid4()).upper(), hash_string='$argon2id$v=19$broken'),
+        ):
+            self.assertEqual(decode_record(encode_record(record, 'binary')), record)
+
+    def test_other_shapes_fall_back_to_json(self):
+        """Test records with extra keys are written as JSON"""
+        record = dict(make_record(), extra='1')
+        self.assertEqual(encode_record(record, 'binary'), json.dumps(record).encode('utf-8'))
+        self.assertEqual(decode_record(encode_record(record, 'binary')), record)
+
+    def test_json_format_and_legacy_reader(self):
+        """Test the json format and legacy objects stay readable"""
+        record = make_record()
+        encoded = encode_record(record, 'json')
+        self.assertEqual(encoded, json.dumps(record).encode('utf-8'))
+        self.assertEqual(decode_record(encoded), record)
+
+    def test_damaged_records_raise(self):
+        """Test truncated or unknown-version records are rejected"""
+        encoded = encode_record(make_record(), 'binary')
+        with self.assertRaises(RecordFormatError):
+            decode_record(encoded[:20])
+        with self.assertRaises(RecordFormatError):
+            decode_record(MAGIC + b'\x09' + encoded[3:])
+
+
+if __name__ == '__main__':
+    unittest.main()
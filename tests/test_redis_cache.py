@@ -0,0 +1,194 @@
+"""Test cases for the Redis tier of the record cache"""
+import inspect
+import io
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src import user_db_manager
+from src.redis_cache import RETRY_SECONDS, WRITE_ATTEMPTS, RedisRecordCache, SharedCacheError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """In-memory stand-in for the GET/SET/DELETE subset of a Redis client"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.values = {}
+        self.down = False
+        self.calls = 0
+
+    def _check(self):
+        self.calls += 1
+        if self.down:
+            raise RedisConnectionError("Connection refused")
+
+    def get(self, key):
+        self._check()
+        value, expires = self.values.get(key, (None, None))
+        if expires is not None and self.clock() >= expires:
+            del self.values[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None, nx=False):
+        self._check()
+        if nx and self.get(key) is not None:
+            return None
+        self.values[key] = (value, self.clock() + ex if ex else None)
+        return True
+
+    def delete(self, key):
+        self._check()
+        return int(self.values.pop(key, None) is not None)
+
+
+class TestRedisRecordCache(unittest.TestCase):
+    """Test cases for RedisRecordCache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.redis = FakeRedis(self.clock)
+        self.cache = RedisRecordCache(self.redis, ttl=60, prefix='test:', clock=self.clock)
+        self.record = {'_id': 'abc', 'hash_string': '$argon2id$...', 'secured_user_string': 'sus'}
+
+    def test_round_trip_with_etag(self):
+        """Test a stored record is returned with its ETag under the prefixed key"""
+        self.cache.put('user_db_abc', self.record, '"etag1"')
+        self.assertIn('test:user_db_abc', self.redis.values)
+        self.assertEqual(self.cache.get('user_db_abc'), (self.record, '"etag1"'))
+
+    def test_entries_expire_after_ttl(self):
+        """Test records are dropped once the TTL has passed"""
+        self.cache.put('user_db_abc', self.record, '"etag1"')
+        self.clock.now = 61
+        self.assertIsNone(self.cache.get('user_db_abc'))
+
+    def test_delete_removes_record(self):
+        """Test a closed box is no longer served"""
+        self.cache.put('user_db_abc', self.record)
+        self.cache.delete('user_db_abc')
+        self.assertIsNone(self.cache.get('user_db_abc'))
+
+    def test_fill_does_not_replace_a_write(self):
+        """Test a record read before a write cannot overwrite the write-through that followed"""
+        stale = dict(self.record, hash_string='$argon2id$old')
+        self.cache.put('user_db_abc', self.record, '"etag2"')
+        self.cache.put('user_db_abc', stale, '"etag1"', fill=True)
+        self.assertEqual(self.cache.get('user_db_abc'), (self.record, '"etag2"'))
+
+    def test_fill_does_not_bring_back_a_closed_box(self):
+        """Test a read that fetched a box before it was closed cannot cache it again until the tombstone expires"""
+        self.cache = RedisRecordCache(self.redis, ttl=60, tombstone_ttl=10, prefix='test:', clock=self.clock)
+        self.cache.put('user_db_abc', self.record, '"etag1"')
+        self.cache.close('user_db_abc')
+        self.cache.put('user_db_abc', self.record, '"etag1"', fill=True)
+        self.assertIsNone(self.cache.get('user_db_abc'))
+        self.clock.now = 11
+        self.cache.put('user_db_abc', self.record, '"etag1"', fill=True)
+        self.assertEqual(self.cache.get('user_db_abc'), (self.record, '"etag1"'))
+
+    def test_outage_skips_lookups_but_not_writes(self):
+        """Test lookups stop hitting an unreachable Redis for a while, writes, closes and deletes
+        are retried and then raise"""
+        self.redis.down = True
+        self.assertIsNone(self.cache.get('user_db_abc'))
+        calls = self.redis.calls
+        self.assertIsNone(self.cache.get('user_db_abc'))
+        self.cache.put('user_db_abc', self.record, fill=True)
+        self.assertEqual(self.redis.calls, calls)
+        with self.assertRaises(SharedCacheError):
+            self.cache.put('user_db_abc', self.record)
+        with self.assertRaises(SharedCacheError):
+            self.cache.close('user_db_abc')
+        with self.assertRaises(SharedCacheError):
+            self.cache.delete('user_db_abc')
+        self.assertEqual(self.redis.calls, calls + 3 * WRITE_ATTEMPTS)
+
+        self.redis.down = False
+        self.clock.now = RETRY_SECONDS
+        self.cache.put('user_db_abc', self.record, '"etag2"', fill=True)
+        self.assertEqual(self.cache.get('user_db_abc'), (self.record, '"etag2"'))
+
+    def test_unreadable_entry_is_dropped(self):
+        """Test an entry that is not valid JSON is treated as a miss and removed"""
+        self.redis.values['test:user_db_abc'] = ('not json', None)
+        self.assertIsNone(self.cache.get('user_db_abc'))
+        self.assertNotIn('test:user_db_abc', self.redis.values)
+
+
+class InMemoryS3:
+    """S3 client keeping objects in a dict"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key]), 'ETag': None}
+
+    def put_object(self, Bucket, Key, Body, IfNoneMatch=None):
+        self.objects[Key] = Body
+        return {'ETag': None}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class TestWritesWithRedisDown(unittest.TestCase):
+    """Test cases for writes and closes when the Redis entry cannot be invalidated"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.redis = FakeRedis(self.clock)
+        # Built from the module the manager imported, so it raises the SharedCacheError the manager catches
+        tier = inspect.getmodule(user_db_manager.SharedCacheError)
+        patcher = mock.patch.object(
+            user_db_manager, 'shared_cache', tier.RedisRecordCache(self.redis, ttl=60, prefix='test:', clock=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(user_db_manager, 'sus_index', mock.Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user_db_manager.record_cache.clear()
+        self.addCleanup(user_db_manager.record_cache.clear)
+        self.client = InMemoryS3()
+
+    def manager(self, uid):
+        manager = user_db_manager.UserDBManager(uid, accept_init=False, lazy=True)
+        manager.s3_client = self.client
+        return manager
+
+    def test_close_fails_and_keeps_box(self):
+        """Test a close is refused, not half done, while the Redis entry cannot be replaced"""
+        self.assertTrue(self.manager('abc')._write_to_s3({'_id': 'abc', 'secured_user_string': 'sus-abc'}))
+        self.redis.down = True
+        self.assertEqual(self.manager('abc').close_account({'uid': 'abc', 'sus': 'sus-abc'}), 'Error deleting account')
+        self.assertIn('user_db_abc', self.client.objects)
+
+        self.redis.down = False
+        self.assertEqual(self.manager('abc').close_account({'uid': 'abc', 'sus': 'sus-abc'}), 'Success')
+        self.assertIsNone(user_db_manager.shared_cache.get('user_db_abc'))
+
+    def test_write_fails_without_changing_box(self):
+        """Test a rewrite is reported as failed and leaves S3 alone while Redis is unreachable"""
+        self.assertTrue(self.manager('abc')._write_to_s3({'_id': 'abc', 'secured_user_string': 'sus-abc'}))
+        before = dict(self.client.objects)
+        self.redis.down = True
+        self.assertFalse(self.manager('abc')._write_to_s3({'_id': 'abc', 'secured_user_string': 'sus-new'}))
+        self.assertEqual(self.client.objects, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
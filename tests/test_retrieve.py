@@ -0,0 +1,49 @@
+"""Test cases for retrieve on the S3 manager"""
+import io
+import unittest
+
+from botocore.exceptions import ClientError
+
+from src import user_db_manager
+
+
+class InMemoryS3:
+    """S3 client keeping objects in a dict"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key]), 'ETag': None}
+
+    def put_object(self, Bucket, Key, Body, IfNoneMatch=None):
+        self.objects[Key] = Body
+        return {'ETag': None}
+
+
+class TestRetrieve(unittest.TestCase):
+    """Test cases for deserialize_data reading the S3 record"""
+
+    def setUp(self):
+        user_db_manager.record_cache.clear()
+        self.addCleanup(user_db_manager.record_cache.clear)
+        self.client = InMemoryS3()
+
+    def manager(self, uid, accept_init=True):
+        manager = user_db_manager.UserDBManager(uid, accept_init=accept_init, lazy=True)
+        manager.s3_client = self.client
+        return manager
+
+    def test_retrieve_reads_s3_record(self):
+        """Test a stored field is returned from S3, and missing keys and boxes are reported"""
+        self.manager('abc')._write_to_s3({'_id': 'abc', 'secured_user_string': 'sus-abc', 'created_on': 'today'})
+        self.assertEqual(self.manager('abc').deserialize_data('abc', 'secured_user_string'), 'sus-abc')
+        self.assertEqual(self.manager('abc').deserialize_data('abc', 'nickname'), 'Associated key not found')
+        missing = self.manager('gone', accept_init=False)
+        self.assertEqual(missing.deserialize_data('gone', '_id'), 'System Error while fetching')
+
+
+if __name__ == '__main__':
+    unittest.main()
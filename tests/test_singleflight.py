@@ -0,0 +1,57 @@
+"""Test cases for request coalescing"""
+import threading
+import time
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for SingleFlight.do, share and forget"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test callers arriving while a call runs get its result without running it again"""
+        flight = SingleFlight('test')
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {'hash_string': 'h'}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = [pool.submit(flight.do, 'uid', fetch) for _ in range(8)]
+            time.sleep(0.1)
+            release.set()
+            values = [result.result() for result in results]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(value == {'hash_string': 'h'} for value in values))
+
+    def test_errors_are_shared_and_not_kept(self):
+        """Test a failure reaches every waiter and the next call runs again"""
+        flight = SingleFlight('test')
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do('uid', fail)
+        self.assertEqual(flight.do('uid', lambda: 'ok'), 'ok')
+
+    def test_share_and_forget(self):
+        """Test futures are shared until done, and forget starts a fresh call"""
+        flight = SingleFlight('test')
+        pending = Future()
+        first = flight.share('key', lambda: pending)
+        self.assertIs(flight.share('key', lambda: self.fail("should be shared")), first)
+        flight.forget('key')
+        other = Future()
+        self.assertIsNot(flight.share('key', lambda: other), first)
+        pending.set_result(True)
+        self.assertTrue(first.result())
+
+
+if __name__ == '__main__':
+    unittest.main()
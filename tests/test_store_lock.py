@@ -0,0 +1,96 @@
+"""Test cases for the single-owner lock of local stores"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.dbm_engine import ShardStore, StoreLocked
+from src.log_store import LogStore
+
+
+class TestStoreLock(unittest.TestCase):
+    """Test cases for a second process opening a store that is in use"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def in_child(self, open_store):
+        """Run ``open_store`` in a forked child.
+
+        Returns:
+            str: 'locked' if it raised StoreLocked, 'opened' if it returned
+        """
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            outcome = b'failed'
+            try:
+                open_store()
+                outcome = b'opened'
+            except StoreLocked:
+                outcome = b'locked'
+            finally:
+                os.write(write_end, outcome)
+                os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end, 'rb') as pipe:
+            outcome = pipe.read().decode()
+        os.waitpid(pid, 0)
+        return outcome
+
+    def test_second_process_cannot_open_shards(self):
+        """Test a shard store in use fails fast in another process, and opens once it is closed"""
+        store = ShardStore(self.root, 1, sync_writes=False)
+        store.put('uid-a', {'_id': 'uid-a'})
+
+        def write_from_child():
+            child = ShardStore(self.root, 1, sync_writes=False)
+            child.put('uid-b', {'_id': 'uid-b'})
+            child.close()
+
+        self.assertEqual(self.in_child(write_from_child), 'locked')
+        self.assertEqual(list(store.uids()), ['uid-a'])
+        store.close()
+        self.assertEqual(self.in_child(write_from_child), 'opened')
+        store = ShardStore(self.root, 1, sync_writes=False)
+        self.assertEqual(sorted(store.uids()), ['uid-a', 'uid-b'])
+        store.close()
+
+    def test_forked_child_does_not_inherit_ownership(self):
+        """Test a child forked from the owner cannot write through the inherited store"""
+        store = ShardStore(self.root, 1, sync_writes=False)
+        store.put('uid-a', {'_id': 'uid-a'})
+
+        def write_inherited():
+            store._forget_handles()
+            store.put('uid-b', {'_id': 'uid-b'})
+
+        self.assertEqual(self.in_child(write_inherited), 'locked')
+        store.put('uid-c', {'_id': 'uid-c'})
+        store.close()
+
+    def test_second_process_cannot_open_log_store(self):
+        """Test a log store in use fails fast in another process instead of interleaving appends"""
+        store = LogStore(self.root, compact_interval=0)
+        store.put('uid-a', {'_id': 'uid-a'})
+
+        def write_from_child():
+            child = LogStore(self.root, compact_interval=0)
+            child.put('uid-b', {'_id': 'uid-b'})
+            child.close()
+
+        self.assertEqual(self.in_child(write_from_child), 'locked')
+        store.put('uid-c', {'_id': 'uid-c'})
+        store.close()
+        self.assertEqual(self.in_child(write_from_child), 'opened')
+        store = LogStore(self.root, compact_interval=0)
+        self.assertEqual(sorted(store.uids()), ['uid-a', 'uid-b', 'uid-c'])
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Test cases for the secured user string index"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.dbm_engine import ShardStore, UserDBManager
+from src.log_store import LogStore
+from src.sus_index import LocalSusIndex, rebuild, sus_digest
+from src.transfer import LocalBoxes
+from src.uid_filter import DISABLED
+
+
+class TestSusIndex(unittest.TestCase):
+    """Test cases for LocalSusIndex, its upkeep by the dbm manager and rebuild"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.boxes = ShardStore(os.path.join(self.root, 'boxes'), 4, sync_writes=False)
+        self.index = LocalSusIndex(ShardStore(os.path.join(self.root, 'sus_index'), 4, sync_writes=False))
+        self.log = LogStore(os.path.join(self.root, 'log'), compact_interval=0)
+
+        class Manager(UserDBManager):
+            store = self.boxes
+            uid_filter = DISABLED
+            sus_index = self.index
+        self.manager = Manager
+
+    def tearDown(self):
+        self.boxes.close()
+        self.index.store.close()
+        self.log.close()
+        shutil.rmtree(self.root)
+
+    def test_entries_hold_digest_not_string(self):
+        """Test entries are keyed by digest and removed ones no longer resolve"""
+        self.index.add('secret-sus', 'uid-1')
+        self.assertEqual(self.index.lookup('secret-sus'), 'uid-1')
+        self.assertEqual(list(self.index.store.uids()), [sus_digest('secret-sus')])
+        self.index.remove('secret-sus')
+        self.assertIsNone(self.index.lookup('secret-sus'))
+
+    def test_store_recover_close_keep_index_current(self):
+        """Test find_uid follows a box's secured string through store, recover and close"""
+        manager = self.manager()
+        uid = manager.store_user_string({'request_string': 'hello'})['id']
+        first = self.boxes.get(uid)['secured_user_string']
+        self.assertEqual(self.manager.find_uid(first), uid)
+
+        second = self.manager(uid).recover_account({'_id': uid, 'user_string': 'hello again'})['sus']
+        self.assertIsNone(self.manager.find_uid(first))
+        self.assertEqual(self.manager.find_uid(second), uid)
+        self.assertEqual(len(list(self.index.store.uids())), 1)
+
+        self.assertEqual(self.manager(uid).close_account({'uid': uid, 'sus': second}), 'Success')
+        self.assertIsNone(self.manager.find_uid(second))
+        self.assertEqual(list(self.index.store.uids()), [])
+
+    def test_stale_entry_is_not_trusted(self):
+        """Test an entry left behind by an interrupted write does not resolve"""
+        self.boxes.put('uid-1', {'_id': 'uid-1', 'secured_user_string': 'current'})
+        self.index.add('stale', 'uid-1')
+        self.assertIsNone(self.manager.find_uid('stale'))
+
+    def test_rebuild_indexes_existing_boxes(self):
+        """Test rebuild indexes boxes stored without an index and skips empty ones"""
+        for i in range(20):
+            self.log.put(f'uid-{i:02d}', {'_id': f'uid-{i:02d}', 'secured_user_string': f'sus-{i:02d}'})
+        self.log.put('uid-empty', {'_id': '', 'secured_user_string': ''})
+        stats = rebuild(LocalBoxes('log', self.log), self.index, concurrency=4)
+        self.assertEqual(stats, {'indexed': 20, 'skipped': 1})
+        self.assertEqual(self.index.lookup('sus-07'), 'uid-07')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Test cases for the local daemon and its client"""
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from src import susdb_daemon
+from src.susdb_daemon import DaemonError, DaemonMismatch, DaemonServer, DaemonUnavailable
+
+
+def echo(params):
+    return {'echo': params, 'thread': threading.current_thread().name}
+
+
+def fail(params):
+    raise ValueError("Initialization not accepted")
+
+
+class TestDaemon(unittest.TestCase):
+    """Test cases for DaemonServer, call and run"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'susdb.sock')
+        patcher = mock.patch.dict(susdb_daemon.OPERATIONS, {'echo': echo, 'fail': fail})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def start(self):
+        server = DaemonServer(self.path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.addCleanup(stop)
+        return server
+
+    def test_call_runs_operation_in_daemon(self):
+        """Test a request is answered by the daemon process over the socket"""
+        self.start()
+        result = susdb_daemon.call('echo', {'uid': 'abc'}, self.path)
+        self.assertEqual(result['echo'], {'uid': 'abc'})
+        self.assertNotEqual(result['thread'], threading.current_thread().name)
+        self.assertEqual(susdb_daemon.call('ping', {}, self.path)['requests'], 2)
+
+    def test_socket_is_owner_only(self):
+        """Test other users cannot connect to the socket"""
+        self.start()
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode) & 0o077, 0)
+
+    def test_errors_are_reported_to_the_client(self):
+        """Test failures and unknown operations raise DaemonError on the client"""
+        self.start()
+        with self.assertRaisesRegex(DaemonError, "ValueError: Initialization not accepted"):
+            susdb_daemon.call('fail', {}, self.path)
+        with self.assertRaisesRegex(DaemonError, "Unknown operation"):
+            susdb_daemon.call('nope', {}, self.path)
+
+    def test_run_falls_back_to_this_process(self):
+        """Test run executes locally when no daemon listens"""
+        with self.assertRaises(DaemonUnavailable):
+            susdb_daemon.call('echo', {}, self.path)
+        with mock.patch.object(susdb_daemon, 'socket_path', return_value=self.path):
+            result = susdb_daemon.run('echo', {'uid': 'abc'})
+        self.assertEqual(result['thread'], threading.current_thread().name)
+
+    def test_other_settings_run_in_this_process(self):
+        """Test a request with another bucket is refused unrun and run() falls back to this process"""
+        server = self.start()
+        other = dict(server.settings, bucket='someone-elses-bucket')
+        with self.assertRaisesRegex(DaemonMismatch, 'bucket'):
+            susdb_daemon.call('echo', {}, self.path, settings=other)
+        with self.assertRaises(DaemonMismatch):
+            susdb_daemon.call('echo', {}, self.path, settings={})
+        self.assertEqual(susdb_daemon.call('echo', {}, self.path)['echo'], {})
+        server.settings = other
+        with mock.patch.object(susdb_daemon, 'socket_path', return_value=self.path):
+            result = susdb_daemon.run('echo', {'uid': 'abc'})
+        self.assertEqual(result['thread'], threading.current_thread().name)
+
+    def test_stale_socket_is_replaced(self):
+        """Test a socket file left by a crashed daemon does not block a new one"""
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        self.start()
+        self.assertEqual(susdb_daemon.call('echo', {}, self.path)['echo'], {})
+        with self.assertRaises(RuntimeError):
+            DaemonServer(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
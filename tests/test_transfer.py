@@ -0,0 +1,163 @@
+"""Test cases for streaming export and import"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from botocore.exceptions import ClientError
+
+from src import user_db_manager
+from src.log_store import LogStore
+from src.record_format import decode_record
+from src.sus_index import KEY_PREFIX as SUS_INDEX_PREFIX, LocalSusIndex, sus_digest
+from src.transfer import BINARY_MAGIC, LocalBoxes, S3Boxes, TransferError, export_boxes, import_boxes
+
+
+def record(i):
+    return {'uid': f'uid-{i:03d}', 'hash': f'$argon2id$v=19$m=65536,t=3,p=4$salt{i}$hash{i}'}
+
+
+class PutOnlyS3:
+    """S3 client keeping the bodies of put_object calls"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, IfNoneMatch=None):
+        if IfNoneMatch == '*' and Key in self.objects:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        self.objects[Key] = Body
+        return {'ETag': f'"{len(self.objects)}"'}
+
+
+class FlakySource(LocalBoxes):
+    """Source whose reads start failing after a number of boxes"""
+
+    def __init__(self, store, fail_after):
+        super().__init__('log', store)
+        self.reads = 0
+        self.fail_after = fail_after
+
+    def read(self, uid):
+        self.reads += 1
+        if self.reads > self.fail_after:
+            raise OSError("source went away")
+        return super().read(uid)
+
+
+class TestTransfer(unittest.TestCase):
+    """Test cases for export_boxes and import_boxes"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.source = LogStore(os.path.join(self.root, 'source'), compact_interval=0)
+        self.destination = LogStore(os.path.join(self.root, 'destination'), compact_interval=0)
+        for i in range(50):
+            self.source.put(f'uid-{i:03d}', record(i))
+
+    def tearDown(self):
+        self.source.close()
+        self.destination.close()
+        shutil.rmtree(self.root)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def assert_copied(self):
+        self.assertEqual(sorted(self.destination.uids()), sorted(self.source.uids()))
+        for uid in self.source.uids():
+            self.assertEqual(self.destination.get(uid), self.source.get(uid))
+
+    def test_ndjson_round_trip(self):
+        """Test every box survives an NDJSON export and import"""
+        stats = export_boxes(LocalBoxes('log', self.source), self.path('boxes.ndjson'), concurrency=4)
+        self.assertEqual(stats['exported'], 50)
+        with open(self.path('boxes.ndjson')) as export_file:
+            first = json.loads(export_file.readline())
+        self.assertEqual(first, {'uid': 'uid-000', 'record': record(0)})
+        stats = import_boxes(LocalBoxes('log', self.destination), self.path('boxes.ndjson'), concurrency=4)
+        self.assertEqual((stats['imported'], stats['existing']), (50, 0))
+        self.assert_copied()
+
+    def test_binary_round_trip_keeps_existing_boxes(self):
+        """Test a binary export imports again, without replacing boxes unless asked"""
+        export_boxes(LocalBoxes('log', self.source), self.path('boxes.bin'), fmt='binary')
+        with open(self.path('boxes.bin'), 'rb') as export_file:
+            self.assertEqual(export_file.read(len(BINARY_MAGIC)), BINARY_MAGIC)
+        self.destination.put('uid-007', {'uid': 'uid-007', 'hash': 'kept'})
+        stats = import_boxes(LocalBoxes('log', self.destination), self.path('boxes.bin'))
+        self.assertEqual((stats['imported'], stats['existing']), (49, 1))
+        self.assertEqual(self.destination.get('uid-007')['hash'], 'kept')
+        import_boxes(LocalBoxes('log', self.destination), self.path('boxes.bin'), overwrite=True)
+        self.assert_copied()
+
+    def test_export_resumes_from_checkpoint(self):
+        """Test an interrupted export continues after the last checkpointed box without duplicates"""
+        output, checkpoint = self.path('boxes.ndjson'), self.path('boxes.checkpoint')
+        with self.assertRaises(OSError):
+            export_boxes(FlakySource(self.source, 20), output, concurrency=1,
+                         checkpoint=checkpoint, checkpoint_every=5)
+        with open(checkpoint) as checkpoint_file:
+            self.assertLess(json.load(checkpoint_file)['exported'], 50)
+        stats = export_boxes(LocalBoxes('log', self.source), output, checkpoint=checkpoint, resume=True)
+        self.assertEqual(stats['exported'], 50)
+        with open(output) as export_file:
+            uids = [json.loads(line)['uid'] for line in export_file]
+        self.assertEqual(uids, sorted(self.source.uids()))
+
+    def test_import_rejects_checkpoint_of_other_input(self):
+        """Test resuming with a checkpoint written for another file fails"""
+        export_boxes(LocalBoxes('log', self.source), self.path('a.ndjson'))
+        export_boxes(LocalBoxes('log', self.source), self.path('b.ndjson'))
+        checkpoint = self.path('import.checkpoint')
+        import_boxes(LocalBoxes('log', self.destination), self.path('a.ndjson'), checkpoint=checkpoint)
+        with self.assertRaises(TransferError):
+            import_boxes(LocalBoxes('log', self.destination), self.path('b.ndjson'),
+                         checkpoint=checkpoint, resume=True)
+
+    def test_truncated_binary_export_is_reported(self):
+        """Test a cut-off binary export raises TransferError"""
+        export_boxes(LocalBoxes('log', self.source), self.path('boxes.bin'), fmt='binary')
+        with open(self.path('boxes.bin'), 'r+b') as export_file:
+            export_file.truncate(os.path.getsize(self.path('boxes.bin')) - 3)
+        with self.assertRaises(TransferError):
+            import_boxes(LocalBoxes('log', self.destination), self.path('boxes.bin'))
+
+
+class TestImportUpkeep(unittest.TestCase):
+    """Test cases for imports keeping the index and caches of the destination current"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        # Registered first so it runs after the stores opened by a test are closed
+        self.addCleanup(shutil.rmtree, self.root)
+        self.export = os.path.join(self.root, 'boxes.ndjson')
+        with open(self.export, 'w') as export_file:
+            for i in range(5):
+                box = {'_id': f'uid-{i}', 'hash_string': f'hash-{i}', 'secured_user_string': f'sus-{i}'}
+                export_file.write(json.dumps({'uid': f'uid-{i}', 'record': box}) + '\n')
+
+    def test_local_import_indexes_boxes(self):
+        """Test imported boxes can be found by their secured user string"""
+        boxes = LogStore(os.path.join(self.root, 'boxes'), compact_interval=0)
+        index_store = LogStore(os.path.join(self.root, 'sus_index'), compact_interval=0)
+        self.addCleanup(boxes.close)
+        self.addCleanup(index_store.close)
+        index = LocalSusIndex(index_store)
+        import_boxes(LocalBoxes('log', boxes, sus_index=index), self.export)
+        self.assertEqual(index.lookup('sus-3'), 'uid-3')
+
+    def test_s3_import_indexes_and_replaces_cached_boxes(self):
+        """Test an overwriting S3 import indexes each box and drops the cached copy it replaced"""
+        client = PutOnlyS3()
+        user_db_manager.record_cache.put('user_db_uid-2', {'_id': 'uid-2', 'hash_string': 'old'}, '"old"')
+        self.addCleanup(user_db_manager.record_cache.clear)
+        import_boxes(S3Boxes('bucket', client), self.export, overwrite=True)
+        self.assertEqual(decode_record(client.objects['user_db_uid-2'])['hash_string'], 'hash-2')
+        self.assertEqual(client.objects[SUS_INDEX_PREFIX + sus_digest('sus-2')], b'uid-2')
+        self.assertIsNone(user_db_manager.record_cache.get('user_db_uid-2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
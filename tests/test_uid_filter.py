@@ -0,0 +1,62 @@
+"""Test cases for the uid Bloom filter"""
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+
+from src.uid_filter import UidFilter, filter_size
+
+
+class TestUidFilter(unittest.TestCase):
+    """Test cases for UidFilter"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'uid_filter_test.bloom')
+        self.known = [str(uuid.uuid4()) for _ in range(2000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make(self, source=None):
+        return UidFilter('test', self.path, source or (lambda: iter(self.known)), capacity=10000, error_rate=0.01)
+
+    def test_unbuilt_filter_reports_every_key(self):
+        """Test nothing is rejected before the first build"""
+        uid_filter = self.make(source=lambda: iter(()))
+        uid_filter._next_attempt = float('inf')
+        self.assertFalse(uid_filter.ready)
+        self.assertTrue(uid_filter.might_contain('never-stored'))
+
+    def test_build_has_no_false_negatives(self):
+        """Test every streamed key is found and most unknown keys are rejected"""
+        uid_filter = self.make()
+        self.assertTrue(uid_filter.build())
+        self.assertTrue(all(uid_filter.might_contain(uid) for uid in self.known))
+        unknown = [str(uuid.uuid4()) for _ in range(2000)]
+        false_positives = sum(uid_filter.might_contain(uid) for uid in unknown)
+        self.assertLess(false_positives, 60)
+
+    def test_added_keys_and_snapshot_survive_reopen(self):
+        """Test a reopened snapshot is ready and keeps keys added after the build"""
+        uid_filter = self.make()
+        uid_filter.build()
+        added = str(uuid.uuid4())
+        uid_filter.add(added)
+        uid_filter.flush()
+        reopened = self.make(source=lambda: self.fail("snapshot should not be rebuilt"))
+        self.assertTrue(reopened.ready)
+        self.assertTrue(reopened.might_contain(added))
+        self.assertTrue(reopened.might_contain(self.known[0]))
+
+    def test_changed_size_discards_snapshot(self):
+        """Test a snapshot made for another capacity is not reused"""
+        self.make().build()
+        resized = UidFilter('test', self.path, lambda: iter(()), capacity=500, error_rate=0.01)
+        self.assertEqual(resized.bits, filter_size(500, 0.01)[0])
+        self.assertFalse(resized.ready)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+"""Test cases for the gunicorn configuration and pre-fork warm-up"""
+import os
+import runpy
+import unittest
+from unittest import mock
+
+from src import s3_client
+
+CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'gunicorn.conf.py')
+
+
+class TestWebServer(unittest.TestCase):
+    """Test cases for gunicorn.conf.py and S3 clients built before a fork"""
+
+    def test_config_preloads_threaded_workers(self):
+        """Test the app is preloaded into threaded workers hashing on their request threads"""
+        with mock.patch.dict(os.environ, clear=False):
+            os.environ.pop('HASH_EXECUTOR', None)
+            os.environ.pop('METRICS_DIR', None)
+            conf = runpy.run_path(CONF)
+            self.assertEqual(os.environ['HASH_EXECUTOR'], 'inline')
+            self.assertTrue(os.environ['METRICS_DIR'])
+        self.assertTrue(conf['preload_app'])
+        self.assertEqual(conf['worker_class'], 'gthread')
+        self.assertGreaterEqual(conf['workers'], 1)
+        self.assertTrue(callable(conf['when_ready']))
+        self.assertTrue(callable(conf['post_fork']))
+        self.assertTrue(callable(conf['on_exit']))
+
+    def test_client_built_before_fork_is_rebuilt(self):
+        """Test a forked child builds its own S3 client and the parent keeps its own"""
+        client = s3_client.get_s3_client('us-east-1', 'http://127.0.0.1:9')
+        pid = os.fork()
+        if pid == 0:
+            rebuilt = s3_client.get_s3_client('us-east-1', 'http://127.0.0.1:9') is not client
+            os._exit(0 if rebuilt else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(s3_client.get_s3_client('us-east-1', 'http://127.0.0.1:9'), client)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,9 +23,9 @@ cat << "EOF"
   \/_/      \/_/ \/_____/ \/_____/ \/_____/ \/_____/ \/_____/      \/_/   \/_____/    \/_____/ \/_____/ \/_____/ \/____/  \/_/ /_/
 EOF
 
-# Start the Flask server
+# Start the Flask app under gunicorn, configured by src/gunicorn.conf.py
 echo "Starting SusDB server..."
-python3 src/main.py &
+(cd src && exec gunicorn main:app) &
 
 # Wait for the server to start
 sleep 2
@@ -37,7 +37,9 @@ SusDB server is now running on http://host-ip:8000
 
 Available endpoints:
   POST /store    - Store a user string
+  POST /store/batch - Store a list of user strings
   POST /verify   - Verify user credentials
+  POST /verify/batch - Verify a list of uid/string pairs
   POST /view     - View user database
   POST /retrieve - Retrieve user data
   POST /close    - Close user account